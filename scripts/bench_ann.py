@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Recall and latency of the gateway IVF index against exact search.
+
+Loads the vectors into a scratch VectorStore (memmap files in a temp dir),
+builds the IVF index and, for a range of nprobe values, reports recall@k
+against exact cosine search plus p50/p99 query latency of both.
+
+Usage:
+  python scripts/bench_ann.py                           # synthetic, seeded
+  python scripts/bench_ann.py --vectors sample.npy      # recorded (n, dim) float32 matrix
+  python scripts/bench_ann.py --n 2000000 --dim 512 --nprobe 4,8,16,32,64
+"""
+import argparse, os, sys, tempfile, time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "gateway"))
+from vector_store import VectorStore  # noqa: E402
+from ann import IVFIndex  # noqa: E402
+
+def synthetic(n, dim, seed):
+    # Clustered vectors: log embeddings crowd around templates
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, n // 200), dim)).astype(np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for s in range(0, n, 100000):
+        e = min(s + 100000, n)
+        out[s:e] = centers[rng.integers(0, len(centers), e - s)] + 0.5 * rng.standard_normal((e - s, dim)).astype(np.float32)
+    return out
+
+def pct(samples, p):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p))]
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--vectors", help="recorded .npy matrix of embeddings")
+    ap.add_argument("--n", type=int, default=500000)
+    ap.add_argument("--dim", type=int, default=512)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--nlist", type=int)
+    ap.add_argument("--nprobe", default="4,8,16,32,64")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    base = np.load(args.vectors, mmap_mode="r") if args.vectors else synthetic(args.n, args.dim, args.seed)
+    n = len(base)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(tmp, "bench", conn_factory=None)
+        t = time.perf_counter()
+        for s in range(0, n, 100000):
+            e = min(s + 100000, n)
+            store.add(np.arange(s, e), np.asarray(base[s:e], dtype=np.float32), np.zeros(e - s))
+        print(f"{n} vectors x {store.dim} dims loaded in {time.perf_counter() - t:.1f}s")
+
+        index = IVFIndex(store, nlist=args.nlist, min_rows=1)
+        t = time.perf_counter()
+        index.build()
+        print(f"IVF build: {len(index.built.centroids)} cells in {time.perf_counter() - t:.1f}s")
+
+        rng = np.random.default_rng(args.seed + 1)
+        qidx = rng.choice(n, size=min(args.queries, n), replace=False)
+        # Queries are perturbed copies of stored vectors so the true neighbours are well defined
+        queries = np.asarray(base[np.sort(qidx)], dtype=np.float32)
+        queries += 0.1 * np.linalg.norm(queries, axis=1, keepdims=True) / np.sqrt(store.dim) \
+            * rng.standard_normal(queries.shape).astype(np.float32)
+
+        exact, lat = [], []
+        for q in queries:
+            t = time.perf_counter()
+            exact.append({e for e, _ in store.search(q, args.k)})
+            lat.append((time.perf_counter() - t) * 1000)
+        print(f"\n{'search':<14}{'recall@' + str(args.k):>10}{'p50 ms':>9}{'p99 ms':>9}{'candidates':>12}")
+        print(f"{'exact':<14}{1.0:>10.4f}{pct(lat, 0.5):>9.2f}{pct(lat, 0.99):>9.2f}{n:>12}")
+        for nprobe in (int(x) for x in args.nprobe.split(",")):
+            lat, recall = [], []
+            before = index.counters["candidates"]
+            for q, truth in zip(queries, exact):
+                t = time.perf_counter()
+                got = {e for e, _ in index.search(q, args.k, nprobe=nprobe)}
+                lat.append((time.perf_counter() - t) * 1000)
+                recall.append(len(got & truth) / max(len(truth), 1))
+            cand = (index.counters["candidates"] - before) / len(queries)
+            print(f"{'ivf nprobe=' + str(nprobe):<14}{np.mean(recall):>10.4f}{pct(lat, 0.5):>9.2f}{pct(lat, 0.99):>9.2f}{cand:>12.0f}")
+
+if __name__ == "__main__":
+    main()
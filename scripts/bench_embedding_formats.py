@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Storage and recall of the vecfmt embedding encodings.
+
+For every format it reports the encoded size per vector, the payload per
+million events and recall@k of exact cosine search over the decoded vectors
+against float32 on a fixed query set.
+
+Usage:
+  python scripts/bench_embedding_formats.py                      # synthetic, seeded
+  python scripts/bench_embedding_formats.py --vectors sample.npy # recorded (n, dim) float32 matrix
+"""
+import argparse, os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "ingestion"))
+import vecfmt  # noqa: E402
+
+def synthetic(n, dim, seed):
+    # Clustered unit vectors: log embeddings crowd around a few hundred templates
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, n // 50), dim)).astype(np.float32)
+    x = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    return x
+
+def normalize(x):
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+def topk(base, queries, k):
+    scores = queries @ base.T
+    idx = np.argpartition(-scores, k, axis=1)[:, :k]
+    return idx
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--vectors", help="recorded .npy matrix of embeddings")
+    ap.add_argument("--n", type=int, default=20000)
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    base = np.load(args.vectors).astype(np.float32) if args.vectors else synthetic(args.n, args.dim, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    qidx = rng.choice(len(base), size=min(args.queries, len(base)), replace=False)
+    # Queries are perturbed copies of stored vectors so the true neighbours are well defined
+    queries = normalize(base[qidx] + 0.1 * rng.standard_normal(base[qidx].shape).astype(np.float32))
+    truth = topk(normalize(base), queries, args.k)
+
+    print(f"{len(base)} vectors x {base.shape[1]} dims, {len(queries)} queries, recall@{args.k}")
+    print(f"{'format':<16}{'bytes/vec':>10}{'MB/1M events':>14}{'recall':>9}{'max abs err':>13}")
+    legacy = base[0].astype(np.float32).tobytes()
+    print(f"{'legacy-float32':<16}{len(legacy):>10}{len(legacy) * 1e6 / 2**20:>14.0f}{1.0:>9.4f}{0.0:>13.2e}")
+    for fmt in vecfmt.FORMATS:
+        blobs = [vecfmt.encode(v, fmt) for v in base]
+        decoded = vecfmt.decode_many(blobs)
+        got = topk(normalize(decoded), queries, args.k)
+        recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(got, truth)])
+        size = len(blobs[0])
+        err = float(np.abs(decoded - base).max())
+        print(f"{fmt:<16}{size:>10}{size * 1e6 / 2**20:>14.0f}{recall:>9.4f}{err:>13.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Event-loop responsiveness of the gateway under parallel dashboard requests.
+
+Runs N concurrent /api/dashboard/overview handler bodies (workspaces, recent
+incidents, MTTR stats) on one event loop, twice: calling the blocking TiDB
+methods inline, as the handlers used to, and awaiting them through AsyncTiDB.
+A probe task that wakes every 10 ms stands in for the /ws hub and for other
+in-flight requests; how late it wakes is the event-loop lag they would see.
+
+Usage (TIDB_* as for the gateway):
+  python scripts/bench_gateway_async.py --requests 200
+"""
+import argparse, asyncio, os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "gateway"))
+from tidb import TiDB  # noqa: E402
+from async_db import AsyncTiDB  # noqa: E402
+
+TICK = 0.01
+
+def pct(samples, p):
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(len(s) * p))] if s else 0.0
+
+async def probe(lags, stop):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - t - TICK) * 1000)
+
+async def blocking(db):
+    db.get_workspaces()
+    db.get_recent_incidents(None, 5)
+    db.get_mttr_stats()
+
+async def awaited(adb):
+    await asyncio.gather(adb.get_workspaces(), adb.get_recent_incidents(None, 5), adb.get_mttr_stats())
+
+async def run(handler, requests):
+    lags, latencies, stop = [], [], asyncio.Event()
+    monitor = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)
+
+    async def one():
+        t = time.perf_counter()
+        await handler()
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - t0
+    stop.set()
+    await monitor
+    return wall, latencies, lags
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--workers", type=int, help="executor threads (default: pool max size minus 3 reserved)")
+    args = ap.parse_args()
+
+    db = TiDB()
+    db.pool.warm()
+    adb = AsyncTiDB(db, args.workers)
+    await awaited(adb)  # connections open and TiDB plan cache warm for both runs
+
+    print(f"{args.requests} parallel dashboard requests, pool max {db.pool.max_size}, {adb.max_workers} executor threads")
+    print(f"{'mode':<10}{'wall s':>8}{'req p50':>9}{'req p99':>9}{'lag p50':>9}{'lag p99':>9}{'lag max':>9}  (ms)")
+    for name, handler in (("blocking", lambda: blocking(db)), ("async", lambda: awaited(adb))):
+        wall, lat, lags = await run(handler, args.requests)
+        print(f"{name:<10}{wall:>8.2f}{pct(lat, 0.5):>9.1f}{pct(lat, 0.99):>9.1f}"
+              f"{pct(lags, 0.5):>9.1f}{pct(lags, 0.99):>9.1f}{max(lags, default=0):>9.1f}")
+    print(f"\nexecutor: {adb.stats()}\npool: {db.pool.stats()}")
+    adb.close()
+    db.pool.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
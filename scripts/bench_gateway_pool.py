@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Gateway TiDB access with and without the connection pool.
+
+Replays the queries behind one /api/dashboard/overview load (workspaces,
+recent incidents, MTTR stats) from concurrent threads, first with a new TLS
+connection per call as the gateway used to, then through the shared pool,
+and reports request latency p50/p99, requests/s and connections opened/s.
+
+Usage (TIDB_* as for the gateway):
+  python scripts/bench_gateway_pool.py --requests 500 --concurrency 16
+"""
+import argparse, os, sys, time, threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "gateway"))
+from tidb import TiDB  # noqa: E402
+from dbpool import Pool  # noqa: E402
+import pymysql  # noqa: E402
+
+def dashboard(db):
+    db.get_workspaces()
+    db.get_recent_incidents(None, 5)
+    db.get_mttr_stats()
+
+def run(db, requests, concurrency):
+    lat, lock = [], threading.Lock()
+    todo = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                if next(todo, None) is None:
+                    return
+            t = time.perf_counter()
+            dashboard(db)
+            with lock:
+                lat.append((time.perf_counter() - t) * 1000)
+
+    created0 = db.pool.counters["created"]
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - t0
+    lat.sort()
+    return {"p50": lat[len(lat) // 2], "p99": lat[min(len(lat) - 1, int(len(lat) * 0.99))],
+            "rps": len(lat) / wall, "conns_per_s": (db.pool.counters["created"] - created0) / wall}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--pool-max", type=int, default=10)
+    args = ap.parse_args()
+
+    unpooled = TiDB()
+    # max_lifetime=0 closes every connection on check-in: one handshake per call, like pymysql.connect
+    unpooled.pool = Pool(lambda: pymysql.connect(**unpooled.conn_args), min_size=0,
+                         max_size=args.requests * 3, max_lifetime=0)
+    pooled = TiDB()
+    pooled.pool = Pool(lambda: pymysql.connect(**pooled.conn_args), min_size=2, max_size=args.pool_max)
+    pooled.pool.warm()
+    dashboard(pooled)  # warm caches on the TiDB side for both runs
+
+    print(f"{args.requests} dashboard loads (3 queries each), {args.concurrency} threads")
+    print(f"{'mode':<12}{'p50 ms':>9}{'p99 ms':>9}{'req/s':>9}{'conns/s':>10}")
+    for name, db in (("connect", unpooled), ("pool", pooled)):
+        r = run(db, args.requests, args.concurrency)
+        print(f"{name:<12}{r['p50']:>9.1f}{r['p99']:>9.1f}{r['rps']:>9.1f}{r['conns_per_s']:>10.1f}")
+    print(f"\npool: {pooled.pool.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Ingestion throughput: single-record /ingest vs /ingest/batch.
+
+Usage:
+  python scripts/bench_ingest.py --url http://localhost:8000 --records 5000 --batch 500
+"""
+import argparse, asyncio, json, time, random
+import httpx
+
+PODS = [f"oom-demo-7d9f8c6b5-{random.choice('abcdefghjk')}{i:03d}" for i in range(20)]
+
+def make_record(i):
+    return {
+        "cluster": "bench",
+        "kubernetes": {"namespace_name": "demo", "pod_name": random.choice(PODS), "labels": {"app": "oom-demo"}},
+        "level": random.choice(["info", "info", "info", "warn", "error"]),
+        "log": f"request {i} handled in {random.randint(1, 900)}ms status={random.choice([200, 200, 500])}",
+    }
+
+async def bench_single(http, url, records, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    async def post(rec):
+        async with sem:
+            r = await http.post(f"{url}/ingest", json=rec)
+            r.raise_for_status()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(post(r) for r in records))
+    return time.perf_counter() - t0
+
+async def bench_batch(http, url, records, batch, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    async def post(chunk):
+        async with sem:
+            body = "\n".join(json.dumps(r) for r in chunk)
+            r = await http.post(f"{url}/ingest/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+            r.raise_for_status()
+    chunks = [records[i:i + batch] for i in range(0, len(records), batch)]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(post(c) for c in chunks))
+    return time.perf_counter() - t0
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--records", type=int, default=2000)
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--skip-single", action="store_true", help="only run the batch path")
+    args = ap.parse_args()
+
+    records = [make_record(i) for i in range(args.records)]
+    async with httpx.AsyncClient(timeout=300) as http:
+        results = {}
+        if not args.skip_single:
+            results["single"] = await bench_single(http, args.url, records, args.concurrency)
+        results[f"batch({args.batch})"] = await bench_batch(http, args.url, records, args.batch, args.concurrency)
+
+    print(f"{'mode':<14}{'seconds':>10}{'records/s':>12}")
+    for mode, secs in results.items():
+        print(f"{mode:<14}{secs:>10.2f}{args.records / secs:>12.0f}")
+    if "single" in results:
+        print(f"speedup: {results['single'] / results[f'batch({args.batch})']:.1f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
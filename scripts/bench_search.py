@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""LIKE scan vs the search_postings index on a seeded raw_events table.
+
+Seeds synthetic log lines (cluster 'bench-search', spread over 14 days) with
+their postings, then times the old `body_text LIKE '%q%' ORDER BY ts DESC`
+query and search_index.search() for the same query set, reporting p50/p99.
+
+Usage (TIDB_* as for the services; use a scratch database):
+  python scripts/bench_search.py --rows 1000000
+  python scripts/bench_search.py --rows 10000000 --skip-seed   # reuse seeded rows
+  python scripts/bench_search.py --cleanup
+"""
+import argparse, os, random, sys, time, datetime as dt
+import pymysql
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "gateway"))
+import search_index  # noqa: E402
+from textindex import postings  # noqa: E402
+
+CLUSTER = "bench-search"
+TEMPLATES = [
+    "GET /api/v1/{noun}/{n} 200 took {ms}ms user={user}",
+    "POST /api/v1/{noun} 500 internal error: connection refused to {svc}:5432",
+    "Back-off restarting failed container {svc} in pod {svc}-{hash}",
+    "OOMKilled: container {svc} exceeded memory limit {n}Mi",
+    "readiness probe failed: HTTP probe failed with statuscode: 503",
+    "upstream request timeout after {ms}ms calling {svc}",
+    "payment {n} declined: insufficient funds for user={user}",
+    "cache miss for key {noun}:{n}, loading from {svc}",
+    "TLS handshake error from 10.0.{n}.{m}:443: EOF",
+    "worker {m} processed {n} {noun} in {ms}ms",
+]
+WORDS = dict(noun=["orders", "items", "carts", "users", "invoices", "sessions"],
+             svc=["postgres", "redis", "checkout", "payments", "catalog", "frontend", "kafka"],
+             user=["alice", "bob", "carol", "dave", "erin", "frank"])
+QUERIES = ["connection refused", "oomkilled", '"probe failed"', "payments declined", "timeout checkout",
+           "kafka", "invoices 500", "redis cache miss", "handshake", "post* internal"]
+
+def line(rng):
+    t = rng.choice(TEMPLATES)
+    return t.format(noun=rng.choice(WORDS["noun"]), svc=rng.choice(WORDS["svc"]), user=rng.choice(WORDS["user"]),
+                    n=rng.randint(1, 99999), m=rng.randint(0, 255), ms=rng.randint(1, 5000),
+                    hash=f"{rng.getrandbits(40):010x}"[:10])
+
+def seed(c, rows, chunk, rng):
+    now = dt.datetime.utcnow()
+    t0 = time.monotonic()
+    for start in range(0, rows, chunk):
+        n = min(chunk, rows - start)
+        events = [(CLUSTER, rng.choice(["shop", "payments", "infra"]), rng.choice(WORDS["svc"]), "log",
+                   rng.choice(["info", "info", "info", "warn", "error"]),
+                   now - dt.timedelta(seconds=rng.uniform(0, 14 * 86400)), line(rng)) for _ in range(n)]
+        with c.cursor() as cur:
+            cur.execute("INSERT INTO raw_events(cluster, namespace, app, type, level, ts, body_text) VALUES "
+                        + ",".join(["(%s,%s,%s,%s,%s,%s,%s)"] * n), [v for e in events for v in e])
+            ids = [cur.lastrowid + i for i in range(n)]
+            ts_of = dict(zip(ids, (e[5] for e in events)))
+            posts, df = postings(zip(ids, (e[6] for e in events)))
+            for s in range(0, len(posts), 2000):
+                part = posts[s:s + 2000]
+                cur.execute("INSERT IGNORE INTO search_postings(term, event_id, tf, ts) VALUES "
+                            + ",".join(["(%s,%s,%s,%s)"] * len(part)), [v for p in part for v in (*p, ts_of[p[1]])])
+            terms = sorted(df)
+            cur.execute("INSERT INTO search_terms(term, df) VALUES " + ",".join(["(%s,%s)"] * len(terms))
+                        + " ON DUPLICATE KEY UPDATE df=df+VALUES(df)", [v for t in terms for v in (t, df[t])])
+        c.commit()
+        done = start + n
+        if done % (chunk * 50) == 0 or done == rows:
+            print(f"  seeded {done} rows ({done / (time.monotonic() - t0):.0f} rows/s)")
+
+def cleanup(c):
+    with c.cursor() as cur:
+        while True:
+            cur.execute("SELECT id FROM raw_events WHERE cluster=%s LIMIT 5000", (CLUSTER,))
+            ids = [r['id'] for r in cur.fetchall()]
+            if not ids:
+                break
+            ph = ",".join(["%s"] * len(ids))
+            cur.execute(f"DELETE FROM search_postings WHERE event_id IN ({ph})", ids)
+            cur.execute(f"DELETE FROM raw_events WHERE id IN ({ph})", ids)
+            c.commit()
+    print("Removed seeded rows (search_terms frequencies are left as they are)")
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--chunk", type=int, default=1000)
+    ap.add_argument("--k", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--skip-seed", action="store_true")
+    ap.add_argument("--cleanup", action="store_true")
+    args = ap.parse_args()
+
+    c = pymysql.connect(host=os.environ['TIDB_HOST'], port=int(os.environ.get('TIDB_PORT', 4000)),
+                        user=os.environ['TIDB_USER'], password=os.environ['TIDB_PASSWORD'],
+                        database=os.environ.get('TIDB_DB', 'incidentdb'),
+                        cursorclass=pymysql.cursors.DictCursor, ssl={'ssl': {}})
+    if args.cleanup:
+        return cleanup(c)
+    if not args.skip_seed:
+        seed(c, args.rows, args.chunk, random.Random(7))
+    with c.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM raw_events")
+        total = cur.fetchone()['n']
+    print(f"raw_events: {total} rows, k={args.k}, {args.repeat} runs per query")
+    print(f"{'query':<24}{'like p50':>10}{'like p99':>10}{'index p50':>11}{'index p99':>11}{'hits':>6}")
+    with c.cursor() as cur:
+        for q in QUERIES:
+            like = q.strip('"').rstrip("*")
+            lp50, lp99 = timed(lambda: (cur.execute(
+                "SELECT id, cluster, namespace, app, pod, level, ts, LEFT(body_text, 300) AS snippet FROM raw_events "
+                "WHERE body_text LIKE %s ORDER BY ts DESC LIMIT %s", (f"%{like}%", args.k)), cur.fetchall()), args.repeat)
+            hits = search_index.search(cur, q, args.k)
+            ip50, ip99 = timed(lambda: search_index.search(cur, q, args.k), args.repeat)
+            print(f"{q:<24}{lp50:>9.1f}ms{lp99:>9.1f}ms{ip50:>10.1f}ms{ip99:>10.1f}ms{len(hits or []):>6}")
+
+if __name__ == "__main__":
+    main()
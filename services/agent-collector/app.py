@@ -4,6 +4,7 @@ from fastapi import FastAPI
 from kubernetes import client, config
 import pymysql
 import logging
+from health_state import HealthState
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -44,32 +45,29 @@ def get_workspace():
     """Get workspace from environment or default to 'TiM8-Local'"""
     return os.environ.get('WORKSPACE', 'TiM8-Local')
 
-def insert_cluster_health(cluster_name, workspace, component, component_type, status, details):
-    """Insert or update cluster health data"""
+health = HealthState(ttl=float(os.environ.get('HEALTH_STATE_TTL_SECONDS', 300)))
+
+def write_cluster_health(cluster_name, workspace, components):
+    """Write one cycle's [(component, component_type, status, details)]; only changed components are upserted,
+    unchanged ones get a last_check heartbeat. The checks are partial, so nothing is deleted."""
+    if not components:
+        return
     try:
         with pymysql.connect(**conn_args) as conn:
             with conn.cursor() as cursor:
-                # Delete old entry for this component
-                cursor.execute(
-                    "DELETE FROM cluster_health WHERE cluster_name=%s AND component=%s", 
-                    (cluster_name, component)
-                )
-                # Insert new health data
-                cursor.execute(
-                    """INSERT INTO cluster_health(cluster_name, workspace, component, component_type, status, details) 
-                       VALUES(%s, %s, %s, %s, %s, %s)""",
-                    (cluster_name, workspace, component, component_type, status, json.dumps(details))
-                )
-                conn.commit()
-                logger.info(f"Updated health for {component}: {status}")
+                try:
+                    counts = health.write(cursor, cluster_name, workspace, components, complete=False)
+                    conn.commit()
+                except Exception:
+                    health.forget(cluster_name, workspace)
+                    raise
+                logger.info(f"Updated health for {len(components)} components: {counts}")
     except Exception as e:
-        logger.error(f"Failed to insert cluster health: {e}")
+        logger.error(f"Failed to write cluster health: {e}")
 
 def check_pods_health():
-    """Check health of all pods in cluster"""
-    cluster_name = get_cluster_name()
-    workspace = get_workspace()
-    
+    """Health of each namespace from its pods"""
+    components = []
     try:
         # Get all pods
         pods = v1.list_pod_for_all_namespaces()
@@ -103,16 +101,15 @@ def check_pods_health():
                 'pods_ready': stats['ready'],
                 'pods_failed': stats['failed']
             }
-            insert_cluster_health(cluster_name, workspace, ns, 'namespace', status, details)
+            components.append((ns, 'namespace', status, details))
             
     except Exception as e:
         logger.error(f"Failed to check pods health: {e}")
+    return components
 
 def check_deployments_health():
-    """Check health of deployments"""
-    cluster_name = get_cluster_name()
-    workspace = get_workspace()
-    
+    """Health of each deployment"""
+    components = []
     try:
         deployments = apps_v1.list_deployment_for_all_namespaces()
         
@@ -129,16 +126,14 @@ def check_deployments_health():
                 'namespace': namespace
             }
             
-            insert_cluster_health(cluster_name, workspace, name, 'deployment', status, details)
+            components.append((name, 'deployment', status, details))
             
     except Exception as e:
         logger.error(f"Failed to check deployments health: {e}")
+    return components
 
 def check_nodes_health():
-    """Check health of cluster nodes"""
-    cluster_name = get_cluster_name()
-    workspace = get_workspace()
-    
+    """Health of the cluster nodes as one component"""
     try:
         nodes = v1.list_node()
         total_nodes = len(nodes.items)
@@ -161,10 +156,11 @@ def check_nodes_health():
             'nodes_ready': ready_nodes
         }
         
-        insert_cluster_health(cluster_name, workspace, 'cluster-nodes', 'node', status, details)
+        return [('cluster-nodes', 'node', status, details)]
         
     except Exception as e:
         logger.error(f"Failed to check nodes health: {e}")
+        return []
 
 async def health_check_loop():
     """Main health check loop"""
@@ -173,9 +169,8 @@ async def health_check_loop():
     while True:
         try:
             logger.info("Running health checks...")
-            check_pods_health()
-            check_deployments_health()  
-            check_nodes_health()
+            components = check_pods_health() + check_deployments_health() + check_nodes_health()
+            write_cluster_health(get_cluster_name(), get_workspace(), components)
             logger.info("Health checks completed")
             
             # Wait 30 seconds before next check
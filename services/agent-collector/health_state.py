@@ -0,0 +1,118 @@
+"""Diff-based writes to cluster_health, plus its history.
+
+A health report usually repeats the last one. Each row stores `state_hash`,
+a digest of its (component_type, status, details), and this module keeps the
+last-known hash and status of every component in memory. A report then costs:
+
+- one batched upsert of the components that are new or whose state changed,
+- one UPDATE moving last_check forward for all the unchanged ones,
+- with a complete snapshot, one DELETE of the components that disappeared,
+- one append to health_transitions, only if some component's status changed,
+- one upsert adding the report's status counts per component_type to the
+  current minute and hour of health_rollups.
+
+The cache is reloaded from the table (one SELECT) once it is older than
+`ttl`, or after a failed write, so a report from another writer in between
+is overwritten at most `ttl` late instead of being missed for good.
+
+Shared verbatim by the gateway and agent-collector.
+"""
+import json, time, hashlib, threading
+
+UPSERT_CHUNK = 500
+STATUSES = ("healthy", "warning", "critical", "unknown")
+ROLLUP_RESOLUTIONS = (60, 3600)  # seconds per health_rollups bucket
+
+def state_hash(component_type, status, details) -> str:
+    raw = json.dumps([component_type, status, details], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+class HealthState:
+    def __init__(self, ttl=300, history=True):
+        self.ttl = ttl
+        self.history = history
+        self.known = {}  # (cluster, workspace) -> (loaded_at, {component: (state_hash, status, component_type)})
+        self.lock = threading.Lock()
+        self.counters = {"reports": 0, "changed": 0, "heartbeats": 0, "removed": 0, "transitions": 0, "reloads": 0}
+
+    def _load(self, cur, cluster, workspace):
+        with self.lock:
+            hit = self.known.get((cluster, workspace))
+        if hit and time.monotonic() - hit[0] < self.ttl:
+            return hit[0], dict(hit[1])
+        loaded_at = time.monotonic()
+        cur.execute("SELECT component, state_hash, status, component_type FROM cluster_health WHERE cluster_name=%s AND workspace=%s",
+                    (cluster, workspace))
+        self.counters["reloads"] += 1
+        return loaded_at, {r['component']: (r['state_hash'], r['status'], r['component_type']) for r in cur.fetchall()}
+
+    def forget(self, cluster, workspace):
+        """Drop the cached state, e.g. when the transaction holding a write was rolled back"""
+        with self.lock:
+            self.known.pop((cluster, workspace), None)
+
+    def write(self, cur, cluster, workspace, components, complete=True) -> dict:
+        """Write one report of [(component, component_type, status, details)] through `cur`; the caller
+        commits. `complete` means the report lists every component, so missing ones are deleted."""
+        loaded_at, known = self._load(cur, cluster, workspace)
+        report = {}
+        for name, ctype, status, details in components:
+            report[name] = (ctype, status, details, state_hash(ctype, status, details))  # last one wins
+        changed = [(n, v) for n, v in report.items() if known.get(n, (None,))[0] != v[3]]
+        unchanged = [n for n, v in report.items() if known.get(n, (None,))[0] == v[3]]
+        removed = [n for n in known if n not in report] if complete else []
+
+        for i in range(0, len(changed), UPSERT_CHUNK):
+            chunk = changed[i:i + UPSERT_CHUNK]
+            cur.execute(
+                "INSERT INTO cluster_health(cluster_name,workspace,component,component_type,status,details,state_hash,last_check) VALUES "
+                + ",".join(["(%s,%s,%s,%s,%s,%s,%s,NOW())"] * len(chunk))
+                + " ON DUPLICATE KEY UPDATE component_type=VALUES(component_type), status=VALUES(status),"
+                  " details=VALUES(details), state_hash=VALUES(state_hash), last_check=VALUES(last_check)",
+                [x for n, (ctype, status, details, h) in chunk
+                 for x in (cluster, workspace, n, ctype, status, json.dumps(details, default=str), h)])
+        for names, sql in ((unchanged, "UPDATE cluster_health SET last_check=NOW()"), (removed, "DELETE FROM cluster_health")):
+            for i in range(0, len(names), UPSERT_CHUNK):
+                chunk = names[i:i + UPSERT_CHUNK]
+                cur.execute(f"{sql} WHERE cluster_name=%s AND workspace=%s AND component IN ({','.join(['%s'] * len(chunk))})",
+                            [cluster, workspace, *chunk])
+
+        transitions = [(n, v[0], known[n][1] if n in known else None, v[1])
+                       for n, v in changed if n not in known or known[n][1] != v[1]]
+        transitions += [(n, known[n][2], known[n][1], None) for n in removed]
+        if self.history:
+            self._history(cur, cluster, workspace, report, transitions)
+
+        for n in removed:
+            known.pop(n)
+        known.update((n, (v[3], v[1], v[0])) for n, v in report.items())
+        with self.lock:
+            self.known[(cluster, workspace)] = (loaded_at, known)  # age counts from the last reload
+        counts = {"changed": len(changed), "heartbeats": len(unchanged), "removed": len(removed), "transitions": len(transitions)}
+        self.counters["reports"] += 1
+        for k, v in counts.items():
+            self.counters[k] += v
+        return counts
+
+    def _history(self, cur, cluster, workspace, report, transitions):
+        # from/to NULL mark a component appearing or disappearing
+        for i in range(0, len(transitions), UPSERT_CHUNK):
+            chunk = transitions[i:i + UPSERT_CHUNK]
+            cur.execute("INSERT INTO health_transitions(workspace,cluster_name,component,component_type,from_status,to_status,ts) VALUES "
+                        + ",".join(["(%s,%s,%s,%s,%s,%s,NOW(3))"] * len(chunk)),
+                        [x for t in chunk for x in (workspace, cluster, *t)])
+        by_type = {}
+        for ctype, status, _, _ in report.values():
+            row = by_type.setdefault(ctype or "", [0, 0, 0, 0])
+            row[STATUSES.index(status) if status in STATUSES else 3] += 1
+        if by_type:
+            rows = [(workspace, cluster, res, res, res, ctype, *counts) for res in ROLLUP_RESOLUTIONS for ctype, counts in by_type.items()]
+            cur.execute(
+                "INSERT INTO health_rollups(workspace,cluster_name,resolution,bucket_start,component_type,healthy,warning,critical,unknown,samples) VALUES "
+                + ",".join(["(%s,%s,%s,FROM_UNIXTIME(UNIX_TIMESTAMP() DIV %s * %s),%s,%s,%s,%s,%s,1)"] * len(rows))
+                + " ON DUPLICATE KEY UPDATE healthy=healthy+VALUES(healthy), warning=warning+VALUES(warning),"
+                  " critical=critical+VALUES(critical), unknown=unknown+VALUES(unknown), samples=samples+1",
+                [x for r in rows for x in r])
+
+    def stats(self):
+        return {"clusters": len(self.known), **self.counters}
@@ -1,13 +1,16 @@
-import os, json
-from fastapi import FastAPI
+import os, json, contextvars
+from fastapi import FastAPI, Response
 from pydantic import BaseModel
 import pymysql
 from datetime import datetime, timedelta
 
 app = FastAPI()
 
+SNAPSHOT_VERSION = 1  # incident snapshot format the gateway sends (services/gateway/incident_snapshot.py)
+
 class Req(BaseModel):
     incident_id: int
+    snapshot: dict | None = None
 
 conn_args = dict(
     host=os.environ['TIDB_HOST'],
@@ -19,15 +22,62 @@ conn_args = dict(
     ssl={'ssl':{}}
 )
 
+queries = contextvars.ContextVar('queries', default=0)  # per request, reported in X-DB-Queries
+
 def q(sql, *params):
+    queries.set(queries.get() + 1)
     with pymysql.connect(**conn_args) as c:
         with c.cursor() as cur:
             cur.execute(sql, params)
             return cur.fetchall()
 
+def _iso(v):
+    # datetimes from TiDB, already strings in a snapshot
+    return v.isoformat() if hasattr(v, 'isoformat') else v
+
+def load(iid):
+    """The incident and the rows its context is built from, when the gateway sent no snapshot"""
+    inc = q('SELECT * FROM incidents WHERE id=%s', iid)[0]
+    ws = inc.get('workspace', 'TiM8-Local')
+    event_count = q('SELECT COUNT(*) as cnt FROM raw_events WHERE namespace=%s AND app=%s', inc['namespace'], inc['app'])
+    cluster_health = q('''
+        SELECT component_type, status, COUNT(*) as count
+        FROM cluster_health 
+        WHERE cluster_name=%s AND workspace=%s 
+        GROUP BY component_type, status
+    ''', inc['cluster'], ws)
+    workspace_info = q('SELECT * FROM workspaces WHERE name=%s', ws)
+    historical = q('''
+        SELECT 
+            COUNT(*) as total_incidents,
+            AVG(mttr_seconds) as avg_mttr,
+            COUNT(CASE WHEN status='resolved' THEN 1 END) as resolved_count,
+            COUNT(CASE WHEN status='open' THEN 1 END) as open_count
+        FROM incidents 
+        WHERE workspace=%s AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
+    ''', ws)
+    # Related incidents (same app/namespace/cluster)
+    related = q('''
+        SELECT id, title, status, created_at, mttr_seconds, resolution
+        FROM incidents 
+        WHERE (app=%s OR namespace=%s OR cluster=%s) 
+        AND id != %s 
+        ORDER BY created_at DESC 
+        LIMIT 5
+    ''', inc['app'], inc['namespace'], inc['cluster'], iid)
+    mttr_stats = q("SELECT * FROM mttr_stats WHERE workspace=%s AND cluster_name='' ORDER BY calculated_at DESC LIMIT 1", ws)
+    return (inc, event_count[0]['cnt'] if event_count else 0, cluster_health, workspace_info[0] if workspace_info else None,
+            historical[0] if historical else None, related, mttr_stats[0] if mttr_stats else None)
+
 @app.post('/context')
-async def build_context(r: Req):
-    inc = q('SELECT * FROM incidents WHERE id=%s', r.incident_id)[0]
+async def build_context(r: Req, response: Response):
+    snap = r.snapshot if r.snapshot and r.snapshot.get('version') == SNAPSHOT_VERSION else None
+    if snap:
+        inc, event_count, cluster_health = snap['incident'], snap['events_in_scope'], snap['health_counts']
+        ws, h, related, stats = snap['workspace'], snap['history_30d'], snap['similar_incidents'][:5], snap['mttr_stats']
+    else:
+        inc, event_count, cluster_health, ws, h, related, stats = load(r.incident_id)
+    response.headers['X-DB-Queries'] = str(queries.get())
     
     # Enhanced context gathering
     context = {
@@ -40,17 +90,9 @@ async def build_context(r: Req):
     }
     
     # Count events
-    event_count = q('SELECT COUNT(*) as cnt FROM raw_events WHERE namespace=%s AND app=%s', inc['namespace'], inc['app'])
-    context["events_in_scope"] = event_count[0]['cnt'] if event_count else 0
+    context["events_in_scope"] = event_count
     
     # Current cluster health context
-    cluster_health = q('''
-        SELECT component_type, status, COUNT(*) as count
-        FROM cluster_health 
-        WHERE cluster_name=%s AND workspace=%s 
-        GROUP BY component_type, status
-    ''', inc['cluster'], inc.get('workspace', 'TiM8-Local'))
-    
     health_summary = {}
     for h in cluster_health:
         comp_type = h['component_type']
@@ -61,9 +103,7 @@ async def build_context(r: Req):
     context["cluster_health"] = health_summary
     
     # Workspace context
-    workspace_info = q('SELECT * FROM workspaces WHERE name=%s', inc.get('workspace', 'TiM8-Local'))
-    if workspace_info:
-        ws = workspace_info[0]
+    if ws:
         context["workspace_context"] = {
             "name": ws['name'],
             "description": ws['description'], 
@@ -72,18 +112,7 @@ async def build_context(r: Req):
         }
     
     # Historical incident patterns
-    historical = q('''
-        SELECT 
-            COUNT(*) as total_incidents,
-            AVG(mttr_seconds) as avg_mttr,
-            COUNT(CASE WHEN status='resolved' THEN 1 END) as resolved_count,
-            COUNT(CASE WHEN status='open' THEN 1 END) as open_count
-        FROM incidents 
-        WHERE workspace=%s AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-    ''', inc.get('workspace', 'TiM8-Local'))
-    
-    if historical:
-        h = historical[0]
+    if h:
         context["historical_patterns"] = {
             "last_30_days": {
                 "total_incidents": h['total_incidents'] or 0,
@@ -95,21 +124,12 @@ async def build_context(r: Req):
         }
     
     # Related incidents (same app/namespace/cluster)
-    related = q('''
-        SELECT id, title, status, created_at, mttr_seconds, resolution
-        FROM incidents 
-        WHERE (app=%s OR namespace=%s OR cluster=%s) 
-        AND id != %s 
-        ORDER BY created_at DESC 
-        LIMIT 5
-    ''', inc['app'], inc['namespace'], inc['cluster'], r.incident_id)
-    
     context["related_incidents"] = [
         {
             "id": rel['id'],
             "title": rel['title'],
             "status": rel['status'],
-            "created_at": rel['created_at'].isoformat() if rel['created_at'] else None,
+            "created_at": _iso(rel['created_at']),
             "mttr_seconds": rel['mttr_seconds'],
             "resolution_summary": rel['resolution'][:100] + "..." if rel['resolution'] and len(rel['resolution']) > 100 else rel['resolution']
         }
@@ -117,13 +137,13 @@ async def build_context(r: Req):
     ]
     
     # MTTR statistics for this workspace
-    mttr_stats = q('SELECT * FROM mttr_stats WHERE workspace=%s ORDER BY calculated_at DESC LIMIT 1', inc.get('workspace', 'TiM8-Local'))
-    if mttr_stats:
-        stats = mttr_stats[0]
+    if stats:
         context["workspace_context"]["mttr_stats"] = {
             "avg_mttr_seconds": stats['avg_mttr_seconds'],
             "incident_count": stats['incident_count'],
-            "last_calculated": stats['calculated_at'].isoformat() if stats['calculated_at'] else None
+            "p50_mttr_seconds": stats.get('p50_seconds'),
+            "p90_mttr_seconds": stats.get('p90_seconds'),
+            "last_calculated": _iso(stats['calculated_at'])
         }
     
     # Time-based context
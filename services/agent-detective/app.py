@@ -1,5 +1,5 @@
-import os, math, json
-from fastapi import FastAPI
+import os, math, json, contextvars
+from fastapi import FastAPI, Response
 from pydantic import BaseModel
 import pymysql, openai
 from datetime import datetime, timedelta
@@ -9,8 +9,11 @@ MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
 
 app = FastAPI()
 
+SNAPSHOT_VERSION = 1  # incident snapshot format the gateway sends (services/gateway/incident_snapshot.py)
+
 class Req(BaseModel):
     incident_id: int
+    snapshot: dict | None = None
 
 conn_args = dict(
     host=os.environ['TIDB_HOST'],
@@ -22,15 +25,18 @@ conn_args = dict(
     ssl={'ssl':{}}
 )
 
+queries = contextvars.ContextVar('queries', default=0)  # per request, reported in X-DB-Queries
+
 def q(sql, *params):
+    queries.set(queries.get() + 1)
     with pymysql.connect(**conn_args) as c:
         with c.cursor() as cur:
             cur.execute(sql, params)
             return cur.fetchall()
 
-@app.post('/hypothesis')
-async def hypothesis(r: Req):
-    inc = q('SELECT * FROM incidents WHERE id=%s', r.incident_id)[0]
+def load(iid):
+    """The incident and the rows the hypothesis is built from, when the gateway sent no snapshot"""
+    inc = q('SELECT * FROM incidents WHERE id=%s', iid)[0]
     
     # Get current cluster health data
     cluster_health = q('''
@@ -48,14 +54,43 @@ async def hypothesis(r: Req):
         AND status='resolved' 
         AND id != %s
         ORDER BY created_at DESC LIMIT 10
-    ''', inc['cluster'], inc['namespace'], inc['app'], r.incident_id)
+    ''', inc['cluster'], inc['namespace'], inc['app'], iid)
+    
+    # How health got here: component status changes in the last 6 hours, newest first
+    health_changes = q('''
+        SELECT component, component_type, from_status, to_status, ts FROM health_transitions
+        WHERE workspace=%s AND cluster_name=%s AND ts >= NOW() - INTERVAL 6 HOUR
+        ORDER BY ts DESC LIMIT 30
+    ''', inc.get('workspace', 'TiM8-Local'), inc['cluster'])
+    
+    # Distinct log templates active in the last hour; a crashloop is one template, not 50 rows
+    log_templates = q('''
+        SELECT template, count, first_seen, last_seen FROM log_templates
+        WHERE namespace=%s AND app=%s AND last_seen >= NOW() - INTERVAL 1 HOUR
+        ORDER BY count DESC LIMIT 30
+    ''', inc['namespace'], inc['app'])
     
-    # Get recent raw events
+    # A few recent raw events for exact values
     last_logs = q('''
         SELECT ts, level, body_text FROM raw_events 
         WHERE namespace=%s AND app=%s 
-        ORDER BY ts DESC LIMIT 50
-    ''', inc['namespace'], inc['app'])
+        ORDER BY ts DESC LIMIT %s
+    ''', inc['namespace'], inc['app'], 10 if log_templates else 50)
+    return inc, cluster_health, similar_incidents, health_changes, log_templates, last_logs
+
+@app.post('/hypothesis')
+async def hypothesis(r: Req, response: Response):
+    snap = r.snapshot if r.snapshot and r.snapshot.get('version') == SNAPSHOT_VERSION else None
+    if snap:
+        inc = snap['incident']
+        cluster_health = snap['health'][:20]
+        similar_incidents = [s for s in snap['similar_incidents'] if s['status'] == 'resolved'][:10]
+        health_changes = snap['health_changes']
+        log_templates = snap['log_templates']
+        last_logs = snap['recent_logs']
+    else:
+        inc, cluster_health, similar_incidents, health_changes, log_templates, last_logs = load(r.incident_id)
+    response.headers['X-DB-Queries'] = str(queries.get())
     
     # Analyze patterns
     health_issues = [h for h in cluster_health if h['status'] in ['warning', 'critical']]
@@ -63,7 +98,7 @@ async def hypothesis(r: Req):
     
     # Enhanced heuristics
     hints = []
-    if any('OOMKilled' in (row['body_text'] or '') for row in last_logs):
+    if any('OOMKilled' in (row['body_text'] or '') for row in last_logs) or any('OOMKilled' in (t['template'] or '') for t in log_templates):
         hints.append('OOM (Out of Memory) detected in logs')
     if any(h['component_type'] == 'pod' and h['status'] == 'critical' for h in health_issues):
         hints.append('Pod(s) in critical state')
@@ -83,11 +118,17 @@ INCIDENT DETAILS:
 CURRENT CLUSTER HEALTH ({len(cluster_health)} components):
 {json.dumps(cluster_health, indent=2, default=str)}
 
+HEALTH CHANGES (last 6h, newest first; null from/to = component appeared/disappeared):
+{json.dumps(health_changes, indent=2, default=str)}
+
 SIMILAR PAST INCIDENTS ({len(similar_incidents)} resolved):
 {json.dumps(similar_incidents, indent=2, default=str)}
 Average MTTR for similar incidents: {avg_mttr:.0f} seconds
 
-RECENT LOGS (last 50 entries):
+LOG TEMPLATES (distinct patterns active in the last hour, <*> marks variable parts, count is total occurrences):
+{json.dumps(log_templates, indent=2, default=str)}
+
+RECENT LOGS (last {len(last_logs)} entries):
 {json.dumps(last_logs, indent=2, default=str)}
 
 DETECTED PATTERNS:
@@ -117,8 +158,10 @@ Based on this comprehensive data, provide your expert analysis in JSON format:
         "analysis": resp.choices[0].message.content,
         "metadata": {
             "health_components_analyzed": len(cluster_health),
+            "health_changes_analyzed": len(health_changes),
             "similar_incidents_found": len(similar_incidents),
             "log_entries_analyzed": len(last_logs),
+            "log_templates_analyzed": len(log_templates),
             "avg_historical_mttr": avg_mttr
         }
     }
\ No newline at end of file
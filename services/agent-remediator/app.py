@@ -1,5 +1,5 @@
 import os, json
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from pydantic import BaseModel
 import openai, pymysql
 
@@ -8,8 +8,11 @@ MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
 
 app = FastAPI()
 
+SNAPSHOT_VERSION = 1  # incident snapshot format the gateway sends (services/gateway/incident_snapshot.py)
+
 class Req(BaseModel):
     incident_id: int
+    snapshot: dict | None = None
 
 conn_args = dict(
     host=os.environ['TIDB_HOST'],
@@ -21,14 +24,29 @@ conn_args = dict(
     ssl={'ssl':{}}
 )
 
-@app.post('/propose')
-async def propose(r: Req):
+def load(iid):
+    """The incident and its recent log patterns (or raw lines), when the gateway sent no snapshot"""
     with pymysql.connect(**conn_args) as c:
         with c.cursor() as cur:
-            cur.execute('SELECT * FROM incidents WHERE id=%s', (r.incident_id,))
+            cur.execute('SELECT * FROM incidents WHERE id=%s', (iid,))
             inc = cur.fetchone()
+            cur.execute('SELECT template, count FROM log_templates WHERE namespace=%s AND app=%s AND last_seen >= NOW() - INTERVAL 1 HOUR ORDER BY count DESC LIMIT 30', (inc['namespace'], inc['app']))
+            logs = [f"{row['template']} (x{row['count']})" for row in cur.fetchall()]
+            if logs:
+                return inc, logs, 2
             cur.execute('SELECT body_text FROM raw_events WHERE namespace=%s AND app=%s ORDER BY ts DESC LIMIT 30', (inc['namespace'], inc['app']))
-            logs = [row['body_text'] for row in cur.fetchall()]
+            return inc, [row['body_text'] for row in cur.fetchall()], 3
+
+@app.post('/propose')
+async def propose(r: Req, response: Response):
+    snap = r.snapshot if r.snapshot and r.snapshot.get('version') == SNAPSHOT_VERSION else None
+    if snap:
+        inc = snap['incident']
+        logs = [f"{row['template']} (x{row['count']})" for row in snap['log_templates']] or [row['body_text'] for row in snap['recent_logs'][:30]]
+        response.headers['X-DB-Queries'] = '0'
+    else:
+        inc, logs, n = load(r.incident_id)
+        response.headers['X-DB-Queries'] = str(n)
     prompt = f"""
 Given these logs, propose a minimal Kubernetes patch (JSON strategic merge) to mitigate an OOMCrashLoop for app {inc['app']} in ns {inc['namespace']}.
 Only output JSON with keys: action ('patch'|'scale'|'restart'), target ('deployment/name'), patch (object), rollout_cmd.
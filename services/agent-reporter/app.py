@@ -1,10 +1,12 @@
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-import httpx
+from upstream import Upstream, CircuitOpen
 
 SLACK_WEBHOOK = os.environ.get('SLACK_WEBHOOK')
 app = FastAPI()
+# one client for the app's lifetime: the webhook connection is kept alive between posts
+slack = Upstream('slack', timeout=float(os.environ.get('SLACK_TIMEOUT_SECONDS', 10)))
 
 class Report(BaseModel):
     incident_id: int
@@ -13,6 +15,13 @@ class Report(BaseModel):
 @app.post('/notify')
 async def notify(r: Report):
     if SLACK_WEBHOOK:
-        async with httpx.AsyncClient() as http:
-            await http.post(SLACK_WEBHOOK, json={"text": r.text})
-    return {"ok": True}
\ No newline at end of file
+        try:
+            # not idempotent: only a post that never reached Slack is retried, so a message is not sent twice
+            await slack.post(SLACK_WEBHOOK, json={"text": r.text})
+        except CircuitOpen as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return {"ok": True}
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await slack.aclose()
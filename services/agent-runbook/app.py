@@ -1,5 +1,5 @@
-import os, json, openai
-from fastapi import FastAPI
+import os, json, openai, contextvars
+from fastapi import FastAPI, Response
 from pydantic import BaseModel
 import pymysql
 from datetime import datetime, timedelta
@@ -9,8 +9,11 @@ MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
 
 app = FastAPI()
 
+SNAPSHOT_VERSION = 1  # incident snapshot format the gateway sends (services/gateway/incident_snapshot.py)
+
 class Req(BaseModel):
     incident_id: int
+    snapshot: dict | None = None
 
 conn_args = dict(
     host=os.environ['TIDB_HOST'],
@@ -22,15 +25,19 @@ conn_args = dict(
     ssl={'ssl':{}}
 )
 
+queries = contextvars.ContextVar('queries', default=0)  # per request, reported in X-DB-Queries
+
 def q(sql, *params):
+    queries.set(queries.get() + 1)
     with pymysql.connect(**conn_args) as c:
         with c.cursor() as cur:
             cur.execute(sql, params)
             return cur.fetchall()
 
 @app.post('/suggest')
-async def suggest(r: Req):
-    inc = q('SELECT * FROM incidents WHERE id=%s', r.incident_id)[0]
+async def suggest(r: Req, response: Response):
+    snap = r.snapshot if r.snapshot and r.snapshot.get('version') == SNAPSHOT_VERSION else None
+    inc = snap['incident'] if snap else q('SELECT * FROM incidents WHERE id=%s', r.incident_id)[0]
     
     # Get relevant runbooks based on service/app
     primary_runbooks = q('''
@@ -57,7 +64,10 @@ async def suggest(r: Req):
             ''', f'"{keyword}"', f'%{keyword}%', f'%{keyword}%'))
     
     # Get runbooks based on successful resolutions of similar incidents
-    historical_resolutions = q('''
+    if snap:
+        historical_resolutions = [i for i in snap['similar_incidents'] if i['status'] == 'resolved' and i['resolution']][:10]
+    else:
+        historical_resolutions = q('''
         SELECT resolution, title, app, namespace, cluster 
         FROM incidents 
         WHERE status='resolved' 
@@ -69,7 +79,10 @@ async def suggest(r: Req):
     ''', inc['app'], inc['namespace'], inc['cluster'])
     
     # Get cluster health status to recommend specific runbooks
-    cluster_health = q('''
+    if snap:
+        cluster_health = [h for h in snap['health'] if h['status'] in ('warning', 'critical')][:10]
+    else:
+        cluster_health = q('''
         SELECT component, component_type, status, details 
         FROM cluster_health 
         WHERE cluster_name=%s AND workspace=%s 
@@ -78,6 +91,8 @@ async def suggest(r: Req):
         LIMIT 10
     ''', inc['cluster'], inc.get('workspace', 'TiM8-Local'))
     
+    response.headers['X-DB-Queries'] = str(queries.get())
+    
     # Prepare context for AI-powered runbook recommendations
     context = {
         "incident": inc,
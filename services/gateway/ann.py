@@ -0,0 +1,184 @@
+"""IVF (inverted file) approximate nearest-neighbour index over a VectorStore.
+
+Spherical k-means splits the store's rows into `nlist` cells; a query scores
+the centroids, then only the rows of its `nprobe` closest cells. Rows the
+store gains after a build are assigned to their nearest centroid and kept in
+per-cell tails, so new events are searchable right away; `needs_rebuild()`
+asks for a fresh build once the tails grow past `rebuild_ratio` of the
+indexed rows or a store compaction renumbered them. Builds run off the query
+path and swap in atomically; the centroids and cell lists are saved under
+the store directory so a restart only assigns the rows added since.
+
+Recall/latency knobs: nlist (cells, default ~4*sqrt(n)) and nprobe (cells
+scanned per query, also settable per query).
+"""
+import os, json, time, threading, logging
+import numpy as np
+
+logger = logging.getLogger("tim8.vectors.ann")
+
+def kmeans(x, k, iters=10, seed=0):
+    """Spherical k-means (cosine) of the rows of x; returns unit-norm (k, dim) centroids"""
+    rng = np.random.default_rng(seed)
+    c = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(x @ c.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.add.reduceat(x[order], np.minimum(starts, len(x) - 1), axis=0)
+        empty = counts == 0
+        # reseed empty cells with random points so every cell stays in use
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        c = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return c.astype(np.float32)
+
+class _Built:
+    """One immutable build: centroids plus rows grouped by cell"""
+    def __init__(self, centroids, order, offsets, n, generation):
+        self.centroids = centroids
+        self.order = order        # row ids sorted by cell
+        self.offsets = offsets    # cell i holds order[offsets[i]:offsets[i+1]]
+        self.n = n                # store rows covered by order
+        self.generation = generation
+        self.tails = [[] for _ in range(len(centroids))]
+        self.tail_n = n           # store rows covered by order + tails
+
+class IVFIndex:
+    def __init__(self, store, nlist=None, nprobe=16, min_rows=50000, train_size=100000,
+                 rebuild_ratio=0.2, chunk_rows=262144):
+        self.store = store
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_rows = min_rows
+        self.train_size = train_size
+        self.rebuild_ratio = rebuild_ratio
+        self.chunk_rows = chunk_rows
+        self.built = None
+        self.lock = threading.Lock()  # serializes builds and tail updates
+        self.counters = {"builds": 0, "searches": 0, "exact_fallbacks": 0, "candidates": 0}
+        self.build_seconds = 0.0
+        self.search_seconds = 0.0
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.store.path, name)
+
+    def _assign(self, mat, centroids, start, end):
+        out = np.empty(end - start, dtype=np.int32)
+        for s in range(start, end, self.chunk_rows):
+            e = min(s + self.chunk_rows, end)
+            out[s - start:e - start] = np.argmax(mat[s:e] @ centroids.T, axis=1)
+        return out
+
+    def _load(self):
+        try:
+            with open(self._file("ivf.json")) as f:
+                state = json.load(f)
+            if (state["backend"], state["dim"], state["generation"]) != \
+                    (self.store.backend, self.store.dim, self.store.generation) or state["n"] > self.store.n:
+                return
+            built = _Built(np.load(self._file("ivf_centroids.npy")), np.load(self._file("ivf_order.npy")),
+                           np.load(self._file("ivf_offsets.npy")), state["n"], state["generation"])
+        except (OSError, ValueError, KeyError):
+            return
+        self.built = built
+        self.update()
+        logger.info(f"IVF index loaded: {len(built.centroids)} cells over {built.n} rows")
+
+    def _save(self, built):
+        for name, arr in (("ivf_centroids.npy", built.centroids), ("ivf_order.npy", built.order),
+                          ("ivf_offsets.npy", built.offsets)):
+            with open(self._file(name + ".tmp"), "wb") as f:
+                np.save(f, arr)
+            os.replace(self._file(name + ".tmp"), self._file(name))
+        with open(self._file("ivf.json.tmp"), "w") as f:
+            json.dump({"backend": self.store.backend, "dim": self.store.dim, "n": built.n,
+                       "generation": built.generation, "nlist": len(built.centroids)}, f)
+        os.replace(self._file("ivf.json.tmp"), self._file("ivf.json"))
+
+    def build(self):
+        """Train centroids on a sample of the store and regroup every row; swaps in when done"""
+        t0 = time.monotonic()
+        store = self.store
+        generation = store.generation  # read first: a compaction after this fails the check below
+        mat, _, n = store.view
+        if n < self.min_rows:
+            return False
+        nlist = self.nlist or int(min(max(4 * np.sqrt(n), 16), 8192))
+        rng = np.random.default_rng(n)
+        sample = np.sort(rng.choice(n, min(self.train_size, n), replace=False))
+        centroids = kmeans(np.asarray(mat[sample]), nlist)
+        assign = self._assign(mat, centroids, 0, n)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        built = _Built(centroids, order, offsets, n, generation)
+        with self.lock:
+            if store.generation != generation:
+                return False  # compaction raced the build; the next check retries
+            self.built = built
+            self._update(built)
+        self._save(built)
+        self.counters["builds"] += 1
+        self.build_seconds = time.monotonic() - t0
+        logger.info(f"IVF index built: {nlist} cells over {n} rows in {self.build_seconds:.1f}s")
+        return True
+
+    def _update(self, built):
+        mat, _, n = self.store.view
+        if n > built.tail_n:
+            for row, cell in zip(range(built.tail_n, n), self._assign(mat, built.centroids, built.tail_n, n).tolist()):
+                built.tails[cell].append(row)
+            built.tail_n = n
+
+    def update(self):
+        """Put rows appended to the store since the last call into their cells"""
+        with self.lock:
+            if self.built is not None and self.built.generation == self.store.generation:
+                self._update(self.built)
+
+    def needs_rebuild(self):
+        b = self.built
+        if b is None:
+            return self.store.n >= self.min_rows
+        return b.generation != self.store.generation or self.store.n - b.n > self.rebuild_ratio * b.n
+
+    def search(self, query, k=10, nprobe=None, **filters):
+        """Approximate [(event_id, score)]; exact search until built or when filters are selective"""
+        b, store = self.built, self.store
+        mat, meta, n = store.view  # before the generation check: compaction bumps it before publishing
+        if b is None or b.generation != store.generation:
+            self.counters["exact_fallbacks"] += 1
+            return store.search(query, k, **filters)
+        t0 = time.monotonic()
+        n = min(n, b.tail_n)
+        mask = store.mask(meta, n, **filters)
+        if mask is not None and mask.mean() < 0.02:
+            # few rows pass the filters: scoring them all is cheaper than probing, and exact
+            self.counters["exact_fallbacks"] += 1
+            return store.search(query, k, **filters)
+        q = store.query_vector(query)
+        nprobe = min(nprobe or self.nprobe, len(b.centroids))
+        cells = np.argpartition(-(b.centroids @ q), nprobe - 1)[:nprobe]
+        parts = [b.order[b.offsets[c]:b.offsets[c + 1]] for c in cells]
+        parts += [np.fromiter(b.tails[c], dtype=np.int64) for c in cells if b.tails[c]]
+        rows = np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+        rows = rows[rows < n]
+        if mask is not None:
+            rows = rows[mask[rows]]
+        scores = mat[rows] @ q if len(rows) else np.zeros(0, dtype=np.float32)
+        kk = min(k, len(scores))
+        top = np.argpartition(-scores, kk - 1)[:kk] if kk else np.zeros(0, dtype=np.int64)
+        top = top[np.argsort(-scores[top])]
+        self.counters["searches"] += 1
+        self.counters["candidates"] += len(rows)
+        self.search_seconds += time.monotonic() - t0
+        return [(int(e), float(s)) for e, s in zip(meta["event_id"][rows[top]], scores[top])]
+
+    def stats(self):
+        b, c = self.built, self.counters
+        return {"built": b is not None, "nlist": len(b.centroids) if b else None, "nprobe": self.nprobe,
+                "indexed": b.n if b else 0, "tail_rows": (b.tail_n - b.n) if b else 0, **c,
+                "avg_candidates": round(c["candidates"] / max(c["searches"], 1)),
+                "last_build_seconds": round(self.build_seconds, 2),
+                "avg_search_ms": round(1000 * self.search_seconds / max(c["searches"], 1), 2)}
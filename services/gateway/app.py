@@ -1,13 +1,26 @@
-import os, json, asyncio
+import os, json, time, socket, asyncio, logging
 from typing import Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from tidb import TiDB
+from tidb import get_tidb
+from async_db import AsyncTiDB
+from readcache import ReadCache
 from llm import llm_summarize
 from k8s import K8s
-import httpx
+from upstream import Upstream, CircuitOpen
 from app_clusters import r as clusters_router
 from poller import start_poller
+from backends import get_backend
+from vector_store import VectorStore
+from ann import IVFIndex
+from search_index import parse_time
+import hybrid
+from paging import decode_cursor, encode_cursor, ndjson, wants_stream
+import migrate
+from jobqueue import JobQueue
+
+logger = logging.getLogger("tim8.gateway")
 
 AGENTS = {
     'detective': os.environ.get('DETECTIVE_URL', 'http://agent-detective:8000'),
@@ -17,9 +30,71 @@ AGENTS = {
     'report':    os.environ.get('REPORT_URL',    'http://agent-reporter:8000'),
 }
 
+# Semantic search: query vectors must come from the backend ingestion embeds with
+EMBED_BACKEND = os.environ.get('EMBED_BACKEND', 'openai')
+EMBED_MODEL = os.environ.get('EMBED_MODEL', 'text-embedding-3-small')
+VECTOR_STORE_DIR = os.environ.get('VECTOR_STORE_DIR', '/var/lib/tim8/vectors')
+VECTOR_REFRESH_SECONDS = float(os.environ.get('VECTOR_REFRESH_SECONDS', 5))
+VECTOR_REFRESH_LAG_SECONDS = float(os.environ.get('VECTOR_REFRESH_LAG_SECONDS', 600))
+VECTOR_MAX_DAYS = int(os.environ.get('VECTOR_MAX_DAYS', os.environ.get('RETENTION_DEFAULT_DAYS', 14)))
+# IVF index: cells (0 = ~4*sqrt(n)), cells probed per query, and when to start/rebuild it
+VECTOR_ANN_NLIST = int(os.environ.get('VECTOR_ANN_NLIST', 0))
+VECTOR_ANN_NPROBE = int(os.environ.get('VECTOR_ANN_NPROBE', 16))
+VECTOR_ANN_MIN_ROWS = int(os.environ.get('VECTOR_ANN_MIN_ROWS', 50000))
+VECTOR_ANN_CHECK_SECONDS = float(os.environ.get('VECTOR_ANN_CHECK_SECONDS', 60))
+# Hybrid search: per-stage budgets so one slow leg cannot hold up the response
+SEARCH_LEXICAL_BUDGET_MS = float(os.environ.get('SEARCH_LEXICAL_BUDGET_MS', 400))
+SEARCH_EMBED_BUDGET_MS = float(os.environ.get('SEARCH_EMBED_BUDGET_MS', 300))
+SEARCH_VECTOR_BUDGET_MS = float(os.environ.get('SEARCH_VECTOR_BUDGET_MS', 150))
+SEARCH_FETCH_BUDGET_MS = float(os.environ.get('SEARCH_FETCH_BUDGET_MS', 200))
+# Read cache TTLs (seconds, 0 = off) for the reads the UI polls; gateway writes invalidate them at once
+CACHE_TTLS = {
+    'workspaces': float(os.environ.get('CACHE_TTL_WORKSPACES', 30)),
+    'recent_incidents': float(os.environ.get('CACHE_TTL_RECENT_INCIDENTS', 5)),
+    'mttr': float(os.environ.get('CACHE_TTL_MTTR', 60)),
+    'cluster_health': float(os.environ.get('CACHE_TTL_CLUSTER_HEALTH', 10)),
+    'health_timeline': float(os.environ.get('CACHE_TTL_HEALTH_TIMELINE', 30)),
+    # the agents' shared read of an incident; kept below INCIDENT_JOB_STALE_SECONDS so a resumed pipeline reads afresh
+    'incident_snapshot': float(os.environ.get('CACHE_TTL_INCIDENT_SNAPSHOT', 30)),
+}
+# Incident fan-out: agents run concurrently, each within its own deadline, all within the incident SLA
+AGENT_TIMEOUT_SECONDS = float(os.environ.get('AGENT_TIMEOUT_SECONDS', 25))
+INCIDENT_SLA_SECONDS = float(os.environ.get('INCIDENT_SLA_SECONDS', 45))
+SUMMARY_RESERVE_SECONDS = float(os.environ.get('SUMMARY_RESERVE_SECONDS', 15))
+FANOUT = [('detective', '/hypothesis'), ('context', '/context'), ('runbook', '/suggest')]
+
+# Incident pipelines run in the background on at most INCIDENT_WORKERS at once; state is kept in incident_jobs
+INCIDENT_WORKERS = int(os.environ.get('INCIDENT_WORKERS', 4))
+INCIDENT_QUEUE_MAX = int(os.environ.get('INCIDENT_QUEUE_MAX', 1000))
+# a job not advanced for this long is resumed by any replica; held jobs are touched every INCIDENT_RESUME_SECONDS
+INCIDENT_JOB_STALE_SECONDS = float(os.environ.get('INCIDENT_JOB_STALE_SECONDS', 120))
+INCIDENT_RESUME_SECONDS = float(os.environ.get('INCIDENT_RESUME_SECONDS', 30))
+INCIDENT_JOB_MAX_ATTEMPTS = int(os.environ.get('INCIDENT_JOB_MAX_ATTEMPTS', 3))
+JOB_OWNER = os.environ.get('HOSTNAME') or socket.gethostname()
+
+def agent_timeout(name):
+    return float(os.environ.get(f'AGENT_TIMEOUT_{name.upper()}_SECONDS', AGENT_TIMEOUT_SECONDS))
+
+# mttr_stats is updated on every resolve; this re-slides its window when nothing resolves for a while
+MTTR_REFRESH_SECONDS = float(os.environ.get('MTTR_REFRESH_SECONDS', 3600))
+HEALTH_PRUNE_SECONDS = float(os.environ.get('HEALTH_PRUNE_SECONDS', 3600))
+# 'startup' applies pending schema migrations before serving (and refuses to start if that fails); 'off' when they run as a separate job
+SCHEMA_MIGRATE = os.environ.get('SCHEMA_MIGRATE', 'startup')
+
 app = FastAPI(title='Incident Co‑Pilot Gateway')
-tidb = TiDB()
+tidb = get_tidb()
+# awaitable TiDB methods for the handlers; blocking calls run on a bounded executor, off the event loop
+adb = AsyncTiDB(tidb, int(os.environ.get('TIDB_ASYNC_WORKERS', 0)) or None,
+               reserved=int(os.environ.get('TIDB_POOL_RESERVED', 3)))
+cache = ReadCache(CACHE_TTLS)
+tidb.on_change(cache.invalidate)
 k8s = K8s()
+embed_backend = get_backend(EMBED_BACKEND, EMBED_MODEL)
+vectors = VectorStore(VECTOR_STORE_DIR, embed_backend.name, tidb._conn, include_legacy=embed_backend.remote,
+                      lag_seconds=VECTOR_REFRESH_LAG_SECONDS, max_days=VECTOR_MAX_DAYS)
+ann = IVFIndex(vectors, nlist=VECTOR_ANN_NLIST or None, nprobe=VECTOR_ANN_NPROBE, min_rows=VECTOR_ANN_MIN_ROWS)
+# one long-lived client per agent: keep-alive pool, retries with jitter, and a breaker that fails a dead agent fast
+upstreams = {name: Upstream(name, url, timeout=60 if name == 'remed' else agent_timeout(name)) for name, url in AGENTS.items()}
 
 # Include clusters router
 app.include_router(clusters_router)
@@ -58,75 +133,393 @@ async def broadcast(event: Dict[str, Any]):
 async def healthz():
     return {'ok': True}
 
-@app.post('/incidents')
+async def call_agent(name, path, payload, deadline):
+    """POST to one agent within min(its own timeout, the fan-out deadline); never raises"""
+    t0 = time.monotonic()
+    timeout = max(0.0, min(agent_timeout(name), deadline - t0))
+    run = {'agent': name}
+    try:
+        # the client's timeout fires first, so a hung agent counts against its circuit breaker;
+        # the grace only bounds retries. The agents' endpoints are read-only, hence safe to retry.
+        r = await asyncio.wait_for(upstreams[name].post(path, json=payload, idempotent=True, timeout=timeout), timeout + 0.5)
+        r.raise_for_status()
+        run.update(status='ok', result=r.json())
+        if 'x-db-queries' in r.headers:
+            run['queries'] = int(r.headers['x-db-queries'])
+    except asyncio.TimeoutError:
+        run.update(status='timeout', error=f"no answer within {timeout:.1f}s")
+    except Exception as e:
+        run.update(status='error', error=str(e)[:500] or type(e).__name__)
+    run['ms'] = round((time.monotonic() - t0) * 1000)
+    return run
+
+@app.post('/incidents', status_code=202)
 async def open_incident(req: IncidentOpen):
-    iid = tidb.create_incident(req.title, req.cluster, req.namespace, req.app)
+    """Open an incident and queue its agent pipeline; progress is pushed on /ws as incident_stage events"""
+    iid = await adb.queue_incident(req.title, req.cluster, req.namespace, req.app, JOB_OWNER)
     await broadcast({'type':'incident_opened','id':iid,'title':req.title})
-    # fan‑out to agents
-    async with httpx.AsyncClient(timeout=30) as http:
-        detective = await http.post(f"{AGENTS['detective']}/hypothesis", json={'incident_id': iid})
-        context   = await http.post(f"{AGENTS['context']}/context", json={'incident_id': iid})
-        runbook   = await http.post(f"{AGENTS['runbook']}/suggest", json={'incident_id': iid})
-    # summarize
-    summary = llm_summarize([
-        ('detective', detective.json()),
-        ('context', context.json()),
-        ('runbook', runbook.json())
-    ])
-    tidb.update_incident_summary(iid, summary)
-    await broadcast({'type':'incident_updated','id':iid,'summary':summary})
-    return {'id': iid, 'summary': summary}
+    await broadcast({'type':'incident_stage','id':iid,'stage':'queued'})
+    if not pipelines.submit(iid):
+        logger.warning(f"Incident queue full; incident {iid} waits for the resume loop")
+    return {'id': iid, 'state': 'queued', 'job': f'/incidents/{iid}/job'}
+
+class JobTakenOver(Exception):
+    """Another replica resumed this job, e.g. after this one stalled past INCIDENT_JOB_STALE_SECONDS"""
+
+async def advance(iid, stage, error=None, **event):
+    if not await adb.set_incident_job(iid, stage, JOB_OWNER, error):
+        raise JobTakenOver(iid)
+    await broadcast({'type':'incident_stage','id':iid,'stage':stage, **({'error': error} if error else {}), **event})
+
+async def run_incident(iid):
+    """The incident pipeline: fan out to the agents concurrently, then summarize whatever came back within the SLA.
+    Each stage is persisted before it is broadcast."""
+    t0 = time.monotonic()
+    sla = t0 + INCIDENT_SLA_SECONDS
+    try:
+        await advance(iid, 'gathering')
+        # one shared read for all agents instead of each re-querying the same rows
+        t1 = time.monotonic()
+        snap = await incident_snapshot(iid)
+        shared = {'agent': 'snapshot', 'status': 'ok' if snap else 'error', 'ms': round((time.monotonic() - t1) * 1000),
+                  'queries': snap['queries'] if snap else None}
+        payload = {'incident_id': iid, 'snapshot': snap} if snap else {'incident_id': iid}
+
+        async def one(name, path):
+            run = await call_agent(name, path, payload, sla - SUMMARY_RESERVE_SECONDS)
+            await broadcast({'type':'incident_agent','id':iid, **{k: run[k] for k in ('agent', 'status', 'ms', 'error') if k in run}})
+            return run
+
+        # fan‑out to agents; the summary keeps SUMMARY_RESERVE_SECONDS of the SLA for itself
+        runs = await asyncio.gather(*(one(name, path) for name, path in FANOUT))
+        agents = [shared] + [{k: r[k] for k in ('agent', 'status', 'ms', 'queries', 'error') if k in r} for r in runs]
+        partial = any(r['status'] != 'ok' for r in runs)
+        await broadcast({'type':'incident_agents','id':iid,'agents':agents,'partial':partial})
+        await advance(iid, 'summarizing', partial=partial)
+        # summarize (partial results are fine) while the agent outcomes are recorded
+        recorded = asyncio.ensure_future(adb.record_agent_runs(iid, agents))
+        summary = await summarize_runs(runs, sla)
+        await adb.update_incident_summary(iid, summary)
+        try:
+            await recorded
+        except Exception as e:
+            logger.warning(f"Recording agent runs for incident {iid} failed: {e}")
+        await broadcast({'type':'incident_updated','id':iid,'summary':summary})
+        await advance(iid, 'done', partial=partial, ms=round((time.monotonic() - t0) * 1000))
+    except JobTakenOver:
+        logger.info(f"Incident {iid} pipeline was taken over by another replica; dropping it here")
+    except Exception as e:
+        logger.exception(f"Incident {iid} pipeline failed")
+        await advance(iid, 'failed', error=str(e)[:500] or type(e).__name__)
+
+pipelines = JobQueue(run_incident, INCIDENT_WORKERS, INCIDENT_QUEUE_MAX, name="incident")
+
+async def incident_resume_loop():
+    """Keep this replica's jobs alive, and resume unfinished ones: at startup those this owner left behind,
+    then any replica's once they go stale"""
+    own = True
+    while True:
+        try:
+            if pipelines.pending:
+                await adb.touch_incident_jobs(list(pipelines.pending), JOB_OWNER)
+            # claim no more than the queue can take, so a claimed job is never left unrun
+            free = min(pipelines.free, 50)
+            claimed = await adb.claim_incident_jobs(JOB_OWNER, INCIDENT_JOB_STALE_SECONDS, own, free) if free > 0 else []
+            for iid, attempts in claimed:
+                if attempts > INCIDENT_JOB_MAX_ATTEMPTS:
+                    await advance(iid, 'failed', error=f"gave up after {attempts - 1} attempts")
+                elif pipelines.submit(iid):
+                    logger.info(f"Resuming incident {iid} pipeline (attempt {attempts})")
+                    await broadcast({'type':'incident_stage','id':iid,'stage':'queued','attempt':attempts})
+                elif iid not in pipelines.pending:
+                    # new submissions filled the queue meanwhile: hand the job back without spending an attempt
+                    await adb.release_incident_job(iid, JOB_OWNER, INCIDENT_JOB_STALE_SECONDS)
+            if free > 0:
+                own = False
+        except Exception as e:
+            logger.warning(f"Incident job resume failed: {e}")
+        await asyncio.sleep(INCIDENT_RESUME_SECONDS)
+
+async def summarize_runs(runs, sla):
+    ok = [(r['agent'], r['result']) for r in runs if r['status'] == 'ok']
+    missing = [f"{r['agent']} ({r['status']})" for r in runs if r['status'] != 'ok']
+    if not ok:
+        return f"No agent answered in time: {', '.join(missing)}. Retry or investigate manually."
+    if missing:
+        ok.append(('unavailable', f"no output from {', '.join(missing)}; summarize from the agents above"))
+    try:
+        return await asyncio.wait_for(run_in_threadpool(llm_summarize, ok), max(1.0, sla - time.monotonic()))
+    except Exception as e:
+        logger.warning(f"Incident summary failed: {e!r}")
+        return "Summary unavailable; raw agent output:\n" + "\n".join(f"[{k}] {str(v)[:500]}" for k, v in ok)
+
+async def incident_snapshot(iid, fresh=False):
+    """The agents' shared read of an incident, or None so that they query for themselves; never raises.
+    Incident writes (summary, resolve) drop the cached one; `fresh` skips it."""
+    if fresh:
+        cache.invalidate(('incident_snapshot', iid))
+    try:
+        return await cache.get('incident_snapshot', (iid,), lambda: adb.get_incident_snapshot(iid),
+                               tags=(('incident_snapshot', iid),))
+    except Exception as e:
+        logger.warning(f"Incident {iid} snapshot failed, agents will query TiDB themselves: {e}")
+        return None
+
+@app.get('/incidents/{iid}/job')
+async def incident_job(iid: int):
+    """State of an incident's pipeline: queued, gathering, summarizing, done or failed"""
+    job = await adb.get_incident_job(iid)
+    if not job:
+        raise HTTPException(status_code=404, detail="No pipeline for this incident")
+    return job
+
+@app.get('/incidents/{iid}/agents')
+async def incident_agents(iid: int):
+    """Outcome, latency and TiDB queries of each agent called for an incident, and of the shared snapshot"""
+    return await adb.get_agent_runs(iid)
 
 @app.post('/incidents/{iid}/remediate')
 async def remediate(iid: int):
-    async with httpx.AsyncClient(timeout=60) as http:
-        r = await http.post(f"{AGENTS['remed']}/propose", json={'incident_id': iid})
+    # remediation acts on the cluster now: current logs, health and status, not the fan-out's view
+    snap = await incident_snapshot(iid, fresh=True)
+    try:
+        r = await upstreams['remed'].post('/propose', json={'incident_id': iid, 'snapshot': snap} if snap else {'incident_id': iid},
+                                          idempotent=True)
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e))
     plan = r.json()
     await broadcast({'type':'remediation_plan','id':iid,'plan':plan})
     return plan
 
 @app.post('/incidents/{iid}/resolve')
 async def resolve(iid: int):
-    tidb.resolve_incident(iid)
+    await adb.resolve_incident(iid)
     await broadcast({'type':'incident_resolved','id':iid})
     return {'ok': True}
 
 @app.get('/search')
-async def search(q: str, k: int = 10):
-    return tidb.search_events(q, k)
+async def search(response: Response, q: str, k: int = 10, cluster: str = None, namespace: str = None,
+                 app: str = None, level: str = None, since: str = None, until: str = None,
+                 order: str = 'relevance', cursor: str = None, format: str = 'json', limit: int = None):
+    """Full-text search: words, "phrases", prefix*; since/until take ISO times or ages like 2h.
+    order=time (implied by a cursor) pages newest first, k per page, next page in X-Next-Cursor;
+    format=ndjson streams every match (up to `limit`), each line with its `_cursor`."""
+    filters = dict(cluster=cluster, namespace=namespace, app=app, level=level, since=since, until=until)
+    key = decode_cursor(cursor, 2)
+    if wants_stream(format):
+        return ndjson(tidb.stream_search_events(q, key, limit, **filters))
+    if order == 'relevance' and key is None:
+        return await adb.search_events(q, k, **filters)
+    rows, next_key = await adb.search_events_page(q, k, key, **filters)
+    if next_key:
+        response.headers['X-Next-Cursor'] = encode_cursor(*next_key)
+    return [row for row, _ in rows]
+
+@app.get('/search/semantic')
+async def semantic_search(q: str = None, event_id: int = None, k: int = 10, cluster: str = None,
+                          namespace: str = None, app: str = None, since: str = None, until: str = None,
+                          nprobe: int = None, exact: bool = False):
+    """kNN over event embeddings, for a text query or for the events closest to `event_id`.
+    Uses the IVF index once built; `nprobe` trades latency for recall, `exact` scans everything."""
+    if q:
+        query = (await run_in_threadpool(embed_backend.embed, [q]))[0]
+    elif event_id is not None:
+        query = vectors.vector(event_id)
+        if query is None:
+            raise HTTPException(404, f"no embedding for event {event_id}")
+    else:
+        raise HTTPException(400, "q or event_id is required")
+    filters = dict(cluster=cluster, namespace=namespace, app=app, since=parse_time(since), until=parse_time(until))
+    if exact:
+        hits = await run_in_threadpool(vectors.search, query, k + (event_id is not None), **filters)
+    else:
+        hits = await run_in_threadpool(ann.search, query, k + (event_id is not None), nprobe, **filters)
+    hits = [(eid, score) for eid, score in hits if eid != event_id][:k]
+    events = await adb.get_events([eid for eid, _ in hits])
+    # events pruned by retention since the last refresh simply drop out
+    return [{**events[eid], 'score': round(score, 4)} for eid, score in hits if eid in events]
+
+async def _stage(name, call, budget_ms, report):
+    """Await one search stage within its budget; a late or failed stage yields None"""
+    t0 = time.monotonic()
+    status, result = 'ok', None
+    try:
+        result = await asyncio.wait_for(call, budget_ms / 1000)
+    except asyncio.TimeoutError:
+        status = 'timeout'
+    except Exception as e:
+        status = 'error'
+        logger.warning(f"search stage {name} failed: {e}")
+    report[name] = {'status': status, 'ms': round((time.monotonic() - t0) * 1000, 1)}
+    return result
+
+async def _lexical_leg(q, n, filters, report):
+    hits = await _stage('lexical', adb.search_events(q, n, **filters),
+                        SEARCH_LEXICAL_BUDGET_MS, report)
+    return hits or []
+
+async def _semantic_leg(q, n, filters, report):
+    vecs = await _stage('embed', run_in_threadpool(embed_backend.embed, [q]), SEARCH_EMBED_BUDGET_MS, report)
+    if not vecs:
+        return []
+    filters = {key: v for key, v in filters.items() if key != 'level'}  # not in the vector store
+    hits = await _stage('vector', run_in_threadpool(ann.search, vecs[0], n, None, **filters),
+                        SEARCH_VECTOR_BUDGET_MS, report)
+    return [eid for eid, _ in hits or []]
+
+@app.get('/search/hybrid')
+async def hybrid_search(q: str, k: int = 10, cluster: str = None, namespace: str = None, app: str = None,
+                        level: str = None, since: str = None, until: str = None):
+    """Lexical and semantic retrieval run concurrently, fused with reciprocal rank fusion,
+    repeated lines collapsed and matches highlighted. Legs that miss their budget are skipped."""
+    t0 = time.monotonic()
+    filters = dict(cluster=cluster, namespace=namespace, app=app, level=level,
+                   since=parse_time(since), until=parse_time(until))
+    report = {}
+    n = 3 * k  # extra depth so dedup still leaves k lines
+    lexical, semantic = await asyncio.gather(_lexical_leg(q, n, filters, report),
+                                             _semantic_leg(q, n, filters, report))
+    legs = {'lexical': [h['id'] for h in lexical], 'semantic': semantic}
+    # lexical rows already carry a snippet; the fetch adds semantic-only rows and longer bodies
+    events = {h['id']: {**h, 'body_text': h.get('snippet')} for h in lexical}
+    ids = list(dict.fromkeys(legs['lexical'] + semantic))
+    fetched = await _stage('fetch', adb.get_events(ids, 2000), SEARCH_FETCH_BUDGET_MS, report)
+    events.update(fetched or {})
+    if level:
+        events = {eid: row for eid, row in events.items() if row.get('level') == level}
+    results = hybrid.fuse(q, legs, events, k)
+    return {'results': results, 'stages': report, 'partial': any(r['status'] != 'ok' for r in report.values()),
+            'ms': round((time.monotonic() - t0) * 1000, 1)}
+
+async def vector_refresh_loop():
+    while True:
+        try:
+            added = await run_in_threadpool(vectors.refresh)
+            await run_in_threadpool(ann.update)
+            if added:
+                logger.info(f"Vector store: +{added} vectors ({vectors.n} total)")
+        except Exception as e:
+            logger.warning(f"Vector store refresh failed: {e}")
+        await asyncio.sleep(VECTOR_REFRESH_SECONDS)
+
+async def ann_rebuild_loop():
+    while True:
+        await asyncio.sleep(VECTOR_ANN_CHECK_SECONDS)
+        try:
+            if ann.needs_rebuild():
+                await run_in_threadpool(ann.build)
+        except Exception as e:
+            logger.warning(f"IVF rebuild failed: {e}")
+
+async def mttr_refresh_loop():
+    while True:
+        try:
+            await adb.refresh_mttr_stats()
+        except Exception as e:
+            logger.warning(f"MTTR stats refresh failed: {e}")
+        await asyncio.sleep(MTTR_REFRESH_SECONDS)
+
+async def health_prune_loop():
+    while True:
+        await asyncio.sleep(HEALTH_PRUNE_SECONDS)
+        try:
+            await adb.prune_health_history()
+        except Exception as e:
+            logger.warning(f"Health history prune failed: {e}")
+
+@app.get('/stats')
+async def stats():
+    return {'db_pool': tidb.pool.stats(), 'db_executor': adb.stats(), 'cache': cache.stats(), 'incident_jobs': pipelines.stats(), 'upstreams': {n: u.stats() for n, u in upstreams.items()}, 'health_writes': tidb.health.stats(), 'vectors': vectors.stats(), 'ann': ann.stats()}
+
+# Cached reads behind the polled endpoints; writes to a tag (TiDB.on_change) drop its entries
+def cached_workspaces():
+    return cache.get('workspaces', (), adb.get_workspaces)
+
+def cached_recent_incidents(workspace, limit):
+    return cache.get('recent_incidents', (workspace, limit), lambda: adb.get_recent_incidents(workspace, limit),
+                     tags=('incidents',))
+
+def cached_mttr(workspace=None, cluster=None):
+    return cache.get('mttr', (workspace, cluster), lambda: adb.get_mttr_stats(workspace, cluster))
+
+def cached_cluster_health(cluster_name, workspace, limit):
+    return cache.get('cluster_health', (cluster_name, workspace, limit),
+                     lambda: adb.get_cluster_health(cluster_name, workspace, None, limit),
+                     tags=(('cluster_health', cluster_name, workspace),))
 
 # New TiM8 API endpoints
 @app.get('/api/workspaces')
 async def get_workspaces():
     """Get all workspaces"""
-    return tidb.get_workspaces()
+    return await cached_workspaces()
 
 @app.get('/api/workspaces/{workspace_name}/clusters')
 async def get_workspace_clusters(workspace_name: str):
     """Get clusters in a workspace"""
-    return tidb.get_workspace_clusters(workspace_name)
+    return await adb.get_workspace_clusters(workspace_name)
 
 @app.get('/api/cluster/{cluster_name}/health')
-async def get_cluster_health(cluster_name: str, workspace: str = 'TiM8-Local'):
-    """Get cluster health status"""
-    return tidb.get_cluster_health(cluster_name, workspace)
+async def get_cluster_health(cluster_name: str, workspace: str = 'TiM8-Local', limit: int = None,
+                             cursor: str = None, format: str = 'json'):
+    """Get cluster health status; `limit`/`cursor` page the components, format=ndjson streams them"""
+    key = decode_cursor(cursor, 2)
+    if wants_stream(format):
+        return ndjson(tidb.get_cluster_health_components(cluster_name, workspace, key, limit, stream=True),
+                      key=lambda r: (r['last_check'], r['id']))
+    if key is None:
+        return await cached_cluster_health(cluster_name, workspace, limit)
+    return await adb.get_cluster_health(cluster_name, workspace, key, limit)
+
+@app.get('/api/cluster/{cluster_name}/health/timeline')
+async def get_cluster_health_timeline(cluster_name: str, workspace: str = 'TiM8-Local', since: str = '24h',
+                                      until: str = None, resolution: int = None, transitions: bool = False):
+    """A cluster's health over a window, oldest first: per minute for windows up to 6h, else per hour
+    (`resolution` 60/3600 forces one). transitions=true adds the component status changes in the window."""
+    if resolution not in (None, 60, 3600):
+        raise HTTPException(400, "resolution must be 60 or 3600")
+    start, end = parse_time(since), parse_time(until)
+    res, points = await cache.get('health_timeline', (workspace, cluster_name, since, until, resolution),
+                                  lambda: adb.get_health_timeline(workspace, start, end, resolution, cluster_name))
+    out = {'cluster_name': cluster_name, 'workspace': workspace, 'resolution': res, 'points': points.get(cluster_name, [])}
+    if transitions:
+        out['transitions'] = await adb.get_health_transitions(workspace, cluster_name, start, end)
+    return out
+
+@app.get('/api/health/timeline')
+async def get_health_timelines(workspace: str = 'TiM8-Local', since: str = '24h', until: str = None,
+                               resolution: int = None):
+    """Timelines of every cluster in a workspace in one read, for sparklines"""
+    if resolution not in (None, 60, 3600):
+        raise HTTPException(400, "resolution must be 60 or 3600")
+    res, points = await cache.get('health_timeline', (workspace, None, since, until, resolution),
+                                  lambda: adb.get_health_timeline(workspace, parse_time(since), parse_time(until), resolution))
+    return {'workspace': workspace, 'resolution': res, 'clusters': points}
 
 @app.get('/api/incidents/recent')
-async def get_recent_incidents(workspace: str = None, limit: int = 5):
-    """Get recent incidents, optionally filtered by workspace"""
-    return tidb.get_recent_incidents(workspace, limit)
+async def get_recent_incidents(response: Response, workspace: str = None, limit: int = None,
+                               cursor: str = None, format: str = 'json'):
+    """Get recent incidents, optionally filtered by workspace. Pages of `limit` (default 5) continue
+    with the X-Next-Cursor header; format=ndjson streams all of them (or `limit`)."""
+    key = decode_cursor(cursor, 2)
+    if wants_stream(format):
+        return ndjson(tidb.get_recent_incidents(workspace, limit, key, stream=True),
+                      key=lambda r: (r['created_at'], r['id']))
+    limit = limit or 5
+    rows = await (adb.get_recent_incidents(workspace, limit, key) if key else cached_recent_incidents(workspace, limit))
+    if len(rows) == limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows
 
 @app.get('/api/stats/mttr')
-async def get_mttr_stats(workspace: str = None):
-    """Get MTTR statistics, optionally filtered by workspace"""
-    return tidb.get_mttr_stats(workspace)
+async def get_mttr_stats(workspace: str = None, cluster: str = None):
+    """MTTR (avg, p50, p90, count) over the rolling window per workspace, or for one workspace and cluster"""
+    return await cached_mttr(workspace, cluster)
 
 @app.get('/api/dashboard/overview')
 async def get_dashboard_overview():
     """Get dashboard overview with workspaces health and recent incidents"""
-    workspaces = tidb.get_workspaces()
-    recent_incidents = tidb.get_recent_incidents(None, 5)
-    mttr_stats = tidb.get_mttr_stats()
+    workspaces, recent_incidents, mttr_stats = await asyncio.gather(
+        cached_workspaces(), cached_recent_incidents(None, 5), cached_mttr())
     
     return {
         'workspaces': workspaces,
@@ -142,14 +535,44 @@ class WorkspaceCreate(BaseModel):
 @app.post('/api/workspaces')
 async def create_workspace(workspace: WorkspaceCreate):
     """Create a new workspace"""
-    return tidb.create_workspace(workspace.name, workspace.description, workspace.clusters)
+    return await adb.create_workspace(workspace.name, workspace.description, workspace.clusters)
 
 @app.delete('/api/workspaces/{workspace_id}')
 async def delete_workspace(workspace_id: str):
     """Delete a workspace"""
-    return tidb.delete_workspace(workspace_id)
+    return await adb.delete_workspace(workspace_id)
+
+def run_migrations():
+    with tidb._conn() as c:
+        ran = migrate.migrate(c)
+    if ran:
+        logger.info(f"Applied schema migrations {ran}")
 
 @app.on_event("startup")
 async def startup_event():
-    """Start the cluster poller on app startup"""
-    start_poller()
\ No newline at end of file
+    """Migrate the schema, open the TiDB pool, start the cluster poller, the background loops and the incident workers"""
+    if SCHEMA_MIGRATE == 'startup':
+        try:
+            await adb.run(run_migrations)
+        except Exception:
+            # refuse to serve against a half-migrated schema; the orchestrator restarts us and we retry
+            logger.exception("Schema migration failed; not starting")
+            raise
+    try:
+        await adb.run(tidb.pool.warm)
+    except Exception as e:
+        logger.warning(f"TiDB pool warm-up failed, connecting on demand: {e}")
+    start_poller()
+    asyncio.create_task(vector_refresh_loop())
+    asyncio.create_task(ann_rebuild_loop())
+    asyncio.create_task(mttr_refresh_loop())
+    asyncio.create_task(health_prune_loop())
+    pipelines.start()
+    asyncio.create_task(incident_resume_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await pipelines.stop()
+    await asyncio.gather(*(u.aclose() for u in upstreams.values()))
+    adb.close()
+    tidb.pool.close()
\ No newline at end of file
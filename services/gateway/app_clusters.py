@@ -1,11 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from pydantic import BaseModel
-from .tidb import TiDB
+from tidb import get_tidb
+from paging import decode_cursor, encode_cursor, ndjson, wants_stream
 import secrets, datetime as dt, json, logging
 
 logger = logging.getLogger("tim8.clusters")
 r = APIRouter(prefix="/api", tags=["clusters"])
-db = TiDB()
+db = get_tidb()
 
 class EnrollReq(BaseModel):
     workspace: str
@@ -107,13 +108,15 @@ def register_cluster(req: RegisterReq):
         raise HTTPException(500, f"Registration failed: {str(e)}")
 
 @r.get("/clusters")
-def list_clusters():
-    """List all registered clusters"""
+def list_clusters(response: Response, limit: int = None, cursor: str = None, format: str = "json"):
+    """List registered clusters by (workspace, name); `limit`/`cursor` page them, format=ndjson streams them"""
+    key = decode_cursor(cursor, 2)
+    if wants_stream(format):
+        return ndjson(db.list_clusters(key, limit, stream=True), key=lambda r_: (r_["workspace"], r_["name"]))
     try:
-        rows = db.list_clusters()
-        # Convert IDs to strings for frontend compatibility
-        for r_ in rows:
-            r_["id"] = str(r_["id"])
+        rows = db.list_clusters(key, limit)
+        if limit and len(rows) == limit:
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["workspace"], rows[-1]["name"])
         logger.debug(f"Listed {len(rows)} clusters")
         return rows
     except Exception as e:
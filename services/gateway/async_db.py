@@ -0,0 +1,71 @@
+"""Awaitable access to the gateway's TiDB handle.
+
+`AsyncTiDB(tidb)` exposes every public `TiDB` method as a coroutine with the
+same arguments: `await adb.get_workspaces()`. Calls run on a dedicated thread
+pool sized to the connection pool, so a burst of requests queues here (on
+futures, cheap) instead of freezing the event loop behind blocking pymysql
+I/O or piling up threads that then time out waiting for a connection. The
+`/ws` hub and requests that never touch TiDB keep their latency while the
+database is busy.
+
+The executor is smaller than the pool by `reserved` connections: the cluster
+poller thread, the vector store refresh and ANN rebuild, and the clusters
+router's sync handlers take pool connections outside it. Without the reserve,
+handlers could still hit PoolTimeout with every executor thread busy.
+
+Methods that return a stream (`stream=True`) hand back the lazy generator;
+Starlette iterates it on its own threadpool, on a dedicated connection.
+"""
+import time, asyncio, functools, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncTiDB:
+    def __init__(self, tidb, max_workers=None, reserved=3):
+        self.tidb = tidb
+        self.max_workers = max_workers or max(1, tidb.pool.max_size - reserved)
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="tidb")
+        self.lock = threading.Lock()
+        self.pending = 0  # submitted and not finished, running or queued
+        self.calls = 0
+        self.queue_waits = deque(maxlen=1000)  # seconds between submit and start, recent calls
+
+    def __getattr__(self, name):
+        attr = getattr(self.tidb, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        setattr(self, name, call)  # build each wrapper once
+        return call
+
+    async def run(self, fn, *args, **kwargs):
+        """Run any blocking DB callable on the executor"""
+        submitted = time.monotonic()
+
+        def job():
+            self.queue_waits.append(time.monotonic() - submitted)
+            return fn(*args, **kwargs)
+
+        with self.lock:
+            self.pending += 1
+            self.calls += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, job)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        waits = sorted(self.queue_waits)
+        with self.lock:
+            pending = self.pending
+        return {"workers": self.max_workers, "running": min(pending, self.max_workers),
+                "queued": max(0, pending - self.max_workers), "calls": self.calls,
+                "queue_ms_p50": round(1000 * waits[len(waits) // 2], 2) if waits else 0.0,
+                "queue_ms_p99": round(1000 * waits[int(len(waits) * 0.99)], 2) if waits else 0.0}
@@ -0,0 +1,106 @@
+import os, re, zlib
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from embed_cache import normalize
+
+class EmbeddingBackend:
+    """Turns a batch of texts into float32 vectors.
+
+    `name` is stored with every vector in events_embeddings.backend; vectors
+    are only comparable with vectors carrying the same name. `remote` backends
+    pay a network round trip per call and sit behind the embedding cache.
+    """
+    name = "base"
+    remote = False
+
+    def embed(self, texts: list[str]) -> list[np.ndarray]:
+        raise NotImplementedError
+
+class OpenAIBackend(EmbeddingBackend):
+    remote = True
+
+    def __init__(self, model):
+        import openai
+        openai.api_key = os.environ.get('OPENAI_API_KEY')
+        self.client = openai
+        self.model = model
+        self.name = f"openai:{model}"
+
+    def embed(self, texts):
+        data = self.client.embeddings.create(model=self.model, input=[t or "" for t in texts]).data
+        return [np.asarray(d.embedding, dtype=np.float32) for d in sorted(data, key=lambda d: d.index)]
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_.:/-]*|<[A-Z]+>")
+
+def _mix(h):
+    # murmur3 finalizer on uint32 so neighbouring n-grams spread over the buckets
+    h ^= h >> np.uint32(16)
+    h *= np.uint32(0x85EBCA6B)
+    h ^= h >> np.uint32(13)
+    h *= np.uint32(0xC2B2AE35)
+    h ^= h >> np.uint32(16)
+    return h
+
+class HashingBackend(EmbeddingBackend):
+    """In-process feature-hashing vectorizer, no network and no model files.
+
+    Each line is masked with `normalize()` and lower-cased; its character
+    n-grams (hashed with NumPy over the whole batch at once) and its words
+    (crc32) are folded into `dim` signed buckets and the result is L2
+    normalized. Lines sharing most of their wording land close together, which
+    is what log search and clustering need; it does not capture synonyms.
+    """
+
+    def __init__(self, dim=512, ngrams=(3, 4), word_weight=2.0):
+        self.dim = dim
+        self.ngrams = ngrams
+        self.word_weight = word_weight
+        self.name = f"hash-ngram-v1:{dim}"
+
+    def _char_features(self, texts):
+        data = np.frombuffer(b"\0".join(t.encode("utf-8", "replace") for t in texts), dtype=np.uint8)
+        row_of = np.repeat(np.arange(len(texts)), [len(t.encode("utf-8", "replace")) + 1 for t in texts])[:len(data)]
+        rows, hashes = [], []
+        for n in self.ngrams:
+            if len(data) < n:
+                continue
+            win = sliding_window_view(data, n).astype(np.uint32)
+            h = np.full(len(win), 2166136261, dtype=np.uint32)  # FNV-1a over the window
+            for j in range(n):
+                h ^= win[:, j]
+                h *= np.uint32(16777619)
+            h ^= np.uint32(n)
+            ok = (row_of[:len(win)] == row_of[n - 1:]) & (win != 0).all(axis=1)
+            rows.append(row_of[:len(win)][ok])
+            hashes.append(_mix(h[ok]))
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32)
+        return np.concatenate(rows), np.concatenate(hashes)
+
+    def embed(self, texts):
+        texts = [normalize(t or "").lower() for t in texts]
+        rows, hashes = self._char_features(texts)
+        weights = np.ones(len(hashes), dtype=np.float32)
+        w_rows, w_hashes = [], []
+        for i, t in enumerate(texts):
+            for w in _WORD.findall(t):
+                w_rows.append(i)
+                w_hashes.append(zlib.crc32(w.encode()))
+        if w_rows:
+            rows = np.concatenate([rows, np.asarray(w_rows)])
+            hashes = np.concatenate([hashes, _mix(np.asarray(w_hashes, dtype=np.uint32))])
+            weights = np.concatenate([weights, np.full(len(w_rows), self.word_weight, dtype=np.float32)])
+        sign = np.where(hashes >> np.uint32(31), -1.0, 1.0).astype(np.float32)
+        flat = rows.astype(np.int64) * self.dim + (hashes % np.uint32(self.dim)).astype(np.int64)
+        m = np.bincount(flat, weights=sign * weights, minlength=len(texts) * self.dim)
+        m = m.astype(np.float32).reshape(len(texts), self.dim)
+        m /= np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+        return list(m)
+
+def get_backend(kind: str, model: str = None) -> EmbeddingBackend:
+    """Backend selected by EMBED_BACKEND: `openai` or `hash`"""
+    if kind == "openai":
+        return OpenAIBackend(model or 'text-embedding-3-small')
+    if kind == "hash":
+        return HashingBackend(dim=int(os.environ.get('EMBED_HASH_DIM', 512)))
+    raise RuntimeError(f"unknown EMBED_BACKEND {kind!r} (expected 'openai' or 'hash')")
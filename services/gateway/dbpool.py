@@ -0,0 +1,168 @@
+"""Thread-safe pymysql connection pool shared by the whole gateway.
+
+`pool.connection()` is a drop-in for `pymysql.connect(...)` in a `with`
+statement: it yields a live connection and, on exit, rolls back whatever the
+block left open (so the next borrower starts on a fresh snapshot) and hands
+the connection back instead of closing it. Connections idle for more than
+`ping_after` seconds are pinged on checkout, and any connection older than
+`max_lifetime` is closed rather than reused, so TiDB restarts, load-balancer
+idle timeouts and rolling upgrades never surface as request errors.
+"""
+import time, threading, logging
+from collections import deque
+from contextlib import contextmanager
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+logger = logging.getLogger("tim8.dbpool")
+
+class PoolTimeout(Exception):
+    pass
+
+class _Entry:
+    __slots__ = ("conn", "created", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = self.last_used = time.monotonic()
+
+class Pool:
+    def __init__(self, connect, min_size=2, max_size=10, max_lifetime=1800, ping_after=30, timeout=10):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self.idle: deque[_Entry] = deque()
+        self.size = 0  # open connections, idle + checked out
+        self.cond = threading.Condition()
+        self.counters = {"checkouts": 0, "created": 0, "closed": 0, "pings": 0, "broken": 0,
+                         "expired": 0, "waits": 0, "timeouts": 0}
+        self.waits = deque(maxlen=1000)  # recent checkout waits, seconds
+        self.connect_seconds = 0.0
+
+    def _open(self):
+        t0 = time.monotonic()
+        conn = self.connect()
+        self.connect_seconds += time.monotonic() - t0
+        self.counters["created"] += 1
+        return _Entry(conn)
+
+    def _close(self, entry, reason):
+        self.counters[reason] += 1
+        self.counters["closed"] += 1
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def warm(self):
+        """Open connections up to min_size (called at startup, off the event loop)"""
+        while True:
+            with self.cond:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            try:
+                entry = self._open()
+            except Exception:
+                with self.cond:
+                    self.size -= 1
+                raise
+            with self.cond:
+                self.idle.append(entry)
+                self.cond.notify()
+
+    def _checkout(self):
+        t0 = time.monotonic()
+        deadline = t0 + self.timeout
+        with self.cond:
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout(f"no TiDB connection free within {self.timeout}s ({self.size} open)")
+                self.counters["waits"] += 1
+                self.cond.wait(remaining)
+            entry = self.idle.pop() if self.idle else None  # LIFO keeps the warmest connections busy
+            if entry is None:
+                self.size += 1
+            self.counters["checkouts"] += 1
+        self.waits.append(time.monotonic() - t0)
+        if entry is None:
+            try:
+                return self._open()
+            except Exception:
+                self._release_slot()
+                raise
+        now = time.monotonic()
+        if now - entry.created > self.max_lifetime:
+            self._close(entry, "expired")
+            return self._replace()
+        if now - entry.last_used > self.ping_after:
+            self.counters["pings"] += 1
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception:
+                self._close(entry, "broken")
+                return self._replace()
+        return entry
+
+    def _replace(self):
+        try:
+            return self._open()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self.cond:
+            self.size -= 1
+            self.cond.notify()
+
+    def _checkin(self, entry, broken=False):
+        broken = broken or not entry.conn.open
+        if not broken:
+            try:
+                if entry.conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    entry.conn.rollback()
+            except Exception:
+                broken = True
+        if broken or time.monotonic() - entry.created > self.max_lifetime:
+            self._close(entry, "broken" if broken else "expired")
+            self._release_slot()
+            return
+        entry.last_used = time.monotonic()
+        with self.cond:
+            self.idle.append(entry)
+            self.cond.notify()
+
+    @contextmanager
+    def connection(self):
+        entry = self._checkout()
+        broken = False
+        try:
+            yield entry.conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            broken = True  # lost or desynchronised; never hand it out again
+            raise
+        finally:
+            self._checkin(entry, broken)
+
+    def close(self):
+        with self.cond:
+            entries, self.idle = list(self.idle), deque()
+            self.size -= len(entries)
+        for e in entries:
+            self._close(e, "expired")
+
+    def stats(self):
+        waits = sorted(self.waits)
+        with self.cond:
+            idle, size = len(self.idle), self.size
+        return {"size": size, "idle": idle, "in_use": size - idle, "min_size": self.min_size,
+                "max_size": self.max_size, **self.counters,
+                "avg_connect_ms": round(1000 * self.connect_seconds / max(self.counters["created"], 1), 1),
+                "wait_ms_avg": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+                "wait_ms_p99": round(1000 * waits[int(len(waits) * 0.99)], 2) if waits else 0.0}
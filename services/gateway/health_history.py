@@ -0,0 +1,79 @@
+"""Cluster health over time: timelines from health_rollups, transitions, tiered retention.
+
+Rollups are written by health_state.py with every report: status counts per
+(workspace, cluster, component_type) summed into the current minute and hour.
+A timeline reads one tier with a single primary-key range read. It uses
+minutes for short windows and hours otherwise, and sums the component types
+of each bucket. Each point gives the average share of components in each
+status and the worst status seen, which is enough for a sparkline.
+
+Minute rollups are kept HEALTH_MINUTE_DAYS, hour rollups HEALTH_HOUR_DAYS and
+transitions HEALTH_TRANSITIONS_DAYS. `prune` deletes past those in bounded
+chunks.
+"""
+import os, time, logging, datetime as dt
+from health_state import STATUSES
+
+logger = logging.getLogger("tim8.health_history")
+
+MINUTE_DAYS = float(os.environ.get('HEALTH_MINUTE_DAYS', 2))
+HOUR_DAYS = float(os.environ.get('HEALTH_HOUR_DAYS', 90))
+TRANSITIONS_DAYS = float(os.environ.get('HEALTH_TRANSITIONS_DAYS', 30))
+MINUTE_MAX_WINDOW = 6 * 3600  # longer windows read hours
+PRUNE_CHUNK = int(os.environ.get('HEALTH_PRUNE_CHUNK', 5000))
+
+def resolution_for(since: dt.datetime, until: dt.datetime, now: dt.datetime) -> int:
+    if (until - since).total_seconds() <= MINUTE_MAX_WINDOW and since >= now - dt.timedelta(days=MINUTE_DAYS):
+        return 60
+    return 3600
+
+def _point(t, counts, samples):
+    total = sum(counts)
+    worst = next((s for s, n in zip(("critical", "warning", "unknown", "healthy"), (counts[2], counts[1], counts[3], counts[0])) if n), None)
+    return {'t': t, 'samples': samples, 'status': worst,
+            **{s: round(n / total, 4) if total else 0.0 for s, n in zip(STATUSES, counts)}}
+
+def timeline(cur, workspace, since, until, resolution=None, cluster=None):
+    """{cluster: [point, ...]} oldest first, for one cluster or every cluster of the workspace"""
+    cur.execute("SELECT NOW() AS now")
+    now = cur.fetchone()['now']
+    until = until or now
+    res = resolution or resolution_for(since, until, now)
+    sql = """SELECT cluster_name, bucket_start, SUM(healthy) AS healthy, SUM(warning) AS warning, SUM(critical) AS critical,
+                    SUM(unknown) AS unknown, MAX(samples) AS samples
+             FROM health_rollups WHERE workspace=%s""" + (" AND cluster_name=%s" if cluster else "") + """
+               AND resolution=%s AND bucket_start >= %s AND bucket_start < %s
+             GROUP BY cluster_name, bucket_start ORDER BY cluster_name, bucket_start"""
+    cur.execute(sql, [workspace] + ([cluster] if cluster else []) + [res, since, until])
+    out = {}
+    for r in cur.fetchall():
+        counts = [int(r[s]) for s in STATUSES]
+        out.setdefault(r['cluster_name'], []).append(_point(r['bucket_start'], counts, int(r['samples'])))
+    return res, out
+
+def transitions(cur, workspace, cluster, since, until=None, limit=500):
+    """Status changes of a cluster's components, newest first"""
+    cur.execute("""SELECT component, component_type, from_status, to_status, ts FROM health_transitions
+                   WHERE workspace=%s AND cluster_name=%s AND ts >= %s""" + (" AND ts < %s" if until else "")
+                + " ORDER BY ts DESC LIMIT %s", [workspace, cluster, since] + ([until] if until else []) + [limit])
+    return cur.fetchall()
+
+def prune(conn, pause=0.05) -> dict:
+    """Delete history past each tier's retention, PRUNE_CHUNK rows per statement and transaction"""
+    deleted = {}
+    jobs = (('minute_rollups', "DELETE FROM health_rollups WHERE resolution=60 AND bucket_start < NOW() - INTERVAL %s SECOND", MINUTE_DAYS),
+            ('hour_rollups', "DELETE FROM health_rollups WHERE resolution=3600 AND bucket_start < NOW() - INTERVAL %s SECOND", HOUR_DAYS),
+            ('transitions', "DELETE FROM health_transitions WHERE ts < NOW() - INTERVAL %s SECOND", TRANSITIONS_DAYS))
+    with conn.cursor() as cur:
+        for name, sql, days in jobs:
+            deleted[name] = 0
+            while True:
+                cur.execute(sql + " LIMIT %s", (int(days * 86400), PRUNE_CHUNK))
+                conn.commit()
+                deleted[name] += cur.rowcount
+                if cur.rowcount < PRUNE_CHUNK:
+                    break
+                time.sleep(pause)
+    if any(deleted.values()):
+        logger.info(f"Pruned health history: {deleted}")
+    return deleted
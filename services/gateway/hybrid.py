@@ -0,0 +1,73 @@
+"""Fusion, dedup and highlighting for hybrid (lexical + semantic) log search.
+
+The gateway runs the two retrieval legs concurrently, each under its own
+time budget, and hands whatever came back to `fuse`. Reciprocal rank fusion
+only looks at ranks, so tf-idf scores and cosine similarities never have to
+be put on one scale.
+"""
+import re
+from embed_cache import normalize
+from search_index import parse_query
+from textindex import words
+
+RRF_K = 60
+_WORD = re.compile(r"[A-Za-z0-9_]+(?:[.\-/:][A-Za-z0-9_]+)*")
+_PARTS = re.compile(r"[.\-/:]")
+
+def rrf(rankings: dict, k: int = RRF_K) -> dict:
+    """{leg: [id, ...] best first} -> {id: fused score}"""
+    fused = {}
+    for ids in rankings.values():
+        for rank, eid in enumerate(ids):
+            fused[eid] = fused.get(eid, 0.0) + 1.0 / (k + rank + 1)
+    return fused
+
+def matcher(q: str):
+    """Predicate telling whether a word of a log line matches a word, phrase word or prefix of `q`"""
+    terms, phrases, prefixes = parse_query(q)
+    exact = set(terms) | {t for p in phrases for t in p} | set(words(q))
+
+    def match(word):
+        w = word.lower()
+        parts = [w] + _PARTS.split(w)
+        return any(p in exact for p in parts) or any(p.startswith(x) for p in parts for x in prefixes)
+    return match
+
+def highlight(text: str, match, width: int = 300):
+    """Snippet of at most `width` chars around the first match, with [start, end) offsets of matches"""
+    text = text or ""
+    spans = [(m.start(), m.end()) for m in _WORD.finditer(text) if match(m.group(0))]
+    start = max(0, spans[0][0] - width // 4) if spans and spans[0][1] > width else 0
+    lead = "…" if start else ""
+    snippet = text[start:start + width]
+    marks = [[s - start + len(lead), e - start + len(lead)] for s, e in spans if s >= start and e <= start + len(snippet)]
+    return lead + snippet, marks
+
+def fuse(q: str, legs: dict, events: dict, k: int = 10):
+    """Fused, deduped results. `legs` maps leg name -> ranked event ids, `events` maps id -> raw_events row
+    (with body_text). Lines that normalize to the same text in the same (cluster, namespace, app) collapse
+    into their best-ranked line, which reports `repeats` and the ids it stands for."""
+    fused = rrf(legs)
+    match = matcher(q)
+    ranks = {leg: {eid: i + 1 for i, eid in enumerate(ids)} for leg, ids in legs.items()}
+    groups, out = {}, []
+    for eid in sorted(fused, key=fused.get, reverse=True):
+        row = events.get(eid)
+        if row is None:
+            continue  # pruned since it was indexed
+        key = (row.get('cluster'), row.get('namespace'), row.get('app'), normalize(row.get('body_text') or ''))
+        if key in groups:
+            g = groups[key]
+            g['repeats'] += 1
+            g['duplicate_ids'].append(eid)
+            continue
+        if len(out) >= k:
+            continue  # still counted as a repeat of a shown line if it matches one
+        body = row.get('body_text') or ''
+        snippet, marks = highlight(body, match)
+        hit = {key_: row[key_] for key_ in ('id', 'cluster', 'namespace', 'app', 'pod', 'level', 'ts') if key_ in row}
+        hit.update(snippet=snippet, highlights=marks, score=round(fused[eid], 6),
+                   ranks={leg: r[eid] for leg, r in ranks.items() if eid in r}, repeats=0, duplicate_ids=[])
+        groups[key] = hit
+        out.append(hit)
+    return out
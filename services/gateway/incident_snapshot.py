@@ -0,0 +1,97 @@
+"""One read of everything the incident agents look at, shared by all of them.
+
+The detective, context, runbook and remediator agents used to each open
+their own TiDB connections and re-read the same rows: the incident, the
+cluster's health, recent logs and past incidents. `build` reads the union of
+what they use on one pooled connection, inside one consistent-snapshot
+transaction. The gateway then sends the result inline with each agent call.
+
+Each section is a superset of what any single agent used to query, so an
+agent gets exactly its old rows by filtering a section:
+
+- health: the 20 most recently checked components, plus the 10 most recent
+  warning/critical ones, newest first.
+- similar_incidents: the 5 most recent incidents on the same cluster,
+  namespace or app, plus the 10 most recent resolved ones and the 10 most
+  recent with a resolution, newest first.
+
+Agents use the snapshot only when its `version` is one they know. Without
+it they query for themselves, as before.
+"""
+import time, json, decimal, datetime as dt
+
+VERSION = 1
+DEFAULT_WORKSPACE = 'TiM8-Local'
+
+_SIMILAR = """SELECT id, title, cluster, namespace, app, status, mttr_seconds, resolution, created_at FROM incidents
+              WHERE (cluster=%s OR namespace=%s OR app=%s) AND id != %s"""
+
+def _json(v):
+    if isinstance(v, (dt.datetime, dt.date)):
+        return v.isoformat()
+    if isinstance(v, decimal.Decimal):
+        return float(v)
+    return str(v)
+
+def build(cur, iid):
+    """The snapshot of incident `iid` as plain JSON types, or None if there is no such incident. The
+    caller ends the transaction."""
+    t0 = time.monotonic()
+    queries = 0
+
+    def rows(sql, *params):
+        nonlocal queries
+        queries += 1
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+    cur.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+    found = rows("SELECT * FROM incidents WHERE id=%s", iid)
+    if not found:
+        return None
+    inc = found[0]
+    ws = inc.get('workspace') or DEFAULT_WORKSPACE
+    scope = (inc['cluster'], inc['namespace'], inc['app'], iid)
+    snap = {'version': VERSION, 'incident_id': iid, 'incident': inc}
+    snap['health'] = rows("""
+        (SELECT component, component_type, status, details, last_check FROM cluster_health
+         WHERE cluster_name=%s AND workspace=%s ORDER BY last_check DESC LIMIT 20)
+        UNION
+        (SELECT component, component_type, status, details, last_check FROM cluster_health
+         WHERE cluster_name=%s AND workspace=%s AND status IN ('warning', 'critical') ORDER BY last_check DESC LIMIT 10)
+        ORDER BY last_check DESC""", inc['cluster'], ws, inc['cluster'], ws)
+    snap['health_counts'] = rows("""
+        SELECT component_type, status, COUNT(*) AS count FROM cluster_health
+        WHERE cluster_name=%s AND workspace=%s GROUP BY component_type, status""", inc['cluster'], ws)
+    snap['health_changes'] = rows("""
+        SELECT component, component_type, from_status, to_status, ts FROM health_transitions
+        WHERE workspace=%s AND cluster_name=%s AND ts >= NOW() - INTERVAL 6 HOUR
+        ORDER BY ts DESC LIMIT 30""", ws, inc['cluster'])
+    snap['similar_incidents'] = rows(f"""
+        ({_SIMILAR} ORDER BY created_at DESC LIMIT 5)
+        UNION ({_SIMILAR} AND status='resolved' ORDER BY created_at DESC LIMIT 10)
+        UNION ({_SIMILAR} AND status='resolved' AND resolution IS NOT NULL AND resolution != '' ORDER BY created_at DESC LIMIT 10)
+        ORDER BY created_at DESC""", *scope * 3)
+    snap['log_templates'] = rows("""
+        SELECT template, count, first_seen, last_seen FROM log_templates
+        WHERE namespace=%s AND app=%s AND last_seen >= NOW() - INTERVAL 1 HOUR
+        ORDER BY count DESC LIMIT 30""", inc['namespace'], inc['app'])
+    snap['recent_logs'] = rows("""
+        SELECT ts, level, body_text FROM raw_events WHERE namespace=%s AND app=%s
+        ORDER BY ts DESC LIMIT %s""", inc['namespace'], inc['app'], 10 if snap['log_templates'] else 50)
+    snap['events_in_scope'] = rows("SELECT COUNT(*) AS cnt FROM raw_events WHERE namespace=%s AND app=%s",
+                                   inc['namespace'], inc['app'])[0]['cnt']
+    found = rows("SELECT name, description, clusters FROM workspaces WHERE name=%s", ws)
+    snap['workspace'] = found[0] if found else None
+    snap['history_30d'] = rows("""
+        SELECT COUNT(*) AS total_incidents, AVG(mttr_seconds) AS avg_mttr,
+               COUNT(CASE WHEN status='resolved' THEN 1 END) AS resolved_count,
+               COUNT(CASE WHEN status='open' THEN 1 END) AS open_count
+        FROM incidents WHERE workspace=%s AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)""", ws)[0]
+    found = rows("""SELECT avg_mttr_seconds, incident_count, p50_seconds, p90_seconds, calculated_at FROM mttr_stats
+                    WHERE workspace=%s AND cluster_name=''""", ws)
+    snap['mttr_stats'] = found[0] if found else None
+    snap['built_at'] = dt.datetime.utcnow().isoformat()
+    snap['queries'] = queries
+    snap['ms'] = round((time.monotonic() - t0) * 1000)
+    return json.loads(json.dumps(snap, default=_json))
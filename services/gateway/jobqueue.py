@@ -0,0 +1,73 @@
+"""Bounded pool of asyncio workers for the gateway's background jobs.
+
+`JobQueue(handler, workers)` runs `await handler(key)` for submitted keys,
+at most `workers` at a time. A key that is already queued or running is not
+queued again, so a resume pass cannot start a second copy of a job on the
+same replica. The queue lives in memory. The caller persists what it needs
+to find unfinished jobs after a restart, and `pending` lists the keys this
+replica still holds, so it can keep their leases alive.
+"""
+import time, asyncio, logging
+
+logger = logging.getLogger("tim8.jobqueue")
+
+class JobQueue:
+    def __init__(self, handler, workers=4, maxsize=1000, name="jobs"):
+        self.handler = handler
+        self.workers = workers
+        self.name = name
+        self.queue = asyncio.Queue(maxsize)
+        self.pending = set()  # queued or running
+        self.tasks = []
+        self.counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0}
+        self.running = 0
+        self.last_ms = None
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker(), name=f"{self.name}-{i}") for i in range(self.workers)]
+
+    @property
+    def free(self) -> int:
+        """How many more keys `submit` would accept right now"""
+        return self.queue.maxsize - self.queue.qsize() if self.queue.maxsize > 0 else 1 << 30
+
+    def submit(self, key) -> bool:
+        """Queue `key` unless it is already pending; False when it is, or when the queue is full"""
+        if key in self.pending:
+            return False
+        try:
+            self.queue.put_nowait(key)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            return False
+        self.pending.add(key)
+        self.counters["submitted"] += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            key = await self.queue.get()
+            t0 = time.monotonic()
+            self.running += 1
+            try:
+                await self.handler(key)
+                self.counters["done"] += 1
+            except Exception:
+                self.counters["failed"] += 1
+                logger.exception(f"{self.name} job {key} failed")
+            finally:
+                self.running -= 1
+                self.pending.discard(key)
+                self.queue.task_done()
+                self.last_ms = round((time.monotonic() - t0) * 1000)
+
+    async def stop(self):
+        """Cancel the workers; jobs they were running are left for the caller's resume logic"""
+        for t in self.tasks:
+            t.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def stats(self):
+        return {"workers": self.workers, "running": self.running, "queued": self.queue.qsize(),
+                "last_ms": self.last_ms, **self.counters}
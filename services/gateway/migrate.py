@@ -0,0 +1,149 @@
+"""Versioned schema migrations for TiDB.
+
+Migrations are the numbered files in migrations/ (`0002_gateway_tables.sql`). Each one is applied once, in
+order, and recorded in `schema_migrations` with a checksum of its text. The gateway runs this at startup
+(SCHEMA_MIGRATE=startup, the default) and it can run on its own before a rollout:
+
+  python migrate.py            # apply pending migrations
+  python migrate.py --status   # list applied and pending versions
+  python migrate.py --target 3 # stop after version 3
+
+Replicas starting together serialize on a named lock, and the losers find nothing left to apply. TiDB
+commits DDL implicitly, so a migration is not atomic: write statements that can be re-run (IF NOT EXISTS,
+MODIFY) and a migration that failed half way is simply applied again from the top.
+"""
+import os, re, sys, time, hashlib, logging, argparse
+
+logger = logging.getLogger("tim8.migrate")
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+LOCK_NAME = "tim8_schema_migrations"
+_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+class Migration:
+    def __init__(self, version, name, sql):
+        self.version, self.name, self.sql = version, name, sql
+        self.checksum = hashlib.sha1(sql.encode()).hexdigest()
+
+    def statements(self):
+        return split_statements(self.sql)
+
+def split_statements(sql) -> list[str]:
+    """Statements of a SQL script, comments dropped. Only a ';' outside quotes and comments ends a statement."""
+    out, cur, i, n = [], [], 0, len(sql)
+    while i < n:
+        c = sql[i]
+        if c in "'\"`":
+            j = i + 1
+            while j < n and sql[j] != c:
+                j += 2 if sql[j] == "\\" else 1
+            cur.append(sql[i:j + 1])
+            i = j + 1
+        elif sql.startswith("--", i) or c == "#":
+            j = sql.find("\n", i)
+            i = n if j < 0 else j  # keep the newline
+        elif sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            cur.append(" ")
+            i = n if j < 0 else j + 2
+        elif c == ";":
+            out.append("".join(cur))
+            cur = []
+            i += 1
+        else:
+            cur.append(c)
+            i += 1
+    out.append("".join(cur))
+    return [s.strip() for s in out if s.strip()]
+
+def discover(path=MIGRATIONS_DIR) -> list[Migration]:
+    out = []
+    for fn in sorted(os.listdir(path)):
+        m = _FILE.match(fn)
+        if m:
+            with open(os.path.join(path, fn)) as f:
+                out.append(Migration(int(m.group(1)), m.group(2), f.read()))
+    versions = [m.version for m in out]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"duplicate migration versions in {path}: {versions}")
+    return sorted(out, key=lambda m: m.version)
+
+def _ensure_table(cur):
+    cur.execute("""
+      CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(128) NOT NULL,
+        checksum CHAR(40) NOT NULL,
+        seconds DOUBLE,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+      )""")
+
+def applied(cur) -> dict:
+    _ensure_table(cur)
+    cur.execute("SELECT version, name, checksum, seconds, applied_at FROM schema_migrations ORDER BY version")
+    return {r['version']: r for r in cur.fetchall()}
+
+def status(conn, migrations=None) -> list[dict]:
+    migrations = migrations if migrations is not None else discover()
+    with conn.cursor() as cur:
+        done = applied(cur)
+    out = []
+    for m in migrations:
+        r = done.get(m.version)
+        out.append({'version': m.version, 'name': m.name, 'applied_at': r['applied_at'] if r else None,
+                    'modified': bool(r) and r['checksum'] != m.checksum})
+    return out
+
+def migrate(conn, target=None, migrations=None, lock_timeout=60) -> list[int]:
+    """Apply pending migrations up to `target` (all by default); returns the versions applied"""
+    migrations = migrations if migrations is not None else discover()
+    ran = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT GET_LOCK(%s, %s) AS ok", (LOCK_NAME, lock_timeout))
+        if not cur.fetchone()['ok']:
+            raise TimeoutError(f"schema migration lock not acquired within {lock_timeout}s")
+        try:
+            done = applied(cur)
+            conn.commit()
+            for m in migrations:
+                if target is not None and m.version > target:
+                    break
+                if m.version in done:
+                    if done[m.version]['checksum'] != m.checksum:
+                        logger.warning(f"migration {m.version}_{m.name} changed after it was applied; not re-run")
+                    continue
+                t0 = time.monotonic()
+                for stmt in m.statements():
+                    cur.execute(stmt)
+                cur.execute("INSERT INTO schema_migrations(version, name, checksum, seconds) VALUES(%s,%s,%s,%s)",
+                            (m.version, m.name, m.checksum, round(time.monotonic() - t0, 3)))
+                conn.commit()
+                ran.append(m.version)
+                logger.info(f"applied migration {m.version}_{m.name} in {time.monotonic() - t0:.1f}s")
+        finally:
+            cur.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    return ran
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    ap = argparse.ArgumentParser(description="Apply TiDB schema migrations")
+    ap.add_argument("--status", action="store_true", help="list applied and pending migrations, change nothing")
+    ap.add_argument("--target", type=int, help="highest version to apply")
+    args = ap.parse_args()
+
+    import pymysql
+    from tidb import TiDB
+    conn = pymysql.connect(**TiDB().conn_args)
+    try:
+        if args.status:
+            for r in status(conn):
+                state = f"applied {r['applied_at']}" if r['applied_at'] else "pending"
+                print(f"{r['version']:>5}  {r['name']:<32} {state}{'  (modified since)' if r['modified'] else ''}")
+            return
+        ran = migrate(conn, args.target)
+        print(f"applied {len(ran)} migration(s): {ran}" if ran else "schema is up to date")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+-- db/schema.sql
+-- Baseline schema, applied as version 1 by the gateway migrator (services/gateway/migrate.py), which
+-- keeps a verbatim copy in services/gateway/migrations/0001_baseline.sql. Later schema changes are new
+-- numbered files in that directory, not edits here.
+CREATE TABLE IF NOT EXISTS raw_events (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  cluster VARCHAR(64),
+  namespace VARCHAR(128),
+  app VARCHAR(128),
+  pod VARCHAR(128),
+  type ENUM('log','metric','trace') NOT NULL,
+  ts TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6),
+  level VARCHAR(16),
+  body_json JSON,
+  body_text TEXT,
+  template_id BIGINT,
+  INDEX idx_template_ts (template_id, ts),
+  INDEX idx_ts (ts),
+  INDEX idx_cluster_ts (cluster, ts)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- upgrade path for databases created before log templates
+ALTER TABLE raw_events ADD COLUMN IF NOT EXISTS template_id BIGINT;
+CREATE INDEX IF NOT EXISTS idx_template_ts ON raw_events (template_id, ts);
+-- retention prunes by age, per cluster
+CREATE INDEX IF NOT EXISTS idx_ts ON raw_events (ts);
+CREATE INDEX IF NOT EXISTS idx_cluster_ts ON raw_events (cluster, ts);
+
+-- Drain templates mined online by the ingestion service, one row per (cluster, namespace, app) template
+CREATE TABLE IF NOT EXISTS log_templates (
+  id BIGINT PRIMARY KEY,
+  cluster VARCHAR(64),
+  namespace VARCHAR(128),
+  app VARCHAR(128),
+  template TEXT,
+  count BIGINT DEFAULT 0,
+  first_seen TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6),
+  last_seen TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6),
+  INDEX idx_scope_last_seen (namespace, app, last_seen)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS events_embeddings (
+  event_id BIGINT PRIMARY KEY,
+  embedding VARBINARY(8192), -- vecfmt-encoded (float32/float16/int8 + header) or legacy raw float32
+  backend VARCHAR(64) -- e.g. 'openai:text-embedding-3-small', 'hash-ngram-v1:512', NULL on rows from before backends were recorded
+);
+
+-- upgrade path: room for the 8-byte vecfmt header on float32 vectors, and the backend that produced each vector
+ALTER TABLE events_embeddings MODIFY embedding VARBINARY(8192);
+ALTER TABLE events_embeddings ADD COLUMN IF NOT EXISTS backend VARCHAR(64);
+
+-- Embedding cache keyed by sha1(model, normalized log template); warm tier behind the ingestion LRU
+CREATE TABLE IF NOT EXISTS embedding_cache (
+  template_hash CHAR(40) PRIMARY KEY,
+  model VARCHAR(64) NOT NULL,
+  template TEXT,
+  embedding VARBINARY(8192),
+  hits BIGINT DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_last_used (last_used_at)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+ALTER TABLE embedding_cache MODIFY embedding VARBINARY(8192);
+
+-- Inverted index over raw_events.body_text (services/ingestion/textindex.py), written with each ingest batch
+CREATE TABLE IF NOT EXISTS search_postings (
+  term VARCHAR(48) NOT NULL,
+  event_id BIGINT NOT NULL,
+  tf SMALLINT UNSIGNED NOT NULL,
+  ts TIMESTAMP(6) NOT NULL, -- copy of raw_events.ts so candidates come out newest first
+  PRIMARY KEY (term, event_id),
+  INDEX idx_term_ts (term, ts),
+  INDEX idx_event (event_id)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin;
+
+-- Document frequency per term; the '' row counts indexed events
+CREATE TABLE IF NOT EXISTS search_terms (
+  term VARCHAR(48) PRIMARY KEY,
+  df BIGINT NOT NULL DEFAULT 0
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin;
+
+CREATE TABLE IF NOT EXISTS runbooks (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  service VARCHAR(128),
+  title VARCHAR(255),
+  body TEXT,
+  tags JSON,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS incidents (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  status ENUM('open','mitigating','resolved') DEFAULT 'open',
+  title VARCHAR(255),
+  suspect VARCHAR(255),
+  cluster VARCHAR(64),
+  namespace VARCHAR(128),
+  app VARCHAR(128),
+  workspace VARCHAR(64),
+  summary TEXT,
+  resolution TEXT,
+  mttr_seconds BIGINT
+);
+-- keyset paging of recent incidents on (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_created ON incidents (created_at);
+CREATE INDEX IF NOT EXISTS idx_workspace_created ON incidents (workspace, created_at);
+
+CREATE TABLE IF NOT EXISTS workspaces (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  name VARCHAR(64) UNIQUE NOT NULL,
+  description TEXT,
+  clusters JSON,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS cluster_health (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  cluster_name VARCHAR(64) NOT NULL,
+  workspace VARCHAR(64) NOT NULL,
+  component VARCHAR(128) NOT NULL,
+  component_type ENUM('pod','node','service','deployment','namespace') NOT NULL,
+  status ENUM('healthy','warning','critical','unknown') DEFAULT 'unknown',
+  details JSON,
+  last_check TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  INDEX idx_cluster_workspace (cluster_name, workspace),
+  INDEX idx_last_check (last_check)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+-- keyset paging of a cluster's components on (last_check, id)
+CREATE INDEX IF NOT EXISTS idx_cluster_check ON cluster_health (cluster_name, workspace, last_check);
+
+-- Per-workspace ingest budget for each (cluster, namespace, pod); lines/s and burst size
+CREATE TABLE IF NOT EXISTS ingest_limits (
+  workspace VARCHAR(64) PRIMARY KEY,
+  rate_per_sec DOUBLE NOT NULL,
+  burst DOUBLE NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- raw_events TTL per workspace, applied by services/ingestion/retention.py
+CREATE TABLE IF NOT EXISTS retention_policies (
+  workspace VARCHAR(64) PRIMARY KEY,
+  raw_events_days INT NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS retention_runs (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  dry_run BOOLEAN NOT NULL,
+  rows_affected BIGINT,
+  bytes_affected BIGINT,
+  seconds DOUBLE,
+  details JSON
+);
+
+CREATE TABLE IF NOT EXISTS mttr_stats (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  workspace VARCHAR(64) NOT NULL,
+  cluster_name VARCHAR(64),
+  avg_mttr_seconds BIGINT,
+  incident_count INT DEFAULT 0,
+  period_start TIMESTAMP,
+  period_end TIMESTAMP,
+  calculated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_workspace_period (workspace, period_start, period_end)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- FT index on runbooks (TiDB supports MPP; emulate FT via inverted index on ngrams using TiDB parser or use external FTS like TiDB fulltext experimental)
+-- For hackathon: simple LIKE + tag match + vector similarity over embeddings of titles.
\ No newline at end of file
@@ -0,0 +1,42 @@
+-- Tables the gateway used to create inline on every write (clusters, enroll_tokens, cluster_health), and the
+-- indexes behind its hot reads. Each statement is re-runnable: databases that already got these tables from
+-- the old inline DDL are brought to the same definition.
+
+CREATE TABLE IF NOT EXISTS clusters (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  name VARCHAR(255),
+  workspace VARCHAR(255),
+  mode ENUM('agent','kubeconfig'),
+  kube_secret_ref VARCHAR(255),
+  namespaces JSON,
+  status ENUM('connected','error','unknown') DEFAULT 'unknown',
+  last_sync TIMESTAMP NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  UNIQUE KEY uniq_cluster (name, workspace)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+-- /api/clusters pages on (workspace, name); the poller lists kubeconfig clusters
+CREATE INDEX IF NOT EXISTS idx_workspace_name ON clusters (workspace, name);
+CREATE INDEX IF NOT EXISTS idx_mode ON clusters (mode);
+
+CREATE TABLE IF NOT EXISTS enroll_tokens (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  token VARCHAR(255) UNIQUE,
+  workspace VARCHAR(255),
+  expires_at TIMESTAMP NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+-- cleanup_expired_tokens deletes by expiry
+CREATE INDEX IF NOT EXISTS idx_expires ON enroll_tokens (expires_at);
+
+-- cluster_health: the inline DDL had no 'unknown' status and a free-form component_type, while the baseline
+-- ENUM rejected the types the poller writes ('workload', 'infrastructure'). Settle on the writers' values.
+ALTER TABLE cluster_health MODIFY status ENUM('healthy','warning','critical','unknown') NOT NULL DEFAULT 'unknown';
+ALTER TABLE cluster_health MODIFY component_type VARCHAR(32) NOT NULL DEFAULT '';
+-- the collector replaces one component's row at a time
+CREATE INDEX IF NOT EXISTS idx_cluster_component ON cluster_health (cluster_name, component);
+CREATE INDEX IF NOT EXISTS idx_cluster_workspace ON cluster_health (cluster_name, workspace);
+CREATE INDEX IF NOT EXISTS idx_cluster_check ON cluster_health (cluster_name, workspace, last_check);
+
+-- detective: resolved incidents newest first; gateway: latest MTTR row per workspace
+CREATE INDEX IF NOT EXISTS idx_status_created ON incidents (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_workspace_calculated ON mttr_stats (workspace, calculated_at);
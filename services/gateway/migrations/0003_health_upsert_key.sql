@@ -0,0 +1,13 @@
+-- cluster_health holds one row per (cluster, workspace, component), upserted in place by health_state.py
+-- instead of deleted and re-inserted on every report. state_hash lets a writer skip unchanged components.
+ALTER TABLE cluster_health ADD COLUMN IF NOT EXISTS state_hash CHAR(40);
+
+-- keep the newest row of any component reported twice under the old delete-then-insert writers
+DELETE h FROM cluster_health h JOIN cluster_health n
+  ON n.cluster_name = h.cluster_name AND n.workspace = h.workspace AND n.component = h.component
+ AND (n.last_check > h.last_check OR (n.last_check = h.last_check AND n.id > h.id));
+CREATE UNIQUE INDEX IF NOT EXISTS uniq_component ON cluster_health (cluster_name, workspace, component);
+
+-- covered by uniq_component; the collector no longer deletes by (cluster_name, component)
+DROP INDEX IF EXISTS idx_cluster_workspace ON cluster_health;
+DROP INDEX IF EXISTS idx_cluster_component ON cluster_health;
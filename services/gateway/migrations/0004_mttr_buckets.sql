@@ -0,0 +1,25 @@
+-- Incremental MTTR (mttr.py): per-day aggregates per (workspace, cluster), cluster_name '' = whole workspace.
+-- sketch is a log-scale histogram {bin: count} for percentiles.
+CREATE TABLE IF NOT EXISTS mttr_buckets (
+  workspace VARCHAR(64) NOT NULL,
+  cluster_name VARCHAR(64) NOT NULL DEFAULT '',
+  bucket_start DATETIME NOT NULL,
+  n BIGINT NOT NULL,
+  sum_seconds BIGINT NOT NULL,
+  min_seconds BIGINT,
+  max_seconds BIGINT,
+  sketch JSON,
+  PRIMARY KEY (workspace, cluster_name, bucket_start),
+  INDEX idx_bucket (bucket_start)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- mttr_stats becomes one current row per scope over the rolling window, upserted from mttr_buckets
+UPDATE mttr_stats SET cluster_name = '' WHERE cluster_name IS NULL;
+ALTER TABLE mttr_stats MODIFY cluster_name VARCHAR(64) NOT NULL DEFAULT '';
+ALTER TABLE mttr_stats ADD COLUMN IF NOT EXISTS p50_seconds BIGINT;
+ALTER TABLE mttr_stats ADD COLUMN IF NOT EXISTS p90_seconds BIGINT;
+DELETE s FROM mttr_stats s JOIN mttr_stats n
+  ON n.workspace = s.workspace AND n.cluster_name = s.cluster_name
+ AND (n.calculated_at > s.calculated_at OR (n.calculated_at = s.calculated_at AND n.id > s.id));
+CREATE UNIQUE INDEX IF NOT EXISTS uniq_scope ON mttr_stats (workspace, cluster_name);
+DROP INDEX IF EXISTS idx_workspace_calculated ON mttr_stats;
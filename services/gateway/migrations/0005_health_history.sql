@@ -0,0 +1,32 @@
+-- Cluster health history (health_state.py writes, health_history.py reads and prunes)
+
+-- Append-only log of component status changes; NULL from/to = component appeared/disappeared
+CREATE TABLE IF NOT EXISTS health_transitions (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  workspace VARCHAR(64) NOT NULL,
+  cluster_name VARCHAR(64) NOT NULL,
+  component VARCHAR(128) NOT NULL,
+  component_type VARCHAR(32) NOT NULL DEFAULT '',
+  from_status VARCHAR(16),
+  to_status VARCHAR(16),
+  ts TIMESTAMP(3) NOT NULL,
+  INDEX idx_cluster_ts (workspace, cluster_name, ts),
+  INDEX idx_ts (ts)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- Status counts summed over the reports of each minute (resolution 60) and hour (3600)
+CREATE TABLE IF NOT EXISTS health_rollups (
+  workspace VARCHAR(64) NOT NULL,
+  cluster_name VARCHAR(64) NOT NULL,
+  resolution INT NOT NULL,
+  bucket_start DATETIME NOT NULL,
+  component_type VARCHAR(32) NOT NULL DEFAULT '',
+  healthy INT NOT NULL DEFAULT 0,
+  warning INT NOT NULL DEFAULT 0,
+  critical INT NOT NULL DEFAULT 0,
+  unknown INT NOT NULL DEFAULT 0,
+  samples INT NOT NULL DEFAULT 0,
+  PRIMARY KEY (workspace, cluster_name, resolution, bucket_start, component_type),
+  INDEX idx_workspace_bucket (workspace, resolution, bucket_start),
+  INDEX idx_bucket (resolution, bucket_start)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
@@ -0,0 +1,11 @@
+-- One row per agent call made for an incident: outcome and latency of the fan-out
+CREATE TABLE IF NOT EXISTS agent_runs (
+  id BIGINT PRIMARY KEY AUTO_RANDOM,
+  incident_id BIGINT NOT NULL,
+  agent VARCHAR(32) NOT NULL,
+  status ENUM('ok','timeout','error') NOT NULL,
+  ms INT NOT NULL,
+  error TEXT,
+  created_at TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3),
+  INDEX idx_incident (incident_id, created_at)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
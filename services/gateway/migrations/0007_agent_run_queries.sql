@@ -0,0 +1,2 @@
+-- TiDB queries each agent ran for an incident; the 'snapshot' row is the gateway's shared read
+ALTER TABLE agent_runs ADD COLUMN IF NOT EXISTS queries INT;
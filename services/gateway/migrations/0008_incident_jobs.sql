@@ -0,0 +1,12 @@
+-- Background incident pipeline: one row per incident, its state machine and the replica running it.
+-- A job still queued/gathering/summarizing whose updated_at stops moving is taken over by another replica.
+CREATE TABLE IF NOT EXISTS incident_jobs (
+  incident_id BIGINT PRIMARY KEY,
+  state ENUM('queued','gathering','summarizing','done','failed') NOT NULL DEFAULT 'queued',
+  owner VARCHAR(128) NOT NULL,
+  attempts INT NOT NULL DEFAULT 1,
+  error TEXT,
+  created_at TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3),
+  updated_at TIMESTAMP(3) DEFAULT CURRENT_TIMESTAMP(3),
+  INDEX idx_state_updated (state, updated_at)
+) CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
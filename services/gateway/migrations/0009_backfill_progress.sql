@@ -0,0 +1,9 @@
+-- How far one-off backfills got, so a rerun resumes instead of rescanning. Rows are keyed by backfill name,
+-- e.g. 'search' for backfill_search.py, which walks raw_events newest first: everything at or after
+-- (cursor_ts, cursor_id) in that order has been handled. Delete the row to start over.
+CREATE TABLE IF NOT EXISTS backfill_progress (
+  name VARCHAR(64) PRIMARY KEY,
+  cursor_ts TIMESTAMP(6) NOT NULL,
+  cursor_id BIGINT NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
@@ -0,0 +1,165 @@
+"""Incrementally maintained MTTR statistics.
+
+Resolving an incident adds its time-to-resolve to two rows of `mttr_buckets`,
+one for its (workspace, cluster) and one for the whole workspace
+(cluster_name ''), in the day it was resolved. Each row holds count, sum,
+min, max and a log-scale histogram sketch. The sketch is {bin: count} with
+bins GAMMA apart, so a percentile read from it is within ~2% of the true
+value, and sketches of different days merge by adding counts.
+
+`mttr_stats` keeps one current row per scope, over the last WINDOW_DAYS. It
+is recomputed from at most WINDOW_DAYS buckets whenever a resolve touches
+the scope, and by a periodic refresh as the window slides. Reads never
+aggregate over `incidents`.
+
+  python mttr.py --backfill   # rebuild buckets from already-resolved incidents, then refresh
+  python mttr.py --refresh    # recompute mttr_stats from the buckets
+"""
+import os, json, math, logging, argparse, datetime as dt
+
+logger = logging.getLogger("tim8.mttr")
+
+GAMMA = 1.04
+WINDOW_DAYS = int(os.environ.get('MTTR_WINDOW_DAYS', 30))
+DEFAULT_WORKSPACE = os.environ.get('DEFAULT_WORKSPACE', 'TiM8-Local')
+
+def bin_of(seconds) -> int:
+    return math.ceil(math.log(max(float(seconds), 1.0), GAMMA))
+
+def value_of(b) -> float:
+    # midpoint (in relative terms) of (GAMMA^(b-1), GAMMA^b]
+    return 2 * GAMMA ** int(b) / (GAMMA + 1)
+
+def quantile(sketch: dict, q: float):
+    n = sum(sketch.values())
+    if not n:
+        return None
+    rank, seen = q * (n - 1), 0
+    for b in sorted(sketch, key=int):
+        seen += sketch[b]
+        if seen > rank:
+            return value_of(b)
+
+def bucket_of(ts: dt.datetime) -> dt.datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _sketch(raw) -> dict:
+    return {k: int(v) for k, v in (json.loads(raw) if isinstance(raw, str) else raw or {}).items()}
+
+def record(cur, workspace, cluster, seconds, resolved_at):
+    """Add one resolved incident to its cluster and workspace buckets (caller commits)"""
+    b = str(bin_of(seconds))
+    day = bucket_of(resolved_at)
+    scopes = [cluster, ''] if cluster else ['']  # an incident without a cluster only counts workspace-wide
+    cur.execute(
+        "INSERT INTO mttr_buckets(workspace, cluster_name, bucket_start, n, sum_seconds, min_seconds, max_seconds, sketch) VALUES "
+        + ",".join(["(%s,%s,%s,1,%s,%s,%s,JSON_OBJECT(%s,1))"] * len(scopes))
+        + """ ON DUPLICATE KEY UPDATE n=n+1, sum_seconds=sum_seconds+VALUES(sum_seconds),
+          min_seconds=LEAST(min_seconds, VALUES(min_seconds)), max_seconds=GREATEST(max_seconds, VALUES(max_seconds)),
+          sketch=JSON_SET(sketch, %s, CAST(COALESCE(JSON_EXTRACT(sketch, %s), 0) AS UNSIGNED) + 1)""",
+        [x for c in scopes for x in (workspace, c, day, seconds, seconds, seconds, b)] + [f'$."{b}"'] * 2)
+
+def refresh(cur, workspace=None, clusters=None) -> int:
+    """Recompute mttr_stats over the window from the buckets: every scope, or one workspace and some of
+    its clusters ('' = workspace-wide). Scopes left with no resolved incident in the window read 0."""
+    cur.execute("SELECT NOW() AS now")
+    now = cur.fetchone()['now']
+    start = bucket_of(now) - dt.timedelta(days=WINDOW_DAYS - 1)
+    sql = "SELECT workspace, cluster_name, n, sum_seconds, sketch FROM mttr_buckets WHERE bucket_start >= %s"
+    params = [start]
+    if workspace is not None:
+        sql += f" AND workspace=%s AND cluster_name IN ({','.join(['%s'] * len(clusters))})"
+        params += [workspace, *clusters]
+    cur.execute(sql, params)
+    scopes = {}
+    for r in cur.fetchall():
+        s = scopes.setdefault((r['workspace'], r['cluster_name']), {'n': 0, 'sum': 0, 'sketch': {}})
+        s['n'] += r['n']
+        s['sum'] += r['sum_seconds']
+        for b, c in _sketch(r['sketch']).items():
+            s['sketch'][b] = s['sketch'].get(b, 0) + c
+    if workspace is not None:
+        for c in clusters:
+            scopes.setdefault((workspace, c), {'n': 0, 'sum': 0, 'sketch': {}})
+    rows = [(ws, c, round(s['sum'] / s['n']) if s['n'] else None, s['n'],
+             _round(quantile(s['sketch'], 0.5)), _round(quantile(s['sketch'], 0.9)), start, now)
+            for (ws, c), s in scopes.items()]
+    if rows:
+        cur.execute(
+            "INSERT INTO mttr_stats(workspace, cluster_name, avg_mttr_seconds, incident_count, p50_seconds, p90_seconds,"
+            " period_start, period_end, calculated_at) VALUES "
+            + ",".join(["(%s,%s,%s,%s,%s,%s,%s,%s,NOW())"] * len(rows))
+            + " ON DUPLICATE KEY UPDATE avg_mttr_seconds=VALUES(avg_mttr_seconds), incident_count=VALUES(incident_count),"
+              " p50_seconds=VALUES(p50_seconds), p90_seconds=VALUES(p90_seconds), period_start=VALUES(period_start),"
+              " period_end=VALUES(period_end), calculated_at=VALUES(calculated_at)",
+            [x for r in rows for x in r])
+    if workspace is None:
+        # scopes whose last resolve slid out of the window
+        cur.execute("""UPDATE mttr_stats SET avg_mttr_seconds=NULL, incident_count=0, p50_seconds=NULL, p90_seconds=NULL,
+                       period_start=%s, period_end=%s, calculated_at=NOW() WHERE period_end < %s""", (start, now, now))
+    return len(rows)
+
+def _round(v):
+    return None if v is None else round(v)
+
+def backfill(conn, chunk=1000) -> int:
+    """Rebuild mttr_buckets from every resolved incident, then refresh mttr_stats. Idempotent; a resolve that
+    lands while it runs may be counted twice or missed, so run it again after a busy period."""
+    buckets, last, n = {}, None, 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute("""SELECT id, workspace, cluster, mttr_seconds, created_at FROM incidents
+                           WHERE status='resolved' AND mttr_seconds IS NOT NULL""" + (" AND id > %s" if last is not None else "")
+                        + " ORDER BY id LIMIT %s", ([last] if last is not None else []) + [chunk])
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last = rows[-1]['id']
+            for r in rows:
+                sec = max(int(r['mttr_seconds']), 0)
+                day = bucket_of(r['created_at'] + dt.timedelta(seconds=sec))
+                ws = r['workspace'] or DEFAULT_WORKSPACE
+                for scope in {(ws, r['cluster'] or ''), (ws, '')}:
+                    b = buckets.setdefault(scope + (day,), {'n': 0, 'sum': 0, 'min': sec, 'max': sec, 'sketch': {}})
+                    b['n'] += 1
+                    b['sum'] += sec
+                    b['min'], b['max'] = min(b['min'], sec), max(b['max'], sec)
+                    k = str(bin_of(sec))
+                    b['sketch'][k] = b['sketch'].get(k, 0) + 1
+            n += len(rows)
+        cur.execute("DELETE FROM mttr_buckets")
+        items = list(buckets.items())
+        for i in range(0, len(items), chunk):
+            part = items[i:i + chunk]
+            cur.execute("INSERT INTO mttr_buckets(workspace, cluster_name, bucket_start, n, sum_seconds, min_seconds, max_seconds, sketch) VALUES "
+                        + ",".join(["(%s,%s,%s,%s,%s,%s,%s,%s)"] * len(part)),
+                        [x for (ws, c, day), b in part for x in (ws, c, day, b['n'], b['sum'], b['min'], b['max'], json.dumps(b['sketch']))])
+        refresh(cur)
+        conn.commit()
+    logger.info(f"MTTR backfill: {n} resolved incidents into {len(buckets)} buckets")
+    return n
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    ap = argparse.ArgumentParser(description="Rebuild or refresh MTTR aggregates")
+    g = ap.add_mutually_exclusive_group(required=True)
+    g.add_argument("--backfill", action="store_true", help="rebuild mttr_buckets from resolved incidents")
+    g.add_argument("--refresh", action="store_true", help="recompute mttr_stats from mttr_buckets")
+    args = ap.parse_args()
+
+    import pymysql
+    from tidb import TiDB
+    conn = pymysql.connect(**TiDB().conn_args)
+    try:
+        if args.backfill:
+            print(f"backfilled {backfill(conn)} resolved incidents")
+        else:
+            with conn.cursor() as cur:
+                n = refresh(cur)
+            conn.commit()
+            print(f"refreshed {n} MTTR scopes")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
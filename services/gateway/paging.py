@@ -0,0 +1,60 @@
+"""Keyset cursors and NDJSON streaming for the gateway list/search endpoints.
+
+A cursor is the sort key of the last row a client saw, base64url-encoded
+JSON, e.g. (ts, id). The next page asks for rows strictly after that key, so
+paging stays an index range scan however deep the client scrolls, unlike
+OFFSET. NDJSON mode writes one JSON object per line as rows come off an
+unbuffered (server-side) cursor; every line carries `_cursor` so a client can
+resume an interrupted export from the last line it got.
+"""
+import json, base64, datetime as dt
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+NDJSON = "application/x-ndjson"
+
+def _plain(v):
+    return v.isoformat(sep=" ") if isinstance(v, (dt.datetime, dt.date)) else v
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([_plain(v) for v in values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> list | None:
+    """Key values of a cursor, or None when there is none; 400 on a malformed one"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(400, "invalid cursor")
+    return values
+
+def after(cols, values, desc=True) -> tuple[str, list]:
+    """SQL predicate for rows strictly past `values` in (cols...) order, with its parameters"""
+    if values is None:
+        return "", []
+    op = "<" if desc else ">"
+    clauses, params = [], []
+    for i, col in enumerate(cols):
+        eq = [f"{c} = %s" for c in cols[:i]]
+        clauses.append("(" + " AND ".join(eq + [f"{col} {op} %s"]) + ")")
+        params += list(values[:i]) + [values[i]]
+    return "(" + " OR ".join(clauses) + ")", params
+
+def ndjson(rows, key=None):
+    """Stream rows as NDJSON; `key(row)` gives the sort key used for `_cursor`, rows that
+    already carry `_cursor` need no key"""
+    def lines():
+        for row in rows:
+            if key is not None:
+                row = {**row, "_cursor": encode_cursor(*key(row))}
+            yield json.dumps(row, default=str) + "\n"
+    return StreamingResponse(lines(), media_type=NDJSON)
+
+def wants_stream(fmt: str) -> bool:
+    if fmt not in ("json", "ndjson"):
+        raise HTTPException(400, "format must be json or ndjson")
+    return fmt == "ndjson"
@@ -1,11 +1,11 @@
 import threading, time, tempfile, os, logging
-from .tidb import TiDB
-from .k8s_secret import read_secret
+from tidb import get_tidb
+from k8s_secret import read_secret
 from kubernetes import client, config
 from datetime import datetime, timedelta
 
 logger = logging.getLogger("tim8.poller")
-db = TiDB()
+db = get_tidb()
 
 class ClusterPoller:
     def __init__(self):
@@ -27,11 +27,12 @@ class ClusterPoller:
             return client.CoreV1Api()
         finally:
             # Clean up temp file
-            if os.path.exists(temp_path):\n                os.unlink(temp_path)
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
     
     def _poll_cluster_health(self, name, workspace, kubeconfig_yaml, namespaces):
-        \"\"\"Poll health data from a single cluster\"\"\"
-        logger.debug(f\"Polling cluster {name} in workspace {workspace}\")
+        """Poll health data from a single cluster"""
+        logger.debug(f"Polling cluster {name} in workspace {workspace}")
         
         try:
             # Load Kubernetes client
@@ -58,10 +59,191 @@ class ClusterPoller:
                                 # Check for waiting or terminated states
                                 if cs.state.waiting or cs.state.terminated:
                                     unhealthy_pods.append({
-                                        \"pod\": pod.metadata.name,
-                                        \"reason\": (\n                                            cs.state.waiting.reason if cs.state.waiting \n                                            else cs.state.terminated.reason if cs.state.terminated \n                                            else \"Unknown\"\n                                        )\n                                    })
+                                        "pod": pod.metadata.name,
+                                        "reason": (
+                                            cs.state.waiting.reason if cs.state.waiting 
+                                            else cs.state.terminated.reason if cs.state.terminated 
+                                            else "Unknown"
+                                        )
+                                    })
                                     pod_healthy = False
                                     break
                     
                     # Determine component status
-                    if not unhealthy_pods:\n                        status = \"healthy\"\n                    elif len(unhealthy_pods) < total_pods / 2:  # Less than 50% unhealthy\n                        status = \"warning\"\n                    else:\n                        status = \"critical\"\n                    \n                    components.append({\n                        \"name\": f\"pods@{ns}\",\n                        \"type\": \"workload\",\n                        \"status\": status,\n                        \"details\": {\n                            \"total_pods\": total_pods,\n                            \"unhealthy_pods\": unhealthy_pods[:5],  # Limit to first 5\n                            \"unhealthy_count\": len(unhealthy_pods)\n                        }\n                    })\n                    \n                except Exception as ns_error:\n                    logger.warning(f\"Failed to check namespace {ns} in {name}: {ns_error}\")\n                    components.append({\n                        \"name\": f\"pods@{ns}\",\n                        \"type\": \"workload\",\n                        \"status\": \"critical\",\n                        \"details\": {\n                            \"error\": str(ns_error),\n                            \"namespace\": ns\n                        }\n                    })\n            \n            # Try to get node info (may fail due to RBAC, that's ok)\n            try:\n                nodes = core_api.list_node(_request_timeout=10).items\n                ready_nodes = sum(1 for node in nodes \n                                if any(condition.type == \"Ready\" and condition.status == \"True\" \n                                      for condition in (node.status.conditions or [])))\n                \n                components.append({\n                    \"name\": \"nodes\",\n                    \"type\": \"infrastructure\",\n                    \"status\": \"healthy\" if ready_nodes == len(nodes) else \"warning\",\n                    \"details\": {\n                        \"total_nodes\": len(nodes),\n                        \"ready_nodes\": ready_nodes\n                    }\n                })\n            except Exception:\n                # Node access not available (RBAC), skip silently\n                pass\n            \n            # Store health data\n            health_data = {\"components\": components}\n            db.store_cluster_health(name, workspace, health_data)\n            db.mark_cluster_sync(name, workspace, \"connected\")\n            \n            logger.debug(f\"Successfully polled {name}: {len(components)} components\")\n            \n        except Exception as e:\n            logger.error(f\"Failed to poll cluster {name}: {e}\")\n            db.mark_cluster_sync(name, workspace, \"error\")\n            raise\n    \n    def _poll_loop(self):\n        \"\"\"Main polling loop with exponential backoff\"\"\"\n        logger.info(\"Starting cluster poller loop\")\n        \n        while self.running:\n            try:\n                # Get all kubeconfig clusters\n                clusters = db.list_kubeconfig_clusters()\n                logger.debug(f\"Found {len(clusters)} kubeconfig clusters to poll\")\n                \n                for cluster in clusters:\n                    if not self.running:  # Check if we should stop\n                        break\n                        \n                    key = (cluster[\"name\"], cluster[\"workspace\"])\n                    \n                    # Check backoff\n                    backoff_time = self.backoff.get(key, 0)\n                    if backoff_time > 0:\n                        self.backoff[key] = max(0, backoff_time - 5)  # Decrease backoff\n                        continue\n                    \n                    try:\n                        # Read kubeconfig from secret\n                        kubeconfig_yaml = read_secret(cluster[\"kube_secret_ref\"])\n                        \n                        # Poll the cluster\n                        self._poll_cluster_health(\n                            cluster[\"name\"], \n                            cluster[\"workspace\"], \n                            kubeconfig_yaml,\n                            cluster[\"namespaces\"]\n                        )\n                        \n                        # Reset backoff on success\n                        self.backoff[key] = 0\n                        \n                    except Exception as e:\n                        logger.error(f\"Poll error for {key}: {e}\")\n                        db.mark_cluster_sync(cluster[\"name\"], cluster[\"workspace\"], \"error\")\n                        \n                        # Exponential backoff\n                        current_backoff = self.backoff.get(key, 5)\n                        self.backoff[key] = min(self.MAX_BACKOFF, current_backoff * 2)\n                        logger.debug(f\"Set backoff for {key} to {self.backoff[key]}s\")\n                \n                # Clean up expired tokens periodically\n                try:\n                    db.cleanup_expired_tokens()\n                except Exception as e:\n                    logger.warning(f\"Failed to cleanup expired tokens: {e}\")\n                \n            except Exception as e:\n                logger.error(f\"Error in polling loop: {e}\")\n            \n            # Sleep between poll cycles\n            for _ in range(10):  # Sleep 5 seconds total, checking every 0.5s if we should stop\n                if not self.running:\n                    break\n                time.sleep(0.5)\n        \n        logger.info(\"Poller loop stopped\")\n    \n    def start(self):\n        \"\"\"Start the polling thread\"\"\"\n        if self.running:\n            logger.warning(\"Poller already running\")\n            return\n        \n        self.running = True\n        self.thread = threading.Thread(target=self._poll_loop, daemon=True, name=\"ClusterPoller\")\n        self.thread.start()\n        logger.info(\"Cluster poller started\")\n    \n    def stop(self):\n        \"\"\"Stop the polling thread\"\"\"\n        if not self.running:\n            return\n        \n        logger.info(\"Stopping cluster poller...\")\n        self.running = False\n        \n        if self.thread and self.thread.is_alive():\n            self.thread.join(timeout=10)\n            if self.thread.is_alive():\n                logger.warning(\"Poller thread did not stop gracefully\")\n        \n        logger.info(\"Cluster poller stopped\")\n\n# Global poller instance\n_poller = None\n\ndef start_poller():\n    \"\"\"Start the global cluster poller\"\"\"\n    global _poller\n    if _poller is None:\n        _poller = ClusterPoller()\n    _poller.start()\n\ndef stop_poller():\n    \"\"\"Stop the global cluster poller\"\"\"\n    global _poller\n    if _poller:\n        _poller.stop()\n\ndef get_poller_status():\n    \"\"\"Get poller status info\"\"\"\n    global _poller\n    if _poller and _poller.running:\n        return {\n            \"running\": True,\n            \"backoff_clusters\": len([k for k, v in _poller.backoff.items() if v > 0]),\n            \"total_backoff_time\": sum(_poller.backoff.values())\n        }\n    return {\"running\": False}
\ No newline at end of file
+                    if not unhealthy_pods:
+                        status = "healthy"
+                    elif len(unhealthy_pods) < total_pods / 2:  # Less than 50% unhealthy
+                        status = "warning"
+                    else:
+                        status = "critical"
+                    
+                    components.append({
+                        "name": f"pods@{ns}",
+                        "type": "workload",
+                        "status": status,
+                        "details": {
+                            "total_pods": total_pods,
+                            "unhealthy_pods": unhealthy_pods[:5],  # Limit to first 5
+                            "unhealthy_count": len(unhealthy_pods)
+                        }
+                    })
+                    
+                except Exception as ns_error:
+                    logger.warning(f"Failed to check namespace {ns} in {name}: {ns_error}")
+                    components.append({
+                        "name": f"pods@{ns}",
+                        "type": "workload",
+                        "status": "critical",
+                        "details": {
+                            "error": str(ns_error),
+                            "namespace": ns
+                        }
+                    })
+            
+            # Try to get node info (may fail due to RBAC, that's ok)
+            try:
+                nodes = core_api.list_node(_request_timeout=10).items
+                ready_nodes = sum(1 for node in nodes 
+                                if any(condition.type == "Ready" and condition.status == "True" 
+                                      for condition in (node.status.conditions or [])))
+                
+                components.append({
+                    "name": "nodes",
+                    "type": "infrastructure",
+                    "status": "healthy" if ready_nodes == len(nodes) else "warning",
+                    "details": {
+                        "total_nodes": len(nodes),
+                        "ready_nodes": ready_nodes
+                    }
+                })
+            except Exception:
+                # Node access not available (RBAC), skip silently
+                pass
+            
+            # Store health data
+            health_data = {"components": components}
+            db.store_cluster_health(name, workspace, health_data)
+            db.mark_cluster_sync(name, workspace, "connected")
+            
+            logger.debug(f"Successfully polled {name}: {len(components)} components")
+            
+        except Exception as e:
+            logger.error(f"Failed to poll cluster {name}: {e}")
+            db.mark_cluster_sync(name, workspace, "error")
+            raise
+    
+    def _poll_loop(self):
+        """Main polling loop with exponential backoff"""
+        logger.info("Starting cluster poller loop")
+        
+        while self.running:
+            try:
+                # Get all kubeconfig clusters
+                clusters = db.list_kubeconfig_clusters()
+                logger.debug(f"Found {len(clusters)} kubeconfig clusters to poll")
+                
+                for cluster in clusters:
+                    if not self.running:  # Check if we should stop
+                        break
+                        
+                    key = (cluster["name"], cluster["workspace"])
+                    
+                    # Check backoff
+                    backoff_time = self.backoff.get(key, 0)
+                    if backoff_time > 0:
+                        self.backoff[key] = max(0, backoff_time - 5)  # Decrease backoff
+                        continue
+                    
+                    try:
+                        # Read kubeconfig from secret
+                        kubeconfig_yaml = read_secret(cluster["kube_secret_ref"])
+                        
+                        # Poll the cluster
+                        self._poll_cluster_health(
+                            cluster["name"], 
+                            cluster["workspace"], 
+                            kubeconfig_yaml,
+                            cluster["namespaces"]
+                        )
+                        
+                        # Reset backoff on success
+                        self.backoff[key] = 0
+                        
+                    except Exception as e:
+                        logger.error(f"Poll error for {key}: {e}")
+                        db.mark_cluster_sync(cluster["name"], cluster["workspace"], "error")
+                        
+                        # Exponential backoff
+                        current_backoff = self.backoff.get(key, 5)
+                        self.backoff[key] = min(self.MAX_BACKOFF, current_backoff * 2)
+                        logger.debug(f"Set backoff for {key} to {self.backoff[key]}s")
+                
+                # Clean up expired tokens periodically
+                try:
+                    db.cleanup_expired_tokens()
+                except Exception as e:
+                    logger.warning(f"Failed to cleanup expired tokens: {e}")
+                
+            except Exception as e:
+                logger.error(f"Error in polling loop: {e}")
+            
+            # Sleep between poll cycles
+            for _ in range(10):  # Sleep 5 seconds total, checking every 0.5s if we should stop
+                if not self.running:
+                    break
+                time.sleep(0.5)
+        
+        logger.info("Poller loop stopped")
+    
+    def start(self):
+        """Start the polling thread"""
+        if self.running:
+            logger.warning("Poller already running")
+            return
+        
+        self.running = True
+        self.thread = threading.Thread(target=self._poll_loop, daemon=True, name="ClusterPoller")
+        self.thread.start()
+        logger.info("Cluster poller started")
+    
+    def stop(self):
+        """Stop the polling thread"""
+        if not self.running:
+            return
+        
+        logger.info("Stopping cluster poller...")
+        self.running = False
+        
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=10)
+            if self.thread.is_alive():
+                logger.warning("Poller thread did not stop gracefully")
+        
+        logger.info("Cluster poller stopped")
+
+# Global poller instance
+_poller = None
+
+def start_poller():
+    """Start the global cluster poller"""
+    global _poller
+    if _poller is None:
+        _poller = ClusterPoller()
+    _poller.start()
+
+def stop_poller():
+    """Stop the global cluster poller"""
+    global _poller
+    if _poller:
+        _poller.stop()
+
+def get_poller_status():
+    """Get poller status info"""
+    global _poller
+    if _poller and _poller.running:
+        return {
+            "running": True,
+            "backoff_clusters": len([k for k, v in _poller.backoff.items() if v > 0]),
+            "total_backoff_time": sum(_poller.backoff.values())
+        }
+    return {"running": False}
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""TTL read-through cache for the gateway's polled dashboard reads.
+
+`await cache.get(name, args, load)` returns the cached result of `load()` for
+(name, args) while it is younger than the TTL configured for `name`. On a
+miss, concurrent callers of the same key share one in-flight load, so fifty
+browsers polling the same endpoint cost one query per TTL.
+
+Entries carry tags, e.g. 'incidents' or ('cluster_health', cluster, workspace).
+`invalidate(*tags)` drops every entry with one of those tags. It is
+thread-safe, so writes on the poller thread can call it too. A load that was
+already in flight when its tags were invalidated still answers its waiters,
+but its result is not stored.
+"""
+import time, asyncio, threading
+
+class ReadCache:
+    def __init__(self, ttls: dict, max_entries=2048):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.entries = {}  # (name, args) -> (expires, value, tags)
+        self.generations = {}  # tag -> bumped on each invalidation
+        self.inflight = {}  # (name, args) -> Task loading it, touched on the event loop only
+        self.lock = threading.Lock()
+        self.counters = {name: {"hits": 0, "misses": 0, "coalesced": 0} for name in ttls}
+        self.invalidations = 0
+
+    async def get(self, name, args, load, tags=None):
+        tags = tuple(tags or (name,))
+        key = (name, args)
+        stats = self.counters.setdefault(name, {"hits": 0, "misses": 0, "coalesced": 0})
+        with self.lock:
+            hit = self.entries.get(key)
+        if hit and hit[0] > time.monotonic():
+            stats["hits"] += 1
+            return hit[1]
+        task = self.inflight.get(key)
+        if task is not None:
+            stats["coalesced"] += 1
+        else:
+            stats["misses"] += 1
+            # a task of its own: a caller that goes away must not cancel the load for the others
+            task = self.inflight[key] = asyncio.ensure_future(self._fill(key, name, tags, load))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, name, tags, load):
+        with self.lock:
+            before = [self.generations.get(t, 0) for t in tags]
+        try:
+            value = await load()
+        finally:
+            self.inflight.pop(key, None)
+        ttl = self.ttls.get(name, 0)
+        if ttl > 0:
+            with self.lock:
+                if before == [self.generations.get(t, 0) for t in tags]:
+                    self.entries[key] = (time.monotonic() + ttl, value, tags)
+                    if len(self.entries) > self.max_entries:
+                        self._evict()
+        return value
+
+    def _evict(self):
+        now = time.monotonic()
+        for k in [k for k, e in self.entries.items() if e[0] <= now]:
+            del self.entries[k]
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]  # oldest insert
+
+    def invalidate(self, *tags):
+        with self.lock:
+            for t in tags:
+                self.generations[t] = self.generations.get(t, 0) + 1
+            stale = [k for k, e in self.entries.items() if any(t in e[2] for t in tags)]
+            for k in stale:
+                del self.entries[k]
+            self.invalidations += 1
+
+    def stats(self):
+        out = {}
+        for name, c in self.counters.items():
+            total = c["hits"] + c["misses"] + c["coalesced"]
+            out[name] = {**c, "ttl": self.ttls.get(name, 0),
+                         "hit_ratio": round((c["hits"] + c["coalesced"]) / total, 4) if total else None}
+        with self.lock:
+            size = len(self.entries)
+        return {"entries": size, "invalidations": self.invalidations, "reads": out}
@@ -0,0 +1,208 @@
+"""Query side of the raw_events inverted index (search_postings / search_terms).
+
+Query syntax: bare words must all match, "quoted phrases" must appear in
+order, and `word*` matches any indexed term with that prefix. Filters
+(cluster, namespace, app, level, since, until) are applied on raw_events;
+since/until take an ISO timestamp or an age such as 15m, 2h or 7d.
+
+Candidates are read newest first from the posting list of the rarest term
+(term, ts index); the other terms are checked with primary-key lookups on
+(term, event_id) for just those candidates. Hits are ranked by tf-idf times
+a recency boost that halves every SEARCH_HALF_LIFE_HOURS.
+"""
+import os, re, math, datetime as dt
+from textindex import words, tokenize, indexable, TERM_MAX
+
+CANDIDATES = int(os.environ.get('SEARCH_CANDIDATES', 2000))
+MAX_ROUNDS = int(os.environ.get('SEARCH_MAX_ROUNDS', 5))
+HALF_LIFE_HOURS = float(os.environ.get('SEARCH_HALF_LIFE_HOURS', 24))
+RECENCY_WEIGHT = float(os.environ.get('SEARCH_RECENCY_WEIGHT', 1.0))
+PREFIX_EXPANSIONS = int(os.environ.get('SEARCH_PREFIX_EXPANSIONS', 50))
+
+_QUERY = re.compile(r'"([^"]*)"|(\S+)')
+_AGE = re.compile(r"^(\d+)([smhd])$")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+FILTERS = ("cluster", "namespace", "app", "level")
+
+def parse_query(q: str):
+    """Split a query into required terms, phrases (token lists) and prefixes"""
+    terms, phrases, prefixes = [], [], []
+    for phrase, word in _QUERY.findall(q or ""):
+        if phrase:
+            toks = tokenize(phrase)
+            if len(toks) > 1:
+                phrases.append(toks)
+            terms.extend(t for t in toks if indexable(t))
+        elif word.endswith("*") and len(word.rstrip("*")) >= 2:
+            ws = words(word.rstrip("*"))
+            if ws:
+                terms.extend(t for w in ws[:-1] for t in tokenize(w) if indexable(t))
+                prefixes.append(ws[-1][:TERM_MAX])
+        else:
+            terms.extend(t for t in tokenize(word) if indexable(t))
+    return list(dict.fromkeys(terms)), phrases, list(dict.fromkeys(prefixes))
+
+def parse_time(value):
+    """ISO timestamp or an age like 30m / 2h / 7d (relative to now, UTC)"""
+    if value is None or isinstance(value, dt.datetime):
+        return value
+    m = _AGE.match(value.strip())
+    if m:
+        return dt.datetime.utcnow() - dt.timedelta(seconds=int(m.group(1)) * _UNITS[m.group(2)])
+    return dt.datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+def _filter_sql(filters, alias=""):
+    sql, params = "", []
+    for col in FILTERS:
+        if filters.get(col):
+            sql += f" AND {alias}{col}=%s"
+            params.append(filters[col])
+    if filters.get("since"):
+        sql += f" AND {alias}ts >= %s"
+        params.append(filters["since"])
+    if filters.get("until"):
+        sql += f" AND {alias}ts < %s"
+        params.append(filters["until"])
+    return sql, params
+
+def _contains(tokens, phrase):
+    n = len(phrase)
+    return any(tokens[i:i + n] == phrase for i in range(len(tokens) - n + 1))
+
+def _frequencies(cur, terms, prefixes):
+    """df per term and the expansion of each prefix; '' holds the document count"""
+    df = {}
+    if terms:
+        cur.execute(f"SELECT term, df FROM search_terms WHERE term IN ({','.join(['%s'] * len(terms))}) OR term=''",
+                    terms)
+    else:
+        cur.execute("SELECT term, df FROM search_terms WHERE term=''")
+    df.update({r['term']: int(r['df']) for r in cur.fetchall()})
+    expansions = []
+    for p in prefixes:
+        cur.execute("SELECT term, df FROM search_terms WHERE term LIKE %s AND df > 0 ORDER BY df DESC LIMIT %s",
+                    (p.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%", PREFIX_EXPANSIONS))
+        rows = cur.fetchall()
+        df.update({r['term']: int(r['df']) for r in rows})
+        expansions.append([r['term'] for r in rows])
+    return df, expansions
+
+def _scan(cur, q, k, filters, cursor=None):
+    """Matching events in (posting ts, event_id) descending order, starting after `cursor`.
+    Returns None for queries the index cannot answer, else (hits, df, n_docs, scan_cursor, exhausted)
+    with hits as (row, {term: tf}, key) and scan_cursor the last posting examined."""
+    terms, phrases, prefixes = parse_query(q)
+    if not terms and not prefixes:
+        return None
+    df, expansions = _frequencies(cur, terms, prefixes)
+    if any(df.get(t, 0) == 0 for t in terms) or any(not e for e in expansions):
+        return [], df, 1, None, True
+    n_docs = max(df.get('', 0), 1)
+    # every group must match; a group is one term or the expansion of one prefix
+    groups = [[t] for t in terms] + expansions
+    groups.sort(key=lambda g: sum(df.get(t, 0) for t in g))
+    driver, rest = groups[0], groups[1:]
+    where, params = _filter_sql(filters, "r.")
+
+    hits, seen, exhausted = [], set(), False
+    for _ in range(MAX_ROUNDS):
+        ts_sql, ts_params = "", []
+        if filters.get("since"):
+            ts_sql += " AND ts >= %s"
+            ts_params.append(filters["since"])
+        if filters.get("until"):
+            ts_sql += " AND ts < %s"
+            ts_params.append(filters["until"])
+        if cursor:
+            # keyset on (ts, event_id): one ingest batch shares a single ts
+            ts_sql += " AND (ts < %s OR (ts = %s AND event_id < %s))"
+            ts_params += [cursor[0], cursor[0], cursor[1]]
+        cur.execute(f"""SELECT event_id, term, tf, ts FROM search_postings
+                        WHERE term IN ({','.join(['%s'] * len(driver))}){ts_sql}
+                        ORDER BY ts DESC, event_id DESC LIMIT %s""", driver + ts_params + [CANDIDATES])
+        batch = cur.fetchall()
+        if not batch:
+            exhausted = True
+            break
+        cursor = (batch[-1]['ts'], batch[-1]['event_id'])
+        tf, key = {}, {}
+        for r in batch:
+            tf.setdefault(r['event_id'], {})[r['term']] = int(r['tf'])
+            key.setdefault(r['event_id'], (r['ts'], r['event_id']))
+        ids = [i for i in tf if i not in seen]  # a prefix can list one event on both sides of a boundary
+        for group in rest:
+            if not ids:
+                break
+            cur.execute(f"""SELECT event_id, term, tf FROM search_postings
+                            WHERE term IN ({','.join(['%s'] * len(group))})
+                              AND event_id IN ({','.join(['%s'] * len(ids))})""", group + ids)
+            matched = set()
+            for r in cur.fetchall():
+                tf[r['event_id']][r['term']] = int(r['tf'])
+                matched.add(r['event_id'])
+            ids = [i for i in ids if i in matched]
+        if ids:
+            cur.execute(f"""SELECT r.id, r.cluster, r.namespace, r.app, r.pod, r.level, r.ts, r.body_text
+                            FROM raw_events r WHERE r.id IN ({','.join(['%s'] * len(ids))}){where}""", ids + params)
+            for row in cur.fetchall():
+                if phrases:
+                    tokens = tokenize(row['body_text'])
+                    if not all(_contains(tokens, p) for p in phrases):
+                        continue
+                seen.add(row['id'])
+                hits.append((row, tf[row['id']], key[row['id']]))
+        if len(batch) < CANDIDATES:
+            exhausted = True
+            break
+        if len(hits) >= k:
+            break
+    hits.sort(key=lambda h: h[2], reverse=True)
+    return hits, df, n_docs, cursor, exhausted
+
+def _result(row, **extra):
+    body = row.pop('body_text') or ''
+    return {**row, "snippet": body[:300], **extra}
+
+def search(cur, q, k=10, **filters):
+    """Ranked hits for `q`, or None when the query has nothing the index can answer"""
+    filters = {**filters, "since": parse_time(filters.get("since")), "until": parse_time(filters.get("until"))}
+    scan = _scan(cur, q, k, filters)
+    if scan is None:
+        return None
+    hits, df, n_docs = scan[:3]
+    now = dt.datetime.utcnow()
+    results = []
+    for row, freqs, _ in hits:
+        relevance = sum((1 + math.log(f)) * math.log(1 + n_docs / max(df.get(t, 1), 1)) for t, f in freqs.items())
+        age_hours = max((now - row['ts'].replace(tzinfo=None)).total_seconds(), 0) / 3600 if row['ts'] else 0
+        score = relevance * (1 + RECENCY_WEIGHT * 0.5 ** (age_hours / HALF_LIFE_HOURS))
+        results.append(_result(row, score=round(score, 4)))
+    results.sort(key=lambda r: r['score'], reverse=True)
+    return results[:k]
+
+def search_page(cur, q, k=10, cursor=None, **filters):
+    """One page of matches newest first, as ([(row, key)], next_cursor) where keys and cursors are
+    (ts, id) values; None when the query has nothing the index can answer. next_cursor is None at the end."""
+    filters = {**filters, "since": parse_time(filters.get("since")), "until": parse_time(filters.get("until"))}
+    scan = _scan(cur, q, k, filters, tuple(cursor) if cursor else None)
+    if scan is None:
+        return None
+    hits, _, _, scan_cursor, exhausted = scan
+    page = [(_result(row), key) for row, _, key in hits[:k]]
+    if len(hits) >= k:
+        return page, page[-1][1]
+    # short page: resume after the last posting examined unless the scan reached the end
+    return page, (None if exhausted else scan_cursor)
+
+def search_like(cur, q, k=10, cursor=None, **filters):
+    """Substring scan for queries with no indexable terms (bare numbers, single characters),
+    newest first; `cursor` continues after a (ts, id) key"""
+    filters = {**filters, "since": parse_time(filters.get("since")), "until": parse_time(filters.get("until"))}
+    where, params = _filter_sql(filters)
+    if cursor:
+        where += " AND (ts < %s OR (ts = %s AND id < %s))"
+        params += [cursor[0], cursor[0], cursor[1]]
+    cur.execute(f"""SELECT id, cluster, namespace, app, pod, level, ts, LEFT(body_text, 300) AS snippet
+                    FROM raw_events WHERE body_text LIKE %s{where} ORDER BY ts DESC, id DESC LIMIT %s""",
+                [f"%{q.strip(chr(34))}%"] + params + [k])
+    return cur.fetchall()
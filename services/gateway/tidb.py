@@ -1,11 +1,20 @@
 import os, time, json, datetime as dt, logging
 import pymysql
-from .k8s_secret import create_or_replace_secret
+from k8s_secret import create_or_replace_secret
+import search_index
+from paging import after, encode_cursor
+from dbpool import Pool
+from health_state import HealthState
+import mttr
+import health_history
+import incident_snapshot
 
 logger = logging.getLogger("tim8.tidb")
 
+INCIDENT_JOB_ACTIVE = "('queued','gathering','summarizing')"  # incident_jobs states that still need a worker
+
 class TiDB:
-    def __init__(self):
+    def __init__(self, pool: Pool = None):
         self.conn_args = dict(
             host=os.environ['TIDB_HOST'],
             port=int(os.environ.get('TIDB_PORT', 4000)),
@@ -15,37 +24,238 @@ class TiDB:
             cursorclass=pymysql.cursors.DictCursor,
             ssl={'ssl':{}}
         )
+        self.pool = pool or Pool(
+            lambda: pymysql.connect(**self.conn_args),
+            min_size=int(os.environ.get('TIDB_POOL_MIN', 2)),
+            max_size=int(os.environ.get('TIDB_POOL_MAX', 10)),
+            max_lifetime=float(os.environ.get('TIDB_POOL_MAX_LIFETIME', 1800)),
+            ping_after=float(os.environ.get('TIDB_POOL_PING_AFTER', 30)),
+            timeout=float(os.environ.get('TIDB_POOL_TIMEOUT', 10)),
+        )
+        self.health = HealthState(ttl=float(os.environ.get('HEALTH_STATE_TTL_SECONDS', 300)))
+        self.listeners = []
+
+    def on_change(self, fn):
+        """Call fn(*tags) after each committed write, e.g. fn('incidents'); read caches invalidate on it"""
+        self.listeners.append(fn)
+
+    def _changed(self, *tags):
+        for fn in self.listeners:
+            try:
+                fn(*tags)
+            except Exception:
+                logger.exception(f"change listener failed for {tags}")
 
     def _conn(self):
-        return pymysql.connect(**self.conn_args)
+        """Pooled connection for a `with` block; returned to the pool on exit"""
+        return self.pool.connection()
+
+    def _rows(self, sql, params, stream=False):
+        """fetchall() of a query, or with stream=True a generator reading it off an unbuffered
+        server-side cursor. A stream ties up its connection until it is exhausted or closed, so it
+        gets a dedicated one instead of holding a pool slot for the length of an export."""
+        if not stream:
+            with self._conn() as c:
+                with c.cursor() as cur:
+                    cur.execute(sql, params)
+                    return cur.fetchall()
+        return self._stream(sql, params)
+
+    def _dedicated(self):
+        """Unpooled connection with an unbuffered (server-side) cursor, for reads paced by a slow client"""
+        return pymysql.connect(**{**self.conn_args, 'cursorclass': pymysql.cursors.SSDictCursor})
+
+    def _stream(self, sql, params):
+        c = self._dedicated()
+        try:
+            with c.cursor() as cur:
+                cur.execute(sql, params)
+                yield from cur
+        finally:
+            c.close()
 
     def create_incident(self, title, cluster, namespace, app):
         with self._conn() as c:
             with c.cursor() as cur:
                 cur.execute("INSERT INTO incidents(title, cluster, namespace, app) VALUES(%s,%s,%s,%s)", (title, cluster, namespace, app))
                 c.commit()
-                return cur.lastrowid
+        self._changed('incidents')
+        return cur.lastrowid
+
+    def queue_incident(self, title, cluster, namespace, app, owner):
+        """Create an incident and its queued pipeline job in one transaction"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                cur.execute("INSERT INTO incidents(title, cluster, namespace, app) VALUES(%s,%s,%s,%s)", (title, cluster, namespace, app))
+                iid = cur.lastrowid
+                cur.execute("INSERT INTO incident_jobs(incident_id, state, owner) VALUES(%s,'queued',%s)", (iid, owner))
+                c.commit()
+        self._changed('incidents')
+        return iid
+
+    def set_incident_job(self, iid, state, owner, error=None):
+        """Move a job to `state` if `owner` still holds it; False when another replica has taken it over"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                cur.execute("UPDATE incident_jobs SET state=%s, error=%s, updated_at=NOW(3) WHERE incident_id=%s AND owner=%s",
+                            (state, error, iid, owner))
+                c.commit()
+                return cur.rowcount == 1
+
+    def touch_incident_jobs(self, iids, owner):
+        """Keep the jobs this replica holds from looking abandoned"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                cur.execute(f"UPDATE incident_jobs SET updated_at=NOW(3) WHERE owner=%s AND incident_id IN ({','.join(['%s'] * len(iids))})"
+                            f" AND state IN {INCIDENT_JOB_ACTIVE}", [owner, *iids])
+                c.commit()
+
+    def claim_incident_jobs(self, owner, stale_seconds, own=False, limit=50):
+        """Take over unfinished jobs nobody advanced for `stale_seconds` (and, with `own`, any left by `owner`
+        before a restart). Returns [(incident_id, attempts)] of the jobs claimed."""
+        stale = "updated_at < NOW(3) - INTERVAL %s SECOND" + (" OR owner=%s" if own else "")
+        params = [stale_seconds] + ([owner] if own else [])
+        claimed = []
+        with self._conn() as c:
+            with c.cursor() as cur:
+                cur.execute(f"SELECT incident_id FROM incident_jobs WHERE state IN {INCIDENT_JOB_ACTIVE} AND ({stale})"
+                            " ORDER BY updated_at LIMIT %s", params + [limit])
+                for r in cur.fetchall():
+                    # conditional on the same predicate, so two replicas racing for a job cannot both win
+                    cur.execute(f"UPDATE incident_jobs SET owner=%s, attempts=attempts+1, updated_at=NOW(3)"
+                                f" WHERE incident_id=%s AND state IN {INCIDENT_JOB_ACTIVE} AND ({stale})",
+                                [owner, r['incident_id']] + params)
+                    if cur.rowcount:
+                        cur.execute("SELECT attempts FROM incident_jobs WHERE incident_id=%s", (r['incident_id'],))
+                        claimed.append((r['incident_id'], cur.fetchone()['attempts']))
+                    c.commit()
+        return claimed
+
+    def release_incident_job(self, iid, owner, stale_seconds):
+        """Undo a claim this replica could not queue: give the attempt back and leave the job stale,
+        so the next claim pass (here or on another replica) picks it up"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                cur.execute(f"UPDATE incident_jobs SET attempts=GREATEST(attempts-1, 0), updated_at=NOW(3) - INTERVAL %s SECOND"
+                            f" WHERE incident_id=%s AND owner=%s AND state IN {INCIDENT_JOB_ACTIVE}",
+                            (stale_seconds + 1, iid, owner))
+                c.commit()
+
+    def get_incident_job(self, iid):
+        with self._conn() as c:
+            with c.cursor() as cur:
+                cur.execute("SELECT incident_id, state, owner, attempts, error, created_at, updated_at FROM incident_jobs WHERE incident_id=%s", (iid,))
+                return cur.fetchone()
 
     def update_incident_summary(self, iid, summary):
         with self._conn() as c:
             with c.cursor() as cur:
                 cur.execute("UPDATE incidents SET summary=%s WHERE id=%s", (summary, iid))
                 c.commit()
+        self._changed('incidents', ('incident_snapshot', iid))
 
     def resolve_incident(self, iid):
+        """Resolve an incident and fold its time-to-resolve into the MTTR buckets and stats, in one transaction"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                cur.execute("UPDATE incidents SET status='resolved', mttr_seconds=TIMESTAMPDIFF(SECOND, created_at, NOW()) WHERE id=%s AND status != 'resolved'", (iid,))
+                if cur.rowcount:  # resolving twice must not count twice
+                    cur.execute("SELECT workspace, cluster, mttr_seconds, NOW() AS resolved_at FROM incidents WHERE id=%s", (iid,))
+                    inc = cur.fetchone()
+                    workspace = inc['workspace'] or mttr.DEFAULT_WORKSPACE
+                    mttr.record(cur, workspace, inc['cluster'], max(inc['mttr_seconds'] or 0, 0), inc['resolved_at'])
+                    mttr.refresh(cur, workspace, ['', inc['cluster'] or ''])
+                c.commit()
+        self._changed('incidents', 'mttr', ('incident_snapshot', iid))
+
+    def record_agent_runs(self, iid, runs):
+        """Store the outcome and latency of each agent called for an incident"""
+        if not runs:
+            return
         with self._conn() as c:
             with c.cursor() as cur:
-                cur.execute("UPDATE incidents SET status='resolved', mttr_seconds=TIMESTAMPDIFF(SECOND, created_at, NOW()) WHERE id=%s", (iid,))
+                cur.execute("INSERT INTO agent_runs(incident_id, agent, status, ms, queries, error) VALUES "
+                            + ",".join(["(%s,%s,%s,%s,%s,%s)"] * len(runs)),
+                            [x for r in runs for x in (iid, r['agent'], r['status'], r['ms'], r.get('queries'), r.get('error'))])
                 c.commit()
 
-    def search_events(self, q, k):
-        # naive FT: LIKE + order by ts desc (for demo). Vector search handled by detective agent.
-        like = f"%{q}%"
+    def get_agent_runs(self, iid):
         with self._conn() as c:
             with c.cursor() as cur:
-                cur.execute("SELECT id, cluster, namespace, app, pod, level, ts, LEFT(body_text, 300) AS snippet FROM raw_events WHERE body_text LIKE %s ORDER BY ts DESC LIMIT %s", (like, k))
+                cur.execute("SELECT agent, status, ms, queries, error, created_at FROM agent_runs WHERE incident_id=%s ORDER BY created_at, agent", (iid,))
                 return cur.fetchall()
 
+    def get_incident_snapshot(self, iid):
+        """Everything the agents read about an incident, in one transaction on one connection"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                try:
+                    return incident_snapshot.build(cur, iid)
+                finally:
+                    c.rollback()
+
+    def refresh_mttr_stats(self):
+        """Recompute every mttr_stats row from the buckets as the window slides"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                n = mttr.refresh(cur)
+                c.commit()
+        self._changed('mttr')
+        return n
+
+    def search_events(self, q, k, **filters):
+        """Ranked search over raw_events through the inverted index (see search_index.py).
+        Queries with no indexable term (e.g. a bare status code) fall back to a LIKE scan."""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                hits = search_index.search(cur, q, k, **filters)
+                if hits is None:
+                    hits = search_index.search_like(cur, q, k, **filters)
+                return hits
+
+    def search_events_page(self, q, k, cursor=None, **filters):
+        """Matches newest first from `cursor` on, as ([(row, key)], next_cursor) with (ts, id) keys"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                return self._search_page(cur, q, k, cursor, filters)
+
+    def _search_page(self, cur, q, k, cursor, filters):
+        page = search_index.search_page(cur, q, k, cursor, **filters)
+        if page is None:
+            rows = search_index.search_like(cur, q, k, cursor, **filters)
+            keys = [(r['ts'], r['id']) for r in rows]
+            page = list(zip(rows, keys)), (keys[-1] if len(rows) == k else None)
+        return page
+
+    def stream_search_events(self, q, cursor=None, limit=None, page_size=500, **filters):
+        """All matches newest first, page by page; rows carry `_cursor`. The export lasts as long as the
+        client keeps reading, so it runs on a dedicated connection rather than holding a pool slot."""
+        sent = 0
+        c = self._dedicated()
+        try:
+            with c.cursor() as cur:
+                while True:
+                    size = min(page_size, limit - sent) if limit else page_size
+                    rows, cursor = self._search_page(cur, q, size, cursor, filters)
+                    for row, key in rows:
+                        yield {**row, '_cursor': encode_cursor(*key)}
+                    sent += len(rows)
+                    if cursor is None or (limit and sent >= limit):
+                        return
+        finally:
+            c.close()
+
+    def get_events(self, ids, body_chars=None):
+        """raw_events rows (with a snippet, or the first `body_chars` of the body) for the given ids, keyed by id"""
+        if not ids:
+            return {}
+        text = "LEFT(body_text, %s) AS body_text" if body_chars else "LEFT(body_text, 300) AS snippet"
+        with self._conn() as c:
+            with c.cursor() as cur:
+                cur.execute(f"SELECT id, cluster, namespace, app, pod, level, ts, {text} FROM raw_events WHERE id IN ({','.join(['%s'] * len(ids))})",
+                            ([body_chars] if body_chars else []) + list(ids))
+                return {r['id']: r for r in cur.fetchall()}
+
     def get_workspaces(self):
         """Get all workspaces"""
         with self._conn() as c:
@@ -69,60 +279,77 @@ class TiDB:
                     return {'workspace': workspace_name, 'clusters': clusters}
                 return {'workspace': workspace_name, 'clusters': []}
 
-    def get_cluster_health(self, cluster_name, workspace):
-        """Get cluster health status"""
+    def get_cluster_health(self, cluster_name, workspace, cursor=None, limit=None):
+        """Get cluster health status. Components come newest check first; with `limit` the
+        response holds one page and `next_cursor` continues after its last (last_check, id)."""
         with self._conn() as c:
             with c.cursor() as cur:
+                # overall status over every component, independent of the page returned
                 cur.execute(
-                    "SELECT * FROM cluster_health WHERE cluster_name=%s AND workspace=%s ORDER BY last_check DESC", 
+                    "SELECT status, COUNT(*) AS n, MAX(last_check) AS last_check FROM cluster_health WHERE cluster_name=%s AND workspace=%s GROUP BY status",
                     (cluster_name, workspace)
                 )
-                health_data = cur.fetchall()
-                
-                # Calculate overall status
-                if not health_data:
-                    overall_status = 'unknown'
-                else:
-                    statuses = [h['status'] for h in health_data]
-                    if 'critical' in statuses:
-                        overall_status = 'critical'
-                    elif 'warning' in statuses:
-                        overall_status = 'warning'
-                    else:
-                        overall_status = 'healthy'
-                
-                return {
-                    'cluster_name': cluster_name,
-                    'workspace': workspace,
-                    'overall_status': overall_status,
-                    'components': health_data,
-                    'last_check': health_data[0]['last_check'] if health_data else None
-                }
+                counts = cur.fetchall()
+        health_data = self.get_cluster_health_components(cluster_name, workspace, cursor, limit)
 
-    def get_recent_incidents(self, workspace, limit):
-        """Get recent incidents"""
-        with self._conn() as c:
-            with c.cursor() as cur:
-                if workspace:
-                    cur.execute(
-                        "SELECT * FROM incidents WHERE workspace=%s ORDER BY created_at DESC LIMIT %s", 
-                        (workspace, limit)
-                    )
-                else:
-                    cur.execute("SELECT * FROM incidents ORDER BY created_at DESC LIMIT %s", (limit,))
-                return cur.fetchall()
+        # Calculate overall status
+        statuses = {h['status'] for h in counts}
+        if not counts:
+            overall_status = 'unknown'
+        elif 'critical' in statuses:
+            overall_status = 'critical'
+        elif 'warning' in statuses:
+            overall_status = 'warning'
+        else:
+            overall_status = 'healthy'
+
+        result = {
+            'cluster_name': cluster_name,
+            'workspace': workspace,
+            'overall_status': overall_status,
+            'components': health_data,
+            'last_check': max(h['last_check'] for h in counts) if counts else None
+        }
+        if limit:
+            last = health_data[-1] if len(health_data) == limit else None
+            result['next_cursor'] = encode_cursor(last['last_check'], last['id']) if last else None
+        return result
 
-    def get_mttr_stats(self, workspace=None):
-        """Get MTTR statistics"""
+    def get_cluster_health_components(self, cluster_name, workspace, cursor=None, limit=None, stream=False):
+        """cluster_health rows of one cluster, newest check first, after a (last_check, id) cursor"""
+        pred, params = after(("last_check", "id"), cursor)
+        sql = "SELECT * FROM cluster_health WHERE cluster_name=%s AND workspace=%s" + (f" AND {pred}" if pred else "") \
+            + " ORDER BY last_check DESC, id DESC"
+        params = [cluster_name, workspace] + params
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        return self._rows(sql, params, stream)
+
+    def get_recent_incidents(self, workspace, limit, cursor=None, stream=False):
+        """Get recent incidents, newest first; `cursor` is the (created_at, id) of the last row seen"""
+        where, params = [], []
+        if workspace:
+            where.append("workspace=%s")
+            params.append(workspace)
+        pred, p = after(("created_at", "id"), cursor)
+        if pred:
+            where.append(pred)
+            params += p
+        sql = "SELECT * FROM incidents" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY created_at DESC, id DESC"
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        return self._rows(sql, params, stream)
+
+    def get_mttr_stats(self, workspace=None, cluster=None):
+        """MTTR over the last mttr.WINDOW_DAYS: one row per workspace, or for one workspace (and cluster)"""
         with self._conn() as c:
             with c.cursor() as cur:
                 if workspace:
-                    cur.execute(
-                        "SELECT * FROM mttr_stats WHERE workspace=%s ORDER BY calculated_at DESC LIMIT 1", 
-                        (workspace,)
-                    )
+                    cur.execute("SELECT * FROM mttr_stats WHERE workspace=%s AND cluster_name=%s", (workspace, cluster or ''))
                 else:
-                    cur.execute("SELECT * FROM mttr_stats ORDER BY workspace, calculated_at DESC")
+                    cur.execute("SELECT * FROM mttr_stats WHERE cluster_name='' ORDER BY workspace")
                 return cur.fetchall()
 
     def create_workspace(self, name, description, clusters):
@@ -135,6 +362,7 @@ class TiDB:
                     (name, description, json.dumps(clusters))
                 )
                 c.commit()
+                self._changed('workspaces')
                 workspace_id = cur.lastrowid
                 
                 # Return the created workspace
@@ -152,6 +380,7 @@ class TiDB:
                 # Convert to int for database query but keep original string for response
                 cur.execute("DELETE FROM workspaces WHERE id = %s", (int(workspace_id),))
                 c.commit()
+                self._changed('workspaces')
                 return {"deleted": cur.rowcount > 0, "workspace_id": workspace_id}
 
     # ===============================
@@ -162,14 +391,6 @@ class TiDB:
         """Save enrollment token for agent registration"""
         with self._conn() as c:
             with c.cursor() as cur:
-                cur.execute("""
-                  CREATE TABLE IF NOT EXISTS enroll_tokens(
-                    id BIGINT AUTO_RANDOM PRIMARY KEY,
-                    token VARCHAR(255) UNIQUE,
-                    workspace VARCHAR(255),
-                    expires_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT NOW()
-                  )""")
                 cur.execute("INSERT INTO enroll_tokens(token,workspace,expires_at) VALUES(%s,%s,%s)",
                             (token, workspace, expires_at))
                 c.commit()
@@ -187,21 +408,6 @@ class TiDB:
         """Insert or update cluster record"""
         with self._conn() as c:
             with c.cursor() as cur:
-                # Create table if not exists
-                cur.execute("""
-                  CREATE TABLE IF NOT EXISTS clusters(
-                    id BIGINT AUTO_RANDOM PRIMARY KEY,
-                    name VARCHAR(255),
-                    workspace VARCHAR(255),
-                    mode ENUM('agent','kubeconfig'),
-                    kube_secret_ref VARCHAR(255),
-                    namespaces JSON,
-                    status ENUM('connected','error','unknown') DEFAULT 'unknown',
-                    last_sync TIMESTAMP NULL,
-                    created_at TIMESTAMP DEFAULT NOW(),
-                    UNIQUE KEY uniq_cluster (name, workspace)
-                  )""")
-                
                 # Upsert cluster
                 cur.execute("""
                   INSERT INTO clusters(name,workspace,mode,kube_secret_ref,namespaces,status)
@@ -214,23 +420,27 @@ class TiDB:
                 c.commit()
                 logger.info(f"Upserted cluster {name} in workspace {workspace}")
 
-    def list_clusters(self):
-        """List all registered clusters"""
-        with self._conn() as c:
-            with c.cursor() as cur:
-                cur.execute("""SELECT id,name,workspace,mode,kube_secret_ref,namespaces,status,last_sync,created_at 
-                             FROM clusters ORDER BY workspace,name""")
-                rows = cur.fetchall()
-                
-                # Parse JSON namespaces and convert IDs to strings
-                for r in rows:
-                    if isinstance(r.get("namespaces"), str):
-                        try: 
-                            r["namespaces"] = json.loads(r["namespaces"])
-                        except: 
-                            r["namespaces"] = []
-                    r["id"] = str(r["id"]) if r["id"] else None
-                return rows
+    def list_clusters(self, cursor=None, limit=None, stream=False):
+        """List registered clusters ordered by (workspace, name), after that key when `cursor` is given"""
+        pred, params = after(("workspace", "name"), cursor, desc=False)
+        sql = """SELECT id,name,workspace,mode,kube_secret_ref,namespaces,status,last_sync,created_at 
+                 FROM clusters""" + (f" WHERE {pred}" if pred else "") + " ORDER BY workspace,name"
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        rows = self._rows(sql, params, stream)
+        return map(self._cluster_row, rows) if stream else [self._cluster_row(r) for r in rows]
+
+    @staticmethod
+    def _cluster_row(r):
+        # Parse JSON namespaces and convert IDs to strings
+        if isinstance(r.get("namespaces"), str):
+            try: 
+                r["namespaces"] = json.loads(r["namespaces"])
+            except: 
+                r["namespaces"] = []
+        r["id"] = str(r["id"]) if r["id"] else None
+        return r
 
     def create_kubeconfig_secret_ref(self, workspace, name, kubeconfig_yaml):
         """Create a Kubernetes secret for kubeconfig and return reference"""
@@ -238,42 +448,35 @@ class TiDB:
         return create_or_replace_secret(secret_name, kubeconfig_yaml)
 
     def store_cluster_health(self, cluster_name, workspace, health):
-        """Store cluster health data"""
+        """Store a full health snapshot of a cluster, writing only the components that changed"""
+        components = [(comp.get("name", "unknown"), comp.get("type", ""), comp.get("status", "healthy"), comp.get("details", {}))
+                      for comp in health.get("components", [])]
         with self._conn() as c:
             with c.cursor() as cur:
-                # Ensure cluster_health table exists
-                cur.execute("""
-                  CREATE TABLE IF NOT EXISTS cluster_health(
-                    id BIGINT AUTO_RANDOM PRIMARY KEY,
-                    cluster_name VARCHAR(255),
-                    workspace VARCHAR(255),
-                    component VARCHAR(255),
-                    component_type VARCHAR(255),
-                    status ENUM('healthy','warning','critical'),
-                    details JSON,
-                    last_check TIMESTAMP DEFAULT NOW()
-                  )""")
-                
-                # Clear existing health data for this cluster
-                cur.execute("DELETE FROM cluster_health WHERE cluster_name=%s AND workspace=%s", 
-                           (cluster_name, workspace))
-                
-                # Insert fresh health data
-                components = health.get("components", [])
-                for comp in components:
-                    cur.execute("""
-                      INSERT INTO cluster_health(cluster_name,workspace,component,component_type,status,details,last_check)
-                      VALUES(%s,%s,%s,%s,%s,%s,NOW())
-                    """, (
-                        cluster_name, workspace, 
-                        comp.get("name", "unknown"), 
-                        comp.get("type", ""), 
-                        comp.get("status", "healthy"), 
-                        json.dumps(comp.get("details", {}))
-                    ))
-                
-                c.commit()
-                logger.debug(f"Stored health data for {cluster_name} ({len(components)} components)")
+                try:
+                    counts = self.health.write(cur, cluster_name, workspace, components)
+                    c.commit()
+                except Exception:
+                    self.health.forget(cluster_name, workspace)
+                    raise
+                logger.debug(f"Stored health data for {cluster_name} ({len(components)} components, {counts})")
+        if counts['changed'] or counts['removed']:  # heartbeats only move last_check; the cache TTL covers that
+            self._changed(('cluster_health', cluster_name, workspace))
+
+    def get_health_timeline(self, workspace, since, until=None, resolution=None, cluster=None):
+        """(resolution, {cluster: points}) from the health rollups; see health_history.timeline"""
+        with self._conn() as c:
+            with c.cursor() as cur:
+                return health_history.timeline(cur, workspace, since, until, resolution, cluster)
+
+    def get_health_transitions(self, workspace, cluster, since, until=None, limit=500):
+        with self._conn() as c:
+            with c.cursor() as cur:
+                return health_history.transitions(cur, workspace, cluster, since, until, limit)
+
+    def prune_health_history(self):
+        with self._conn() as c:
+            return health_history.prune(c)
 
     def mark_cluster_sync(self, name, workspace, status):
         """Update cluster sync status and timestamp"""
@@ -311,4 +514,13 @@ class TiDB:
                 c.commit()
                 if deleted > 0:
                     logger.info(f"Cleaned up {deleted} expired enrollment tokens")
-                return deleted
\ No newline at end of file
+                return deleted
+
+_shared = None
+
+def get_tidb() -> TiDB:
+    """The process-wide TiDB handle; every gateway module shares its connection pool"""
+    global _shared
+    if _shared is None:
+        _shared = TiDB()
+    return _shared
@@ -0,0 +1,142 @@
+"""Long-lived HTTP clients for calls to other services.
+
+One `Upstream` per service (an agent's Service URL, the Slack webhook) owns an
+httpx.AsyncClient for the life of the process. Its keep-alive pool is sized
+for that upstream, so repeated calls reuse connections instead of paying DNS,
+TCP and TLS each time. On top of the client:
+
+- Retries with full jitter: up to `retries` more attempts, sleeping
+  uniform(0, backoff * 2^n). Connect failures are retried for any request,
+  since nothing was sent. Dropped connections and 502/503/504 are retried
+  only for idempotent calls: GET/HEAD/PUT/DELETE/OPTIONS, or `idempotent=True`.
+- A circuit breaker: after `failure_threshold` consecutive failures
+  (transport errors, timeouts, 5xx), calls fail at once with CircuitOpen for
+  `reset_seconds`. Then one probe is let through; its outcome closes or
+  re-opens the circuit. A dead agent costs nothing instead of a full timeout.
+- HTTP/2 when `http2` is set and the h2 package is installed. It is
+  negotiated over TLS only; plain-http upstreams such as uvicorn agents stay
+  on HTTP/1.1.
+
+Settings come from UPSTREAM_<NAME>_<KEY>, falling back to UPSTREAM_<KEY>,
+e.g. UPSTREAM_DETECTIVE_MAX_CONNECTIONS or UPSTREAM_RETRIES.
+
+Shared verbatim by the gateway and agent-reporter.
+"""
+import os, time, random, asyncio, logging, importlib.util
+import httpx
+
+logger = logging.getLogger("tim8.upstream")
+
+IDEMPOTENT = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+RETRY_STATUS = {502, 503, 504}
+
+class CircuitOpen(Exception):
+    pass
+
+class Breaker:
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.counters = {"opened": 0, "rejected": 0}
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True  # one probe at a time
+            return True
+        self.counters["rejected"] += 1
+        return False
+
+    def success(self):
+        self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.probing:
+                self.counters["opened"] += 1
+            self.opened_at, self.probing = time.monotonic(), False
+
+def _setting(name, key, default, cast=float):
+    raw = os.environ.get(f"UPSTREAM_{name.upper()}_{key}", os.environ.get(f"UPSTREAM_{key}"))
+    if raw is None:
+        return default
+    return raw.lower() in ("1", "true", "yes", "on") if cast is bool else cast(raw)
+
+class Upstream:
+    def __init__(self, name, base_url="", timeout=30.0, max_connections=None, max_keepalive=None, keepalive_expiry=None,
+                 http2=None, retries=None, backoff=None, failure_threshold=None, reset_seconds=None):
+        self.name = name
+        self.retries = retries if retries is not None else _setting(name, "RETRIES", 2, int)
+        self.backoff = backoff if backoff is not None else _setting(name, "BACKOFF_SECONDS", 0.2)
+        self.breaker = Breaker(failure_threshold if failure_threshold is not None else _setting(name, "BREAKER_FAILURES", 5, int),
+                               reset_seconds if reset_seconds is not None else _setting(name, "BREAKER_RESET_SECONDS", 30.0))
+        http2 = http2 if http2 is not None else _setting(name, "HTTP2", False, bool)
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning(f"{name}: HTTP/2 requested but the h2 package is not installed; using HTTP/1.1")
+            http2 = False
+        max_connections = max_connections or _setting(name, "MAX_CONNECTIONS", 20, int)
+        limits = httpx.Limits(max_connections=max_connections,
+                              max_keepalive_connections=max_keepalive or _setting(name, "MAX_KEEPALIVE", max_connections, int),
+                              keepalive_expiry=keepalive_expiry or _setting(name, "KEEPALIVE_SECONDS", 30.0))
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, http2=http2)
+        self.counters = {"requests": 0, "retries": 0, "failures": 0}
+
+    async def request(self, method, url, idempotent=None, **kwargs) -> httpx.Response:
+        """Send one call, retrying what is safe to retry; raises CircuitOpen without sending while the circuit is open"""
+        idempotent = method.upper() in IDEMPOTENT if idempotent is None else idempotent
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpen(f"{self.name}: circuit open after {self.breaker.failures} consecutive failures")
+            self.counters["requests"] += 1
+            try:
+                r = await self.client.request(method, url, **kwargs)
+            except httpx.PoolTimeout:
+                self.breaker.probing = False  # our own pool is saturated; says nothing about the upstream
+                raise
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                retry, err = True, e  # never reached the upstream
+            except (httpx.RemoteProtocolError, httpx.ReadError, httpx.WriteError) as e:
+                retry, err = idempotent, e  # e.g. a keep-alive connection the upstream had closed
+            except httpx.TimeoutException as e:
+                retry, err = False, e
+            except asyncio.CancelledError:
+                self.breaker.probing = False  # the caller's deadline, not the upstream's fault
+                raise
+            else:
+                if r.status_code < 500:
+                    self.breaker.success()
+                    return r
+                retry, err = idempotent and r.status_code in RETRY_STATUS, None
+            self.breaker.failure()
+            self.counters["failures"] += 1
+            if not retry or attempt == self.retries:
+                if err is None:
+                    return r  # the caller sees the 5xx, as with a bare client
+                raise err
+            self.counters["retries"] += 1
+            await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self):
+        return {"circuit": self.breaker.state, "consecutive_failures": self.breaker.failures,
+                **self.counters, **self.breaker.counters}
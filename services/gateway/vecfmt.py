@@ -0,0 +1,74 @@
+"""Self-describing embedding encoding for events_embeddings / embedding_cache.
+
+Layout (little endian):
+
+    magic "EV" | version u8 | dtype u8 | dim u32 | [scale f32, int8 only] | payload
+
+dtype 0 = float32, 1 = float16, 2 = int8 scalar-quantized with one scale per
+vector (x ~= q * scale, scale = max|x| / 127). Rows written before this format
+are bare float32 bytes with no header; `decode` recognises them because their
+length does not match what a header would declare.
+
+This module has no dependency on the rest of the service so readers in other
+services can ship a verbatim copy of it.
+"""
+import struct
+import numpy as np
+
+MAGIC = b"EV"
+VERSION = 1
+HEADER = struct.Struct("<2sBBI")
+SCALE = struct.Struct("<f")
+
+FORMATS = {"float32": 0, "float16": 1, "int8": 2}
+_DTYPES = {0: np.float32, 1: np.float16, 2: np.int8}
+
+def encode(vec, fmt: str = "float32") -> bytes:
+    """Encode a 1-D vector in the given format"""
+    x = np.asarray(vec, dtype=np.float32).ravel()
+    code = FORMATS[fmt]
+    head = HEADER.pack(MAGIC, VERSION, code, x.size)
+    if code == 2:
+        peak = float(np.abs(x).max()) if x.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        q = np.clip(np.rint(x / scale), -127, 127).astype(np.int8)
+        return head + SCALE.pack(scale) + q.tobytes()
+    return head + x.astype(_DTYPES[code]).tobytes()
+
+def _parse_header(blob: bytes):
+    if len(blob) < HEADER.size or blob[:2] != MAGIC:
+        return None
+    _, version, code, dim = HEADER.unpack_from(blob)
+    if version != VERSION or code not in _DTYPES:
+        return None
+    extra = SCALE.size if code == 2 else 0
+    if len(blob) != HEADER.size + extra + dim * np.dtype(_DTYPES[code]).itemsize:
+        return None
+    return code, dim
+
+def describe(blob: bytes) -> dict:
+    """Format name and dimension of an encoded vector"""
+    parsed = _parse_header(blob)
+    if parsed is None:
+        return {"format": "legacy-float32", "dim": len(blob) // 4, "bytes": len(blob)}
+    code, dim = parsed
+    return {"format": next(k for k, v in FORMATS.items() if v == code), "dim": dim, "bytes": len(blob)}
+
+def decode(blob: bytes) -> np.ndarray:
+    """Decode any stored vector (versioned or legacy) to float32"""
+    parsed = _parse_header(blob)
+    if parsed is None:
+        return np.frombuffer(blob, dtype=np.float32).copy()
+    code, dim = parsed
+    if code == 2:
+        (scale,) = SCALE.unpack_from(blob, HEADER.size)
+        q = np.frombuffer(blob, dtype=np.int8, count=dim, offset=HEADER.size + SCALE.size)
+        return q.astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=_DTYPES[code], count=dim, offset=HEADER.size).astype(np.float32)
+
+def decode_many(blobs) -> np.ndarray:
+    """Decode a sequence of same-dimension vectors into an (n, dim) float32 matrix"""
+    blobs = list(blobs)
+    if not blobs:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack([decode(b) for b in blobs])
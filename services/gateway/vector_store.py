@@ -0,0 +1,310 @@
+"""Memory-mapped kNN index over events_embeddings for one embedding backend.
+
+Vectors live decoded and L2-normalized in one contiguous float32 matrix
+(`vectors.f32`) next to a fixed-width metadata array (`meta.bin`: event id,
+ts, dictionary codes for cluster/namespace/app), both np.memmap'd from
+VECTOR_STORE_DIR so a restart reopens them instead of re-reading TiDB.
+
+`refresh()` pages forward from a (ts, id) cursor that carries over between
+refreshes, so each one reads only rows it has not seen. Embeddings land a
+little after their event and can appear behind the cursor; for those it
+re-scans the last VECTOR_REFRESH_LAG_SECONDS before the cursor for event ids
+only, and fetches vectors just for the ids it is missing. Queries are one matrix product over the
+rows that pass the metadata filters, followed by an argpartition top-k.
+"""
+import os, json, time, threading, logging, datetime as dt
+import numpy as np
+import vecfmt
+
+logger = logging.getLogger("tim8.vectors")
+
+META = np.dtype([("event_id", "<i8"), ("ts", "<f8"), ("cluster", "<i4"), ("namespace", "<i4"), ("app", "<i4")])
+FIELDS = ("cluster", "namespace", "app")
+
+def _epoch(ts):
+    return ts.replace(tzinfo=dt.timezone.utc).timestamp() if ts else 0.0
+
+def _topk(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx])]
+
+class VectorStore:
+    def __init__(self, path, backend, conn_factory, include_legacy=False, lag_seconds=600,
+                 page=5000, max_days=14, chunk_rows=262144):
+        self.path = path
+        self.backend = backend
+        self.conn_factory = conn_factory
+        self.include_legacy = include_legacy  # rows with a NULL backend predate backends (OpenAI)
+        self.lag = lag_seconds
+        self.page = page
+        self.max_days = max_days
+        self.chunk_rows = chunk_rows
+        self.lock = threading.Lock()  # one writer at a time; readers use `view`
+        self.dim = None
+        self.n = 0
+        self.capacity = 0
+        self.mat = None
+        self.meta = None
+        self.view = (None, None, 0)  # (mat, meta, n) as one tuple, replaced whole by writers
+        self.ids = {}
+        self.codes = {f: {} for f in FIELDS}
+        self.watermark = None
+        self.cursor = None  # (ts, event_id) of the last row paged in
+        self.generation = 0  # bumped when compaction renumbers rows
+        self.counters = {"refreshes": 0, "appended": 0, "skipped_dim": 0, "searches": 0, "compactions": 0}
+        self.refresh_seconds = 0.0
+        self.search_seconds = 0.0
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    # -- files -----------------------------------------------------------
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open(self, capacity, suffix=""):
+        for name, size in (("vectors.f32", capacity * self.dim * 4), ("meta.bin", capacity * META.itemsize)):
+            with open(self._file(name + suffix), "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        mat = np.memmap(self._file("vectors.f32" + suffix), dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        meta = np.memmap(self._file("meta.bin" + suffix), dtype=META, mode="r+", shape=(capacity,))
+        return mat, meta
+
+    def _load(self):
+        try:
+            with open(self._file("state.json")) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("backend") != self.backend:
+            logger.info(f"Vector store at {self.path} holds {state.get('backend')}, rebuilding for {self.backend}")
+            return
+        self.dim, self.n, self.capacity = state["dim"], state["n"], state["capacity"]
+        self.codes = {f: state["codes"].get(f, {}) for f in FIELDS}
+        self.watermark = state.get("watermark")
+        if state.get("cursor"):
+            self.cursor = (dt.datetime.fromisoformat(state["cursor"][0]), state["cursor"][1])
+        elif self.watermark:
+            self.cursor = (dt.datetime.utcfromtimestamp(self.watermark), 0)
+        self.generation = state.get("generation", 0)
+        self.mat, self.meta = self._open(self.capacity)
+        self.ids = dict(zip(self.meta["event_id"][:self.n].tolist(), range(self.n)))
+        self.view = (self.mat, self.meta, self.n)
+        logger.info(f"Vector store loaded: {self.n} vectors x {self.dim} ({self.backend})")
+
+    def _save(self):
+        if self.mat is None:
+            return
+        self.mat.flush()
+        self.meta.flush()
+        tmp = self._file("state.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"backend": self.backend, "dim": self.dim, "n": self.n, "capacity": self.capacity,
+                       "watermark": self.watermark, "generation": self.generation,
+                       "cursor": [self.cursor[0].isoformat(), self.cursor[1]] if self.cursor else None,
+                       "codes": self.codes}, f)
+        os.replace(tmp, self._file("state.json"))
+
+    def _code(self, field, value):
+        codes, key = self.codes[field], value or ""
+        if key not in codes:
+            codes[key] = len(codes)
+        return codes[key]
+
+    def _append(self, rows):
+        vecs, keep = [], []
+        for r in rows:
+            v = vecfmt.decode(r['embedding'])
+            if self.dim is None:
+                self.dim = v.size
+            if v.size != self.dim:
+                self.counters["skipped_dim"] += 1
+                continue
+            vecs.append(v)
+            keep.append(r)
+        if not keep:
+            return 0
+        return self.add([r['event_id'] for r in keep], np.vstack(vecs), [_epoch(r['ts']) for r in keep],
+                        **{f: [r[f] for r in keep] for f in FIELDS})
+
+    def add(self, event_ids, vectors, ts, cluster=None, namespace=None, app=None):
+        """Append an (m, dim) block of vectors with their metadata; callers hold `lock` or own the store"""
+        m = np.asarray(vectors, dtype=np.float32).reshape(len(event_ids), -1)
+        if self.dim is None:
+            self.dim = m.shape[1]
+        need = self.n + len(m)
+        if need > self.capacity:
+            self.capacity = max(need, 2 * self.capacity, 65536)
+            self.mat, self.meta = self._open(self.capacity)
+        self.mat[self.n:need] = m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+        block = np.zeros(len(m), dtype=META)
+        block["event_id"] = event_ids
+        block["ts"] = ts
+        for field, values in zip(FIELDS, (cluster, namespace, app)):
+            block[field] = [self._code(field, v) for v in (values or [None] * len(m))]
+        self.meta[self.n:need] = block
+        for i, eid in enumerate(event_ids):
+            self.ids[int(eid)] = self.n + i
+        self.n = need
+        self.view = (self.mat, self.meta, self.n)  # published last so readers never see half-written rows
+        return len(m)
+
+    # -- maintenance -----------------------------------------------------
+    def refresh(self):
+        """Append embeddings written since the last refresh; returns the number of rows added"""
+        with self.lock:
+            t0 = time.monotonic()
+            backend_sql = "(e.backend=%s OR e.backend IS NULL)" if self.include_legacy else "e.backend=%s"
+            with self.conn_factory() as c:
+                with c.cursor() as cur:
+                    added = self._refresh_late(cur, backend_sql) + self._refresh_new(cur, backend_sql)
+            if self.n and self.meta["ts"][:self.n].min() < time.time() - (self.max_days + 1) * 86400:
+                self._compact(time.time() - self.max_days * 86400)
+            self._save()
+            self.counters["refreshes"] += 1
+            self.counters["appended"] += added
+            self.refresh_seconds += time.monotonic() - t0
+            return added
+
+    def _refresh_new(self, cur, backend_sql):
+        """Page forward from the cursor, vectors included"""
+        added = 0
+        while True:
+            if self.cursor:
+                after, params = "(r.ts > %s OR (r.ts = %s AND r.id > %s))", [self.cursor[0], self.cursor[0], self.cursor[1]]
+            else:
+                after, params = "r.ts >= %s", [dt.datetime.utcfromtimestamp(time.time() - self.max_days * 86400)]
+            cur.execute(f"""SELECT e.event_id, e.embedding, r.ts, r.cluster, r.namespace, r.app
+                            FROM raw_events r JOIN events_embeddings e ON e.event_id = r.id
+                            WHERE {after} AND {backend_sql}
+                            ORDER BY r.ts, r.id LIMIT %s""", params + [self.backend, self.page])
+            rows = cur.fetchall()
+            if not rows:
+                return added
+            self.cursor = (rows[-1]['ts'], rows[-1]['event_id'])
+            added += self._append([r for r in rows if r['event_id'] not in self.ids])
+            self.watermark = max(self.watermark or 0, _epoch(rows[-1]['ts']))
+            if len(rows) < self.page:
+                return added
+
+    def _refresh_late(self, cur, backend_sql):
+        """Embeddings written after the cursor passed their event: ids over the lag window, then
+        vectors for the missing ones only"""
+        if not self.cursor:
+            return 0
+        ts, eid = self.cursor
+        cur.execute(f"""SELECT e.event_id FROM raw_events r JOIN events_embeddings e ON e.event_id = r.id
+                        WHERE r.ts >= %s AND (r.ts < %s OR (r.ts = %s AND r.id <= %s)) AND {backend_sql}""",
+                    [ts - dt.timedelta(seconds=self.lag), ts, ts, eid, self.backend])
+        missing = [r['event_id'] for r in cur.fetchall() if r['event_id'] not in self.ids]
+        added = 0
+        for start in range(0, len(missing), self.page):
+            chunk = missing[start:start + self.page]
+            cur.execute(f"""SELECT e.event_id, e.embedding, r.ts, r.cluster, r.namespace, r.app
+                            FROM raw_events r JOIN events_embeddings e ON e.event_id = r.id
+                            WHERE e.event_id IN ({', '.join(['%s'] * len(chunk))}) AND {backend_sql}
+                            ORDER BY r.ts, r.id""", chunk + [self.backend])
+            added += self._append(cur.fetchall())
+        return added
+
+    def _compact(self, min_ts):
+        """Rewrite the files without rows older than `min_ts` (retention removes their events)"""
+        keep = np.flatnonzero(self.meta["ts"][:self.n] >= min_ts)
+        capacity = max(len(keep) * 2, 65536)
+        for name in ("vectors.f32.tmp", "meta.bin.tmp"):
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+        mat, meta = self._open(capacity, ".tmp")
+        for start in range(0, len(keep), self.chunk_rows):
+            sel = keep[start:start + self.chunk_rows]
+            mat[start:start + len(sel)] = self.mat[sel]
+            meta[start:start + len(sel)] = self.meta[sel]
+        mat.flush()
+        meta.flush()
+        for name in ("vectors.f32", "meta.bin"):
+            os.replace(self._file(name + ".tmp"), self._file(name))
+        self.mat, self.meta = self._open(capacity)
+        self.capacity, self.n = capacity, len(keep)
+        self.generation += 1
+        self.ids = dict(zip(self.meta["event_id"][:self.n].tolist(), range(self.n)))
+        self.view = (self.mat, self.meta, self.n)
+        self.counters["compactions"] += 1
+
+    # -- queries ---------------------------------------------------------
+    def vector(self, event_id):
+        mat, meta, n = self.view
+        row = self.ids.get(event_id)
+        if row is None or row >= n or meta["event_id"][row] != event_id:
+            return None  # not stored, or renumbered by a compaction since `view` was read
+        return np.array(mat[row])
+
+    def query_vector(self, query):
+        q = np.asarray(query, dtype=np.float32).ravel()
+        if q.size != self.dim:
+            raise ValueError(f"query has {q.size} dims, store has {self.dim} ({self.backend})")
+        return q / max(float(np.linalg.norm(q)), 1e-12)
+
+    def mask(self, meta, n, cluster=None, namespace=None, app=None, since=None, until=None):
+        """Boolean row mask for the filters, None when unfiltered, all-False for unknown values"""
+        mask = None
+        for field, value in zip(FIELDS, (cluster, namespace, app)):
+            if value is None:
+                continue
+            code = self.codes[field].get(value)
+            if code is None:
+                return np.zeros(n, dtype=bool)
+            m = meta[field][:n] == code
+            mask = m if mask is None else mask & m
+        if since is not None or until is not None:
+            ts = meta["ts"][:n]
+            m = np.ones(n, dtype=bool)
+            if since is not None:
+                m &= ts >= _epoch(since)
+            if until is not None:
+                m &= ts < _epoch(until)
+            mask = m if mask is None else mask & m
+        return mask
+
+    def search(self, query, k=10, cluster=None, namespace=None, app=None, since=None, until=None):
+        """[(event_id, score)] of the k nearest stored vectors by cosine similarity (exact)"""
+        t0 = time.monotonic()
+        mat, meta, n = self.view
+        if not n:
+            return []
+        q = self.query_vector(query)
+        mask = self.mask(meta, n, cluster, namespace, app, since, until)
+
+        if mask is not None and mask.mean() < 0.25:
+            # selective filters: gather the matching rows and score only those
+            rows = np.flatnonzero(mask)
+            scores = mat[rows] @ q if len(rows) else np.zeros(0, dtype=np.float32)
+        else:
+            # scan in row blocks; keep each block's top k, then pick the overall top k
+            rows_parts, score_parts = [], []
+            for start in range(0, n, self.chunk_rows):
+                end = min(start + self.chunk_rows, n)
+                s = mat[start:end] @ q
+                if mask is not None:
+                    s[~mask[start:end]] = -np.inf
+                top = _topk(s, k)
+                top = top[np.isfinite(s[top])]
+                rows_parts.append(top + start)
+                score_parts.append(s[top])
+            rows, scores = np.concatenate(rows_parts), np.concatenate(score_parts)
+        top = _topk(scores, k)
+        event_ids = meta["event_id"][rows[top]]
+        self.counters["searches"] += 1
+        self.search_seconds += time.monotonic() - t0
+        return [(int(e), float(s)) for e, s in zip(event_ids, scores[top])]
+
+    def stats(self):
+        c = self.counters
+        lag = time.time() - self.watermark if self.watermark else None
+        return {"backend": self.backend, "vectors": self.n, "dim": self.dim, "capacity": self.capacity,
+                "bytes": self.capacity * (self.dim or 0) * 4 + self.capacity * META.itemsize,
+                "watermark_lag_seconds": round(lag, 1) if lag is not None else None, **c,
+                "avg_refresh_ms": round(1000 * self.refresh_seconds / max(c["refreshes"], 1), 2),
+                "avg_search_ms": round(1000 * self.search_seconds / max(c["searches"], 1), 2)}
@@ -1,9 +1,48 @@
-import os, json
-from fastapi import FastAPI, Request
-import pymysql, openai, numpy as np
+import os, json, asyncio, logging
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+import pymysql
+from embedder import EmbeddingBatcher
+from embed_cache import EmbeddingCache
+from writer import WriteBehindQueue
+from drain import Drain
+from sampler import PodSampler
+import vecfmt
+from backends import get_backend
+from textindex import postings
+
+logger = logging.getLogger("tim8.ingestion")
 
-openai.api_key = os.environ.get('OPENAI_API_KEY')
 EMBED_MODEL = os.environ.get('EMBED_MODEL','text-embedding-3-small')
+# openai (remote, cached) or hash (in-process feature hashing, see backends.py)
+EMBED_BACKEND = os.environ.get('EMBED_BACKEND', 'openai')
+# Storage encoding for new vectors: float32 | float16 | int8 (see vecfmt.py)
+EMBED_FORMAT = os.environ.get('EMBED_FORMAT', 'float32')
+if EMBED_FORMAT not in vecfmt.FORMATS:
+    raise RuntimeError(f"EMBED_FORMAT must be one of {sorted(vecfmt.FORMATS)}")
+# Rows per multi-row INSERT statement; a batch larger than this is split into
+# several statements that still share one transaction.
+BATCH_ROWS = int(os.environ.get('INGEST_BATCH_ROWS', 500))
+MAX_BATCH_RECORDS = int(os.environ.get('INGEST_MAX_BATCH_RECORDS', 10000))
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', 256))
+EMBED_MAX_WAIT = float(os.environ.get('EMBED_MAX_WAIT_SECONDS', 0.5))
+EMBED_MAX_IN_FLIGHT = int(os.environ.get('EMBED_MAX_IN_FLIGHT', 4))
+EMBED_MAX_RETRIES = int(os.environ.get('EMBED_MAX_RETRIES', 3))
+EMBED_CACHE_MAX_BYTES = int(os.environ.get('EMBED_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+QUEUE_CAPACITY = int(os.environ.get('INGEST_QUEUE_CAPACITY', 20000))
+QUEUE_HIGH_WATER = float(os.environ.get('INGEST_QUEUE_HIGH_WATER', 0.8))
+QUEUE_WRITERS = int(os.environ.get('INGEST_WRITERS', 2))
+TEMPLATE_SIM_THRESHOLD = float(os.environ.get('TEMPLATE_SIM_THRESHOLD', 0.4))
+TEMPLATE_MAX_PER_SCOPE = int(os.environ.get('TEMPLATE_MAX_PER_SCOPE', 1000))
+# Maintain the search_postings inverted index as events are written
+SEARCH_INDEX = os.environ.get('SEARCH_INDEX', 'on') == 'on'
+SEARCH_MAX_TERMS = int(os.environ.get('SEARCH_MAX_TERMS', 64))
+# Default per-pod budget (lines/s and burst); ingest_limits overrides it per workspace
+SAMPLER_RATE = float(os.environ.get('SAMPLER_RATE_PER_POD', 20))
+SAMPLER_BURST = float(os.environ.get('SAMPLER_BURST_PER_POD', 200))
+SAMPLER_MAX_PODS = int(os.environ.get('SAMPLER_MAX_PODS', 20000))
+SAMPLER_SUMMARY_SECONDS = int(os.environ.get('SAMPLER_SUMMARY_SECONDS', 30))
 
 app = FastAPI()
 
@@ -17,32 +56,302 @@ conn_args = dict(
     ssl={'ssl':{}}
 )
 
-def embed(text: str) -> bytes:
-    if not text:
-        text = ""
-    e = openai.embeddings.create(model=EMBED_MODEL, input=text).data[0].embedding
-    arr = np.array(e, dtype=np.float32)
-    return arr.tobytes()
+EVENT_COLUMNS = ('cluster','namespace','app','pod','type','level','body_json','body_text','template_id')
 
-@app.post('/ingest')
-async def ingest(req: Request):
-    payload = await req.json()
-    # Expect Fluent Bit/OTEL compatible fields; map to schema
-    row = dict(
+miner = Drain(sim_threshold=TEMPLATE_SIM_THRESHOLD, max_clusters=TEMPLATE_MAX_PER_SCOPE)
+
+backend = get_backend(EMBED_BACKEND, EMBED_MODEL)
+
+def embed_many(texts: list[str]) -> list[bytes]:
+    """Embed a list of texts with one backend call"""
+    if not texts:
+        return []
+    return [vecfmt.encode(v, EMBED_FORMAT) for v in backend.embed(texts)]
+
+def write_embeddings(rows: list[tuple]):
+    """Bulk insert (event_id, vector) pairs into events_embeddings"""
+    with pymysql.connect(**conn_args) as c:
+        with c.cursor() as cur:
+            cur.executemany("INSERT INTO events_embeddings(event_id, embedding, backend) VALUES(%s, %s, %s)",
+                            [(eid, vec, backend.name) for eid, vec in rows])
+        c.commit()
+
+def db():
+    return pymysql.connect(**conn_args)
+
+embed_cache = EmbeddingCache(embed_many, db, f"{backend.name}/{EMBED_FORMAT}", max_bytes=EMBED_CACHE_MAX_BYTES)
+# A local backend computes a vector faster than the cache can look one up
+embedder = EmbeddingBatcher(
+    embed_cache.embed if backend.remote else embed_many, write_embeddings,
+    batch_size=EMBED_BATCH_SIZE, max_wait=EMBED_MAX_WAIT,
+    max_in_flight=EMBED_MAX_IN_FLIGHT, max_retries=EMBED_MAX_RETRIES,
+)
+
+def map_record(payload: dict) -> dict:
+    """Map a Fluent Bit/OTEL record onto the raw_events columns"""
+    if not isinstance(payload, dict):
+        raise ValueError(f"record must be a JSON object, got {type(payload).__name__}")
+    kube = payload.get('kubernetes') or {}
+    text = payload.get('log') or payload.get('message')
+    if text:
+        # body_text already holds the line; keep only the structured remainder in body_json.
+        # body_text itself stays verbatim: search, the agents and the embedder read it as is.
+        payload = {k: v for k, v in payload.items() if k not in ('log', 'message') or v != text}
+    return dict(
         cluster=payload.get('cluster','local'),
-        namespace=payload.get('kubernetes',{}).get('namespace_name') or payload.get('namespace') or 'default',
-        app=payload.get('kubernetes',{}).get('labels',{}).get('app') or payload.get('app') or 'unknown',
-        pod=payload.get('kubernetes',{}).get('pod_name') or payload.get('pod') or 'unknown',
+        namespace=kube.get('namespace_name') or payload.get('namespace') or 'default',
+        app=(kube.get('labels') or {}).get('app') or payload.get('app') or 'unknown',
+        pod=kube.get('pod_name') or payload.get('pod') or 'unknown',
         type='log',
         level=payload.get('level') or payload.get('severity') or 'info',
         body_json=json.dumps(payload),
-        body_text=payload.get('log') or payload.get('message') or json.dumps(payload)
+        body_text=text or json.dumps(payload),
+        template_id=None,
     )
-    with pymysql.connect(**conn_args) as c:
-        with c.cursor() as cur:
-            cur.execute("INSERT INTO raw_events(cluster,namespace,app,pod,type,level,body_json,body_text) VALUES(%(cluster)s,%(namespace)s,%(app)s,%(pod)s,%(type)s,%(level)s,%(body_json)s,%(body_text)s)", row)
-            eid = cur.lastrowid
-            vec = embed(row['body_text'])
-            cur.execute("INSERT INTO events_embeddings(event_id, embedding) VALUES(%s, %s)", (eid, vec))
+
+def parse_body(raw: bytes) -> list:
+    """Split a request body into records.
+
+    Accepts a single JSON object, a JSON array (Fluent Bit `Format json`) or
+    NDJSON (`Format json_lines`). Returns a list of `(record, error)` pairs so a
+    malformed line only fails itself.
+    """
+    text = raw.decode('utf-8', errors='replace').strip()
+    if not text:
+        return []
+    try:
+        doc = json.loads(text)
+        items = doc if isinstance(doc, list) else [doc]
+        return [(item, None) for item in items]
+    except json.JSONDecodeError:
+        pass
+    out = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            out.append((json.loads(line), None))
+        except json.JSONDecodeError as e:
+            out.append((None, f"invalid JSON: {e.msg}"))
+    return out
+
+def assign_templates(rows: list[dict]):
+    """Tag rows with their Drain template id and text. Feeds the miner, so call it once per row,
+    not per write attempt."""
+    for row in rows:
+        cluster, _ = miner.add((row['cluster'], row['namespace'], row['app']), row['body_text'])
+        row['template_id'], row['template'] = cluster.id, cluster.template
+
+def template_counts(rows: list[dict]) -> list[tuple]:
+    """log_templates upsert rows for a batch of tagged rows"""
+    seen = {}
+    for row in rows:
+        entry = seen.get(row['template_id'])
+        seen[row['template_id']] = (row['cluster'], row['namespace'], row['app'], row['template'], (entry[4] if entry else 0) + 1)
+    # Sorted so concurrent writers lock template rows in the same order
+    return [(cid, *seen[cid]) for cid in sorted(seen)]
+
+def write_postings(cur, ids, rows):
+    """Add the batch to search_postings and bump document frequencies in search_terms"""
+    posts, df = postings(zip(ids, (row['body_text'] for row in rows)), SEARCH_MAX_TERMS)
+    for start in range(0, len(posts), 2000):
+        chunk = posts[start:start + 2000]
+        cur.execute("INSERT IGNORE INTO search_postings(term, event_id, tf, ts) VALUES "
+                    + ",".join(["(%s,%s,%s,NOW(6))"] * len(chunk)), [v for p in chunk for v in p])
+    # sorted so concurrent writers lock search_terms rows in the same order
+    terms = sorted(df)
+    for start in range(0, len(terms), 2000):
+        chunk = terms[start:start + 2000]
+        cur.execute("INSERT INTO search_terms(term, df) VALUES " + ",".join(["(%s,%s)"] * len(chunk))
+                    + " ON DUPLICATE KEY UPDATE df=df+VALUES(df)", [v for t in chunk for v in (t, df[t])])
+
+def insert_batch(rows: list[dict]) -> list[int]:
+    """Write events tagged by assign_templates() with multi-row INSERTs in one transaction"""
+    ids = []
+    templates = template_counts(rows)
+    with db() as c:
+        try:
+            with c.cursor() as cur:
+                cur.execute(f"""
+                  INSERT INTO log_templates(id, cluster, namespace, app, template, count, first_seen, last_seen)
+                  VALUES {",".join(["(%s,%s,%s,%s,%s,%s,NOW(6),NOW(6))"] * len(templates))}
+                  ON DUPLICATE KEY UPDATE count=count+VALUES(count), template=VALUES(template), last_seen=VALUES(last_seen)
+                """, [v for t in templates for v in t])
+                for start in range(0, len(rows), BATCH_ROWS):
+                    chunk = rows[start:start + BATCH_ROWS]
+                    placeholders = ",".join(["(" + ",".join(["%s"] * len(EVENT_COLUMNS)) + ")"] * len(chunk))
+                    params = [row[col] for row in chunk for col in EVENT_COLUMNS]
+                    cur.execute(f"INSERT INTO raw_events({','.join(EVENT_COLUMNS)}) VALUES {placeholders}", params)
+                    # TiDB hands out consecutive ids for the rows of a single
+                    # multi-row INSERT and reports the first one as lastrowid.
+                    ids.extend(cur.lastrowid + i for i in range(len(chunk)))
+                if SEARCH_INDEX:
+                    write_postings(cur, ids, rows)
             c.commit()
-    return {"id": eid}
\ No newline at end of file
+        except Exception:
+            c.rollback()
+            raise
+    return ids
+
+def on_written(ids, rows):
+    for eid, row in zip(ids, rows):
+        embedder.submit(eid, row['body_text'])
+
+def seed_templates():
+    """Replay recently seen templates, newest first up to the cap, so ids stay stable across restarts"""
+    try:
+        with db() as c:
+            with c.cursor() as cur:
+                cur.execute("SELECT id, cluster, namespace, app, template FROM log_templates WHERE last_seen >= NOW() - INTERVAL 7 DAY ORDER BY last_seen DESC LIMIT 50000")
+                rows = cur.fetchall()
+        for r in rows:
+            miner.seed((r['cluster'], r['namespace'], r['app']), r['id'], r['template'])
+        logger.info(f"Seeded {len(rows)} log templates")
+    except Exception as e:
+        logger.warning(f"Could not seed log templates: {e}")
+
+writer = WriteBehindQueue(
+    insert_batch, on_written, prepare=assign_templates,
+    capacity=QUEUE_CAPACITY, high_water=QUEUE_HIGH_WATER,
+    writers=QUEUE_WRITERS, batch_size=BATCH_ROWS,
+)
+
+# cluster -> workspace and workspace -> (rate, burst), refreshed by sampler_loop()
+cluster_workspaces: dict[str, str] = {}
+workspace_limits: dict[str, tuple] = {}
+
+def limits_for(cluster):
+    return workspace_limits.get(cluster_workspaces.get(cluster), (SAMPLER_RATE, SAMPLER_BURST))
+
+sampler = PodSampler(limits_for, max_keys=SAMPLER_MAX_PODS)
+
+def load_limits():
+    """Read the cluster -> workspace mapping and per-workspace sampling limits"""
+    with db() as c:
+        with c.cursor() as cur:
+            cur.execute("SELECT name, clusters FROM workspaces")
+            mapping = {}
+            for ws in cur.fetchall():
+                for cluster in json.loads(ws['clusters'] or '[]'):
+                    mapping[cluster] = ws['name']
+            cur.execute("SELECT workspace, rate_per_sec, burst FROM ingest_limits")
+            limits = {r['workspace']: (float(r['rate_per_sec']), float(r['burst'])) for r in cur.fetchall()}
+    return mapping, limits
+
+def apply_limits(mapping, limits):
+    """Swap in loaded limits; runs on the event loop, like sampler.admit()"""
+    global cluster_workspaces, workspace_limits
+    cluster_workspaces, workspace_limits = mapping, limits
+    sampler.refresh_limits()
+
+async def sampler_loop():
+    """Emit "N suppressed" summaries and pick up limit changes"""
+    last_reload = asyncio.get_running_loop().time()
+    while True:
+        await asyncio.sleep(SAMPLER_SUMMARY_SECONDS)
+        rows = sampler.summaries(SAMPLER_SUMMARY_SECONDS)
+        if rows and not writer.offer(rows):
+            logger.warning(f"Ingest queue full, {len(rows)} sampler summaries lost")
+        if asyncio.get_running_loop().time() - last_reload >= 60:
+            last_reload = asyncio.get_running_loop().time()
+            try:
+                apply_limits(*await run_in_threadpool(load_limits))
+            except Exception as e:
+                logger.warning(f"Could not load ingest limits: {e}")
+
+def map_items(items: list, undo: list = None):
+    """Map and sample `(record, error)` pairs; returns (kept rows, their indexes, errors)
+
+    Records dropped by the sampler appear in neither list. Pass `undo` to be able to
+    `sampler.rollback(undo)` if the chunk is then refused.
+    """
+    rows, positions, errors = [], [], []
+    for i, (payload, err) in enumerate(items):
+        if err is None:
+            try:
+                # Expect Fluent Bit/OTEL compatible fields; map to schema
+                row = map_record(payload)
+                if sampler.admit(row, undo):
+                    rows.append(row)
+                    positions.append(i)
+                continue
+            except ValueError as e:
+                err = str(e)
+        errors.append({"index": i, "error": err})
+    return rows, positions, errors
+
+async def ingest_records(items: list) -> dict:
+    """Map, write and report a list of `(record, error)` pairs"""
+    if len(items) > MAX_BATCH_RECORDS:
+        raise HTTPException(413, f"batch exceeds {MAX_BATCH_RECORDS} records")
+    undo = []
+    rows, positions, errors = map_items(items, undo)
+    results = [None] * len(items)
+    for e in errors:
+        results[e["index"]] = e
+    suppressed = len(items) - len(rows) - len(errors)
+    if rows:
+        await run_in_threadpool(assign_templates, rows)
+        try:
+            ids = await run_in_threadpool(insert_batch, rows)
+        except Exception as e:
+            sampler.rollback(undo)  # the client retries the whole batch
+            raise HTTPException(503, f"batch write failed: {e}")
+        for i, eid, row in zip(positions, ids, rows):
+            results[i] = {"index": i, "id": eid}
+            embedder.submit(eid, row['body_text'])
+    results = [r or {"index": i, "suppressed": True} for i, r in enumerate(results)]
+    return {"accepted": len(rows), "rejected": len(errors), "suppressed": suppressed, "results": results}
+
+@app.post('/ingest')
+async def ingest(req: Request):
+    """Accept a record, JSON array or NDJSON chunk into the write-behind queue"""
+    items = parse_body(await req.body())
+    undo = []
+    rows, _, errors = map_items(items, undo)
+    if len(rows) > writer.high_water:
+        sampler.rollback(undo)
+        raise HTTPException(413, f"chunk exceeds {writer.high_water} records")
+    if rows and not writer.offer(rows):
+        # Fluent Bit retries the chunk: it must not look like a repeat of itself to the sampler
+        sampler.rollback(undo)
+        if writer.closing:
+            return JSONResponse({"error": "shutting down"}, status_code=503, headers={"Retry-After": "5"})
+        retry = writer.retry_after()
+        return JSONResponse({"error": "ingest queue full", "depth": writer.queue.qsize()},
+                            status_code=429, headers={"Retry-After": str(retry)})
+    return JSONResponse({"queued": len(rows), "rejected": len(errors), "suppressed": len(items) - len(rows) - len(errors),
+                         "errors": errors}, status_code=202)
+
+@app.post('/ingest/batch')
+async def ingest_batch(req: Request):
+    """Ingest a JSON array or NDJSON chunk synchronously, returning per-record ids"""
+    return await ingest_records(parse_body(await req.body()))
+
+@app.get('/stats')
+async def stats():
+    """Pipeline counters"""
+    return {"backend": backend.name, "queue": writer.stats(), "embedder": embedder.stats(), "embed_cache": embed_cache.stats(),
+            "templates": miner.stats(), "sampler": sampler.stats()}
+
+@app.on_event("startup")
+async def startup_event():
+    await run_in_threadpool(seed_templates)
+    try:
+        apply_limits(*await run_in_threadpool(load_limits))
+    except Exception as e:
+        logger.warning(f"Could not load ingest limits, using defaults: {e}")
+    writer.start()
+    embedder.start()
+    app.state.sampler_task = asyncio.create_task(sampler_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.sampler_task.cancel()
+    rows = sampler.summaries(SAMPLER_SUMMARY_SECONDS)
+    if rows:
+        writer.offer(rows)
+    # Rows first: draining the writer feeds the embedder its last batch
+    await writer.stop()
+    await embedder.stop()
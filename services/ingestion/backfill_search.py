@@ -0,0 +1,90 @@
+"""Index raw_events written before search_postings existed.
+
+    python backfill_search.py              # everything not yet indexed
+    python backfill_search.py --days 14    # only the last 14 days
+
+Walks raw_events newest first in BACKFILL_CHUNK pages, skips events that
+already have postings, and writes the rest with their original ts. Each page
+commits together with its position in backfill_progress, so a rerun resumes
+where the last one stopped and no event is counted twice, including lines
+that yield no terms. Ingestion keeps indexing new events meanwhile.
+"""
+import os, sys, time, argparse, logging
+import pymysql
+from textindex import postings
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("tim8.ingestion.backfill_search")
+
+CHUNK = int(os.environ.get('BACKFILL_CHUNK', 1000))
+PAUSE = float(os.environ.get('BACKFILL_PAUSE_SECONDS', 0.1))
+MAX_TERMS = int(os.environ.get('SEARCH_MAX_TERMS', 64))
+
+conn_args = dict(
+    host=os.environ['TIDB_HOST'],
+    port=int(os.environ.get('TIDB_PORT', 4000)),
+    user=os.environ['TIDB_USER'],
+    password=os.environ['TIDB_PASSWORD'],
+    database=os.environ.get('TIDB_DB','incidentdb'),
+    cursorclass=pymysql.cursors.DictCursor,
+    ssl={'ssl':{}}
+)
+
+def index_page(cur, events):
+    ts_of = {e['id']: e['ts'] for e in events}
+    posts, df = postings(((e['id'], e['body_text']) for e in events), MAX_TERMS)
+    for start in range(0, len(posts), 2000):
+        chunk = posts[start:start + 2000]
+        cur.execute("INSERT IGNORE INTO search_postings(term, event_id, tf, ts) VALUES "
+                    + ",".join(["(%s,%s,%s,%s)"] * len(chunk)), [v for p in chunk for v in (*p, ts_of[p[1]])])
+    terms = sorted(df)
+    for start in range(0, len(terms), 2000):
+        chunk = terms[start:start + 2000]
+        cur.execute("INSERT INTO search_terms(term, df) VALUES " + ",".join(["(%s,%s)"] * len(chunk))
+                    + " ON DUPLICATE KEY UPDATE df=df+VALUES(df)", [v for t in chunk for v in (t, df[t])])
+    return len(posts)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--days", type=int, help="only index events from the last N days")
+    args = ap.parse_args()
+
+    since = "AND r.ts >= NOW() - INTERVAL %s DAY" if args.days else ""
+    done = {"events": 0, "postings": 0, "pages": 0}
+    t0 = time.monotonic()
+    with pymysql.connect(**conn_args) as c:
+        with c.cursor() as cur:
+            cur.execute("SELECT cursor_ts, cursor_id FROM backfill_progress WHERE name='search'")
+            row = cur.fetchone()
+        cursor = (row['cursor_ts'], row['cursor_id']) if row else None
+        if cursor:
+            logger.info(f"Resuming below ts={cursor[0]} id={cursor[1]}")
+        while True:
+            with c.cursor() as cur:
+                after = "AND (r.ts < %s OR (r.ts = %s AND r.id < %s))" if cursor else ""
+                params = ([args.days] if args.days else []) + ([cursor[0], cursor[0], cursor[1]] if cursor else [])
+                cur.execute(f"""SELECT r.id, r.ts, r.body_text,
+                                       EXISTS(SELECT 1 FROM search_postings p WHERE p.event_id = r.id) AS indexed
+                                FROM raw_events r WHERE r.ts IS NOT NULL {since} {after}
+                                ORDER BY r.ts DESC, r.id DESC LIMIT %s""", params + [CHUNK])
+                page = cur.fetchall()
+                if not page:
+                    break
+                cursor = (page[-1]['ts'], page[-1]['id'])
+                events = [e for e in page if not e['indexed']]
+                if events:
+                    done["postings"] += index_page(cur, events)
+                cur.execute("INSERT INTO backfill_progress(name, cursor_ts, cursor_id) VALUES('search', %s, %s)"
+                            " ON DUPLICATE KEY UPDATE cursor_ts=VALUES(cursor_ts), cursor_id=VALUES(cursor_id)", cursor)
+            c.commit()
+            done["events"] += len(events)
+            done["pages"] += 1
+            if done["pages"] % 20 == 0:
+                logger.info(f"  {done['events']} events indexed ({done['events'] / (time.monotonic() - t0):.0f}/s)")
+            if len(page) < CHUNK:
+                break
+            time.sleep(PAUSE)
+    logger.info(f"Backfill finished: {done}")
+
+if __name__ == "__main__":
+    sys.exit(main())
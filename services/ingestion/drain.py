@@ -0,0 +1,127 @@
+import hashlib, threading
+from collections import OrderedDict
+from embed_cache import normalize
+
+WILDCARD = "<*>"
+
+class LogCluster:
+    __slots__ = ("id", "tokens", "size", "leaf")
+
+    def __init__(self, cid, tokens, leaf):
+        self.id = cid
+        self.tokens = tokens
+        self.size = 0
+        self.leaf = leaf
+
+    @property
+    def template(self):
+        return " ".join(self.tokens)
+
+class _Scope:
+    __slots__ = ("root", "clusters")
+
+    def __init__(self):
+        self.root = {}
+        self.clusters: OrderedDict[int, LogCluster] = OrderedDict()
+
+class Drain:
+    """Online log template miner (Drain, He et al. 2017), one parse tree per scope.
+
+    A line is masked with `normalize()`, split on whitespace and routed by token
+    count and its first `depth - 2` tokens to a leaf; inside the leaf it joins
+    the most similar cluster when at least `sim_threshold` of the tokens agree,
+    turning the differing positions into `<*>`. Otherwise it starts a cluster.
+
+    Cluster ids are derived from the scope and the template the cluster started
+    with, so they are stable across restarts once `seed()` has replayed the
+    persisted templates. Memory is bounded by `max_scopes` (LRU over scopes) and
+    `max_clusters` per scope (LRU over clusters).
+    """
+
+    def __init__(self, depth=4, sim_threshold=0.4, max_children=100,
+                 max_clusters=1000, max_scopes=5000):
+        self.prefix_depth = max(1, depth - 2)
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.max_scopes = max_scopes
+        self.scopes: OrderedDict[tuple, _Scope] = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def cluster_id(scope, template: str) -> int:
+        digest = hashlib.sha1(("\0".join(scope) + "\0" + template).encode()).digest()
+        return int.from_bytes(digest[:8], "big") >> 1  # fits a signed BIGINT
+
+    def _scope(self, scope) -> _Scope:
+        s = self.scopes.get(scope)
+        if s is None:
+            s = self.scopes[scope] = _Scope()
+            while len(self.scopes) > self.max_scopes:
+                self.scopes.popitem(last=False)
+        else:
+            self.scopes.move_to_end(scope)
+        return s
+
+    def _leaf(self, s: _Scope, tokens):
+        node = s.root.setdefault(len(tokens), {})
+        for tok in tokens[:self.prefix_depth]:
+            key = WILDCARD if tok.startswith("<") or any(ch.isdigit() for ch in tok) else tok
+            if key not in node and len(node) >= self.max_children:
+                key = WILDCARD
+            node = node.setdefault(key, {})
+        return node.setdefault(None, [])
+
+    @staticmethod
+    def _similarity(template, tokens):
+        same = params = 0
+        for a, b in zip(template, tokens):
+            if a == WILDCARD:
+                params += 1
+            elif a == b:
+                same += 1
+        return same / len(tokens), params
+
+    def _add_cluster(self, s: _Scope, cid, tokens, leaf):
+        c = LogCluster(cid, tokens, leaf)
+        leaf.append(c)
+        s.clusters[cid] = c
+        while len(s.clusters) > self.max_clusters:
+            _, old = s.clusters.popitem(last=False)
+            old.leaf.remove(old)
+        return c
+
+    def add(self, scope: tuple, text: str):
+        """Assign a line to a cluster; returns (cluster, template_changed)"""
+        tokens = normalize(text).split() or [""]
+        with self.lock:
+            s = self._scope(scope)
+            leaf = self._leaf(s, tokens)
+            best, best_key = None, (-1.0, -1)
+            for c in leaf:
+                key = self._similarity(c.tokens, tokens)
+                if key > best_key:
+                    best, best_key = c, key
+            changed = False
+            if best is not None and best_key[0] >= self.sim_threshold:
+                merged = [a if a == b else WILDCARD for a, b in zip(best.tokens, tokens)]
+                if merged != best.tokens:
+                    best.tokens = merged
+                    changed = True
+                s.clusters.move_to_end(best.id)
+            else:
+                best = self._add_cluster(s, self.cluster_id(scope, " ".join(tokens)), tokens, leaf)
+                changed = True
+            best.size += 1
+            return best, changed
+
+    def seed(self, scope: tuple, cid: int, template: str):
+        """Replay a persisted template so its id survives a restart"""
+        tokens = template.split() or [""]
+        with self.lock:
+            s = self._scope(scope)
+            if cid not in s.clusters:
+                self._add_cluster(s, cid, tokens, self._leaf(s, tokens))
+
+    def stats(self):
+        return {"scopes": len(self.scopes), "templates": sum(len(s.clusters) for s in self.scopes.values())}
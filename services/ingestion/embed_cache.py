@@ -0,0 +1,159 @@
+import re, time, hashlib, threading, logging
+from collections import OrderedDict
+
+logger = logging.getLogger("tim8.ingestion.cache")
+
+# Order matters: the wider patterns have to run before the bare-number mask.
+_K8S = '[bcdfghjklmnpqrstvwxz2456789]'  # k8s.io/apimachinery rand.String alphabet
+_MASKS = [
+    (re.compile(r'\b\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?\b'), '<TS>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    (re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}(?::\d+)?\b'), '<IP>'),
+    # Deployment pods (name-<replicaset hash>-<5 char suffix>) and daemonset/statefulset style suffixes. Kubernetes
+    # draws these from an alphabet without vowels or 0/1/3, and a lone suffix must mix letters and digits, so
+    # error codes (error-code-50012) and words are left alone.
+    (re.compile(rf'\b([a-z0-9][a-z0-9-]*?)-{_K8S}{{8,10}}-{_K8S}{{5}}(?![a-z0-9])'), r'\1-<POD>'),
+    (re.compile(rf'\b([a-z][a-z0-9-]*?)-(?=[a-z0-9]{{0,4}}\d)(?=[a-z0-9]{{0,4}}[a-z]){_K8S}{{5}}(?![a-z0-9])'), r'\1-<POD>'),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '<HEX>'),
+    # Hashes and ids (sha 3f2a1b): a whole token of 6+ hex digits, mixing letters and digits so words stay
+    (re.compile(r'\b(?=[0-9a-fA-F]*\d)(?=[0-9a-fA-F]*[a-fA-F])[0-9a-fA-F]{6,}\b'), '<HEX>'),
+    # A standalone number, at the start of its token and followed by at most a unit (12ms) to the token's
+    # end, so the digits inside an id are never half-masked. Not part of a version (v1.2.3, 1.2.3) or of a
+    # hyphenated identifier (error-code-50012, pid-42); "offset -5" is still a number.
+    (re.compile(r'(?<![A-Za-z0-9<._])(?<![A-Za-z0-9]-)\d+(?:\.\d+)?(?![.]?\d)(?!\.[A-Za-z0-9])(?=[A-Za-z]*(?![A-Za-z0-9_]))'), '<NUM>'),
+]
+
+def normalize(text: str) -> str:
+    """Reduce a log line to its template by masking variable tokens"""
+    t = text or ""
+    for rx, repl in _MASKS:
+        t = rx.sub(repl, t)
+    return " ".join(t.split())
+
+class EmbeddingCache:
+    """Two-tier embedding cache keyed by a hash of the normalized log template.
+
+    Tier 1 is an in-process LRU bounded by the total size of the cached vectors;
+    tier 2 is the `embedding_cache` table so a restarted pod starts warm. Lines
+    that share a template inside one batch are embedded once. `embed` has the
+    same signature as the wrapped `embed_fn(texts) -> list[bytes]`.
+    """
+
+    def __init__(self, embed_fn, conn_factory, model, max_bytes=64 * 1024 * 1024):
+        self.embed_fn = embed_fn
+        self.conn_factory = conn_factory
+        self.model = model
+        self.max_bytes = max_bytes
+        self.lru: OrderedDict[str, bytes] = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.counters = {"lru_hits": 0, "db_hits": 0, "misses": 0, "evictions": 0,
+                         "api_calls": 0, "api_texts": 0, "db_errors": 0}
+        self.embed_seconds = 0.0
+
+    def _count(self, seconds=0.0, **inc):
+        # embed() runs on the embedder's batcher thread while /stats reads the counters
+        with self.lock:
+            for name, n in inc.items():
+                self.counters[name] += n
+            self.embed_seconds += seconds
+
+    def key(self, template: str) -> str:
+        return hashlib.sha1(f"{self.model}\0{template}".encode()).hexdigest()
+
+    def _lru_get(self, key):
+        with self.lock:
+            vec = self.lru.get(key)
+            if vec is not None:
+                self.lru.move_to_end(key)
+            return vec
+
+    def _lru_put(self, key, vec):
+        with self.lock:
+            old = self.lru.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self.lru[key] = vec
+            self.bytes += len(vec)
+            while self.bytes > self.max_bytes and len(self.lru) > 1:
+                _, evicted = self.lru.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.counters["evictions"] += 1
+
+    def _db_get(self, keys):
+        try:
+            with self.conn_factory() as c:
+                with c.cursor() as cur:
+                    placeholders = ",".join(["%s"] * len(keys))
+                    cur.execute(f"SELECT template_hash, embedding FROM embedding_cache WHERE template_hash IN ({placeholders})", list(keys))
+                    found = {r['template_hash']: r['embedding'] for r in cur.fetchall()}
+                    if found:
+                        placeholders = ",".join(["%s"] * len(found))
+                        cur.execute(f"UPDATE embedding_cache SET hits=hits+1, last_used_at=NOW() WHERE template_hash IN ({placeholders})", list(found))
+                c.commit()
+                return found
+        except Exception as e:
+            self._count(db_errors=1)
+            logger.warning(f"Embedding cache lookup failed: {e}")
+            return {}
+
+    def _db_put(self, rows):
+        try:
+            with self.conn_factory() as c:
+                with c.cursor() as cur:
+                    cur.executemany("INSERT IGNORE INTO embedding_cache(template_hash, model, template, embedding) VALUES(%s,%s,%s,%s)", rows)
+                c.commit()
+        except Exception as e:
+            self._count(db_errors=1)
+            logger.warning(f"Embedding cache write failed: {e}")
+
+    def embed(self, texts: list[str]) -> list[bytes]:
+        templates = [normalize(t) for t in texts]
+        keys = [self.key(t) for t in templates]
+        found = {}
+        for k in set(keys):
+            vec = self._lru_get(k)
+            if vec is not None:
+                found[k] = vec
+        self._count(lru_hits=sum(1 for k in keys if k in found))
+
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing:
+            from_db = self._db_get(missing)
+            for k, vec in from_db.items():
+                self._lru_put(k, vec)
+            found.update(from_db)
+            self._count(db_hits=sum(1 for k in keys if k in from_db))
+
+        # One API text per distinct unseen template, however often it repeats
+        todo = {k: t for k, t in zip(keys, templates) if k not in found}
+        self._count(misses=sum(1 for k in keys if k in todo))
+        if todo:
+            t0 = time.perf_counter()
+            vecs = self.embed_fn(list(todo.values()))
+            self._count(api_calls=1, api_texts=len(todo), seconds=time.perf_counter() - t0)
+            rows = []
+            for (k, template), vec in zip(todo.items(), vecs):
+                found[k] = vec
+                self._lru_put(k, vec)
+                rows.append((k, self.model, template, vec))
+            self._db_put(rows)
+        return [found[k] for k in keys]
+
+    def stats(self):
+        with self.lock:
+            c = dict(self.counters)
+            embed_seconds, entries, size = self.embed_seconds, len(self.lru), self.bytes
+        lookups = c["lru_hits"] + c["db_hits"] + c["misses"]
+        hits = c["lru_hits"] + c["db_hits"]
+        per_text = embed_seconds / c["api_texts"] if c["api_texts"] else 0.0
+        return {
+            **c,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "api_texts_saved": lookups - c["api_texts"],
+            "api_calls_per_1k_events": round(1000 * c["api_calls"] / lookups, 2) if lookups else None,
+            "est_embed_seconds_saved": round((lookups - c["api_texts"]) * per_text, 1),
+        }
@@ -0,0 +1,111 @@
+import asyncio, time, random, logging
+
+logger = logging.getLogger("tim8.ingestion.embedder")
+
+class EmbeddingBatcher:
+    """Collects (event_id, text) pairs from many requests and embeds them in batches.
+
+    A batch is flushed when it reaches `batch_size` items or when its oldest
+    item has waited `max_wait` seconds. At most `max_in_flight` batches are
+    being embedded/written at any time; a failed batch is retried with
+    exponential backoff before it is dropped.
+
+    `embed_fn(texts) -> list[vector]` and `write_fn([(event_id, vector)])` are
+    blocking callables and run in worker threads.
+    """
+
+    def __init__(self, embed_fn, write_fn, batch_size=256, max_wait=0.5,
+                 max_in_flight=4, max_retries=3, max_pending=50000):
+        self.embed_fn = embed_fn
+        self.write_fn = write_fn
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.tasks: set[asyncio.Task] = set()
+        self.runner = None
+        self.counters = {
+            "submitted": 0, "embedded": 0, "attempts": 0, "batches": 0,
+            "retries": 0, "failed_batches": 0, "dropped": 0,
+        }
+        self.last_batch_seconds = 0.0
+
+    def submit(self, event_id, text):
+        """Queue one event for embedding; never blocks the caller"""
+        try:
+            self.queue.put_nowait((event_id, text or ""))
+            self.counters["submitted"] += 1
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+            logger.warning(f"Embedding queue full, dropping event {event_id}")
+
+    def start(self):
+        if self.runner is None:
+            self.runner = asyncio.create_task(self._run())
+            logger.info(f"Embedding batcher started (batch={self.batch_size}, wait={self.max_wait}s)")
+
+    async def stop(self):
+        """Flush everything still queued, then stop"""
+        if self.runner is None:
+            return
+        await self.queue.join()
+        self.runner.cancel()
+        self.runner = None
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        logger.info("Embedding batcher stopped")
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.in_flight.acquire()
+            task = asyncio.create_task(self._flush(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _flush(self, batch):
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    t0 = time.perf_counter()
+                    self.counters["attempts"] += 1
+                    vecs = await asyncio.to_thread(self.embed_fn, [text for _, text in batch])
+                    await asyncio.to_thread(self.write_fn, [(eid, vec) for (eid, _), vec in zip(batch, vecs)])
+                    self.last_batch_seconds = time.perf_counter() - t0
+                    self.counters["batches"] += 1
+                    self.counters["embedded"] += len(batch)
+                    return
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        self.counters["failed_batches"] += 1
+                        self.counters["dropped"] += len(batch)
+                        logger.error(f"Embedding batch of {len(batch)} failed after {attempt + 1} attempts: {e}")
+                        return
+                    self.counters["retries"] += 1
+                    delay = min(30, 0.5 * 2 ** attempt) * (0.5 + random.random())
+                    logger.warning(f"Embedding batch failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        finally:
+            self.in_flight.release()
+            for _ in batch:
+                self.queue.task_done()
+
+    def stats(self):
+        embedded = self.counters["embedded"]
+        return {
+            **self.counters,
+            "pending": self.queue.qsize(),
+            "in_flight": len(self.tasks),
+            "avg_batch_size": round(embedded / self.counters["batches"], 1) if self.counters["batches"] else 0,
+            "last_batch_seconds": round(self.last_batch_seconds, 3),
+        }
@@ -0,0 +1,149 @@
+"""Prune raw_events (and their embeddings and search postings) past each workspace's TTL.
+
+    python retention.py             # delete in bounded chunks
+    python retention.py --dry-run   # report rows/bytes that would be freed
+
+TTLs come from retention_policies (workspace -> days); clusters in no
+workspace, or in a workspace without a policy, use RETENTION_DEFAULT_DAYS.
+A cluster listed in several workspaces keeps the longest TTL. Deletes go
+RETENTION_CHUNK rows at a time, each chunk in its own short transaction,
+with RETENTION_PAUSE_SECONDS between chunks so TiDB never sees one large
+delete. raw_events is not partitioned (its AUTO_RANDOM primary key cannot
+carry a time partition key), so there are no partitions to drop.
+"""
+import os, sys, json, time, argparse, logging
+import pymysql
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("tim8.ingestion.retention")
+
+DEFAULT_DAYS = int(os.environ.get('RETENTION_DEFAULT_DAYS', 14))
+CHUNK = int(os.environ.get('RETENTION_CHUNK', 1000))
+PAUSE = float(os.environ.get('RETENTION_PAUSE_SECONDS', 0.2))
+
+conn_args = dict(
+    host=os.environ['TIDB_HOST'],
+    port=int(os.environ.get('TIDB_PORT', 4000)),
+    user=os.environ['TIDB_USER'],
+    password=os.environ['TIDB_PASSWORD'],
+    database=os.environ.get('TIDB_DB','incidentdb'),
+    cursorclass=pymysql.cursors.DictCursor,
+    ssl={'ssl':{}}
+)
+
+def load_targets(cur):
+    """Return [(label, clusters, days)]; the 'default' target excludes the listed clusters"""
+    cur.execute("SELECT workspace, raw_events_days FROM retention_policies")
+    policies = {r['workspace']: int(r['raw_events_days']) for r in cur.fetchall()}
+    cur.execute("SELECT name, clusters FROM workspaces")
+    cluster_days = {}
+    for ws in cur.fetchall():
+        days = policies.get(ws['name'], DEFAULT_DAYS)
+        for cluster in json.loads(ws['clusters'] or '[]'):
+            cluster_days[cluster] = max(days, cluster_days.get(cluster, 0))
+    by_days = {}
+    for cluster, days in cluster_days.items():
+        by_days.setdefault(days, []).append(cluster)
+    targets = [(f"{days}d", sorted(clusters), days) for days, clusters in sorted(by_days.items())]
+    targets.append(("default", sorted(cluster_days), DEFAULT_DAYS))
+    return targets
+
+def _where(clusters, default, col="cluster"):
+    """Filter for a target; the default target covers clusters in no workspace"""
+    if not clusters:
+        return "", []
+    placeholders = ",".join(["%s"] * len(clusters))
+    if default:
+        return f" AND ({col} IS NULL OR {col} NOT IN ({placeholders}))", list(clusters)
+    return f" AND {col} IN ({placeholders})", list(clusters)
+
+def estimate(cur, clusters, default, days):
+    where, params = _where(clusters, default)
+    cur.execute(f"""SELECT COUNT(*) AS n_rows,
+                           COALESCE(SUM(LENGTH(body_text) + COALESCE(LENGTH(body_json), 0)), 0) AS event_bytes
+                    FROM raw_events WHERE ts < NOW() - INTERVAL %s DAY{where}""", [days] + params)
+    ev = cur.fetchone()
+    where, params = _where(clusters, default, "r.cluster")
+    cur.execute(f"""SELECT COUNT(*) AS n_rows, COALESCE(SUM(LENGTH(e.embedding)), 0) AS embedding_bytes
+                    FROM events_embeddings e JOIN raw_events r ON r.id = e.event_id
+                    WHERE r.ts < NOW() - INTERVAL %s DAY{where}""", [days] + params)
+    emb = cur.fetchone()
+    return {"rows": int(ev['n_rows']), "embeddings": int(emb['n_rows']),
+            "bytes": int(ev['event_bytes']) + int(emb['embedding_bytes'])}
+
+def unindex(cur, ids, placeholders):
+    """Drop the chunk's search postings and take them out of the document frequencies"""
+    cur.execute(f"""UPDATE search_terms t JOIN (
+                      SELECT term, COUNT(*) AS n FROM search_postings WHERE event_id IN ({placeholders}) GROUP BY term
+                      UNION ALL
+                      SELECT '', COUNT(DISTINCT event_id) FROM search_postings WHERE event_id IN ({placeholders})
+                    ) d ON t.term = d.term
+                    SET t.df = GREATEST(t.df - d.n, 0)""", ids + ids)
+    cur.execute(f"DELETE FROM search_postings WHERE event_id IN ({placeholders})", ids)
+
+def prune(c, clusters, default, days, deadline):
+    where, params = _where(clusters, default)
+    done = {"rows": 0, "embeddings": 0, "bytes": 0, "chunks": 0}
+    t0 = time.monotonic()
+    while time.monotonic() < deadline:
+        with c.cursor() as cur:
+            cur.execute(f"""SELECT id, LENGTH(body_text) + COALESCE(LENGTH(body_json), 0) AS size
+                            FROM raw_events WHERE ts < NOW() - INTERVAL %s DAY{where}
+                            ORDER BY ts LIMIT %s""", [days] + params + [CHUNK])
+            batch = cur.fetchall()
+            if not batch:
+                break
+            ids = [r['id'] for r in batch]
+            placeholders = ",".join(["%s"] * len(ids))
+            cur.execute(f"SELECT COALESCE(SUM(LENGTH(embedding)), 0) AS b FROM events_embeddings WHERE event_id IN ({placeholders})", ids)
+            emb_bytes = int(cur.fetchone()['b'])
+            done["embeddings"] += cur.execute(f"DELETE FROM events_embeddings WHERE event_id IN ({placeholders})", ids)
+            unindex(cur, ids, placeholders)
+            done["rows"] += cur.execute(f"DELETE FROM raw_events WHERE id IN ({placeholders})", ids)
+        c.commit()
+        done["bytes"] += sum(int(r['size'] or 0) for r in batch) + emb_bytes
+        done["chunks"] += 1
+        if done["chunks"] % 10 == 0:
+            rate = done["rows"] / max(time.monotonic() - t0, 1e-6)
+            logger.info(f"  {done['rows']} rows, {done['bytes'] / 2**20:.1f} MiB freed ({rate:.0f} rows/s)")
+        if len(batch) < CHUNK:
+            break
+        time.sleep(PAUSE)
+    return done
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    ap.add_argument("--max-seconds", type=int, default=int(os.environ.get('RETENTION_MAX_SECONDS', 1800)),
+                    help="stop starting new chunks after this long; the next run continues")
+    args = ap.parse_args()
+
+    deadline = time.monotonic() + args.max_seconds
+    started = time.time()
+    summary = {"dry_run": args.dry_run, "targets": []}
+    with pymysql.connect(**conn_args) as c:
+        with c.cursor() as cur:
+            targets = load_targets(cur)
+        for label, clusters, days in targets:
+            default = label == "default"
+            if args.dry_run:
+                with c.cursor() as cur:
+                    result = estimate(cur, clusters, default, days)
+            else:
+                logger.info(f"Pruning {label} ({'unassigned clusters' if default else ', '.join(clusters)}) older than {days}d")
+                result = prune(c, clusters, default, days, deadline)
+            logger.info(f"{label}: {result}")
+            summary["targets"].append({"target": label, "days": days, "clusters": None if default else clusters, **result})
+
+        summary["rows"] = sum(t["rows"] for t in summary["targets"])
+        summary["bytes"] = sum(t["bytes"] for t in summary["targets"])
+        summary["seconds"] = round(time.time() - started, 1)
+        with c.cursor() as cur:
+            cur.execute("""INSERT INTO retention_runs(dry_run, rows_affected, bytes_affected, seconds, details)
+                           VALUES(%s,%s,%s,%s,%s)""",
+                        (args.dry_run, summary["rows"], summary["bytes"], summary["seconds"], json.dumps(summary)))
+        c.commit()
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import time, json, hashlib, logging
+from collections import OrderedDict
+from embed_cache import normalize
+
+logger = logging.getLogger("tim8.ingestion.sampler")
+
+ALWAYS_KEEP_LEVELS = {'error', 'err', 'fatal', 'critical', 'crit', 'panic', 'alert', 'emerg'}
+
+class _PodState:
+    __slots__ = ("tokens", "updated", "seen", "suppressed", "app", "rate", "burst")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+        self.seen: OrderedDict[bytes, int] = OrderedDict()  # template hash -> occurrences
+        self.suppressed: dict[bytes, list] = {}  # template hash -> [count, template]
+        self.app = None
+
+class PodSampler:
+    """Per-(cluster, namespace, pod) token buckets with sampling of repeated lines.
+
+    Within its budget a pod's lines pass untouched. Over budget, a line is still
+    kept when it is an error or the first occurrence of its template for that
+    pod, and one in `sample_every` repeats is kept as evidence; the rest are
+    counted and reported by `summaries()` as one "N suppressed" event per
+    template. Limits come from `limits_for(cluster) -> (rate, burst)` so they
+    can vary per workspace. Pod state is kept for at most `max_keys` pods,
+    evicting the least recently seen; an evicted pod's pending counts are
+    still reported by the next `summaries()`.
+
+    `admit(row, undo)` appends what it changed to `undo`; `rollback(undo)`
+    reverts it when the chunk is then refused (429/413/503), so the client's
+    retry is sampled as if seen for the first time.
+    """
+
+    def __init__(self, limits_for, max_keys=20000, max_templates_per_pod=256, sample_every=100):
+        self.limits_for = limits_for
+        self.max_keys = max_keys
+        self.max_templates = max_templates_per_pod
+        self.sample_every = sample_every
+        self.pods: OrderedDict[tuple, _PodState] = OrderedDict()
+        self.evicted: list[tuple] = []  # (key, state) of evicted pods with pending summaries
+        self.counters = {"admitted": 0, "over_budget_kept": 0, "suppressed": 0,
+                         "summaries": 0, "evicted_keys": 0}
+
+    def _state(self, key, now):
+        st = self.pods.get(key)
+        if st is None:
+            rate, burst = self.limits_for(key[0])
+            st = self.pods[key] = _PodState(rate, burst, now)
+            while len(self.pods) > self.max_keys:
+                old_key, old = self.pods.popitem(last=False)
+                self.counters["evicted_keys"] += 1
+                if old.suppressed:
+                    self.evicted.append((old_key, old))
+        else:
+            self.pods.move_to_end(key)
+        return st
+
+    def admit(self, row: dict, undo: list = None) -> bool:
+        """True if the row should be written"""
+        now = time.monotonic()
+        key = (row['cluster'], row['namespace'], row['pod'])
+        st = self._state(key, now)
+        st.app = row['app']
+        st.tokens = min(st.burst, st.tokens + (now - st.updated) * st.rate)
+        st.updated = now
+
+        template = normalize(row['body_text'])
+        h = hashlib.blake2b(template.encode(), digest_size=8).digest()
+        occurrences = st.seen.pop(h, 0) + 1
+        st.seen[h] = occurrences
+        dropped = st.seen.popitem(last=False) if len(st.seen) > self.max_templates else None
+
+        if st.tokens >= 1:
+            st.tokens -= 1
+            outcome = "admitted"
+        elif (occurrences == 1 or (row.get('level') or '').lower() in ALWAYS_KEEP_LEVELS
+                or occurrences % self.sample_every == 0):
+            outcome = "over_budget_kept"
+        else:
+            entry = st.suppressed.setdefault(h, [0, template])
+            entry[0] += 1
+            outcome = "suppressed"
+        self.counters[outcome] += 1
+        if undo is not None:
+            undo.append((st, h, dropped, outcome))
+        return outcome != "suppressed"
+
+    def rollback(self, undo: list):
+        """Revert the admits recorded in `undo`, newest first"""
+        for st, h, dropped, outcome in reversed(undo):
+            if outcome == "admitted":
+                st.tokens = min(st.burst, st.tokens + 1)
+            elif outcome == "suppressed":
+                entry = st.suppressed.get(h)
+                if entry:
+                    entry[0] -= 1
+                    if entry[0] <= 0:
+                        del st.suppressed[h]
+            n = st.seen.get(h, 0) - 1
+            if n > 0:
+                st.seen[h] = n
+            else:
+                st.seen.pop(h, None)
+            if dropped and dropped[0] not in st.seen:
+                st.seen[dropped[0]] = dropped[1]
+                st.seen.move_to_end(dropped[0], last=False)
+            self.counters[outcome] -= 1
+        undo.clear()
+
+    def summaries(self, window_seconds) -> list[dict]:
+        """Collect pending "N suppressed" events as raw_events rows"""
+        rows = []
+        evicted, self.evicted = self.evicted, []
+        for (cluster, namespace, pod), st in [*evicted, *self.pods.items()]:
+            for count, template in st.suppressed.values():
+                body = {"sampler": "suppressed", "count": count, "template": template,
+                        "window_seconds": window_seconds, "pod": pod}
+                rows.append(dict(
+                    cluster=cluster, namespace=namespace, app=st.app or 'unknown', pod=pod,
+                    type='log', level='info', body_json=json.dumps(body),
+                    body_text=f"{count} suppressed: {template}", template_id=None,
+                ))
+            st.suppressed.clear()
+        self.counters["summaries"] += len(rows)
+        return rows
+
+    def refresh_limits(self):
+        """Re-apply limits_for() to tracked pods after the limits changed"""
+        for key, st in self.pods.items():
+            st.rate, st.burst = self.limits_for(key[0])
+
+    def stats(self):
+        return {**self.counters, "tracked_pods": len(self.pods),
+                "pending_summaries": sum(len(st.suppressed) for st in self.pods.values())
+                + sum(len(st.suppressed) for _, st in self.evicted)}
@@ -0,0 +1,48 @@
+"""Tokenizer and posting rows for the raw_events inverted index (search_postings).
+
+Ingestion writes the postings; the gateway tokenizes queries with a verbatim
+copy of this module, so both sides must agree on `tokenize`.
+"""
+import re
+from collections import Counter
+
+TERM_MAX = 48
+_TOKEN = re.compile(r"[a-z0-9_]+(?:[.\-/:][a-z0-9_]+)*")
+_SPLIT = re.compile(r"[.\-/:]")
+
+def words(text: str) -> list[str]:
+    """Lower-cased words as written, without splitting dotted/dashed ones"""
+    return _TOKEN.findall((text or "").lower())
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased terms in order; dotted/dashed words also yield their parts"""
+    out = []
+    for m in _TOKEN.finditer((text or "").lower()):
+        tok = m.group(0)
+        parts = _SPLIT.split(tok)
+        if len(parts) > 1 and len(tok) <= TERM_MAX:
+            out.append(tok)
+        out.extend(p for p in parts if p)
+    return [t[:TERM_MAX] for t in out]
+
+def indexable(term: str) -> bool:
+    # bare numbers and long hex-ish ids would add one posting list per value
+    return len(term) >= 2 and not term.isdigit() and not (len(term) >= 16 and all(c in "0123456789abcdef" for c in term))
+
+def term_counts(text: str, max_terms: int = 64) -> Counter:
+    """Term frequencies of the indexable terms of a line, capped at `max_terms` distinct terms"""
+    counts = Counter(t for t in tokenize(text) if indexable(t))
+    if len(counts) > max_terms:
+        counts = Counter(dict(counts.most_common(max_terms)))
+    return counts
+
+def postings(docs, max_terms: int = 64):
+    """(term, event_id, tf) rows and per-term document frequencies for [(event_id, text)];
+    the '' entry of the frequencies counts the documents"""
+    rows, df = [], {'': 0}
+    for eid, text in docs:
+        for term, tf in term_counts(text, max_terms).items():
+            rows.append((term, eid, min(tf, 65535)))
+            df[term] = df.get(term, 0) + 1
+        df[''] += 1
+    return rows, df
@@ -0,0 +1,131 @@
+import asyncio, time, random, logging
+from collections import deque
+
+logger = logging.getLogger("tim8.ingestion.writer")
+
+class WriteBehindQueue:
+    """Bounded in-memory queue of mapped rows drained by background writers.
+
+    `offer()` accepts rows without touching the database and refuses them once
+    the queue depth would pass `high_water`, so the handler can answer 429
+    instead of stalling. `prepare(rows)` runs once on the rows offer() accepts,
+    before they are queued, for work that must not repeat when a write is
+    retried. Each writer takes up to `batch_size` rows (waiting at
+    most `max_wait` seconds for a batch to fill) and hands them to the blocking
+    `write_fn(rows) -> ids` in a worker thread; `on_written(ids, rows)` runs on
+    the event loop after every successful flush.
+    """
+
+    def __init__(self, write_fn, on_written=None, capacity=20000, high_water=0.8,
+                 writers=2, batch_size=500, max_wait=0.2, max_retries=5, prepare=None):
+        self.write_fn = write_fn
+        self.on_written = on_written
+        self.prepare = prepare
+        self.capacity = capacity
+        self.high_water = int(capacity * high_water)
+        self.n_writers = writers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=capacity)
+        self.writers: list[asyncio.Task] = []
+        self.closing = False
+        self.counters = {"accepted": 0, "written": 0, "flushes": 0, "rejected": 0,
+                         "retries": 0, "dropped": 0}
+        self.flush_seconds = deque(maxlen=512)
+
+    def offer(self, rows: list[dict]) -> bool:
+        """Queue rows for writing; False when over the high-water mark or shutting down"""
+        if self.closing or self.queue.qsize() + len(rows) > self.high_water:
+            self.counters["rejected"] += len(rows)
+            return False
+        if self.prepare:
+            self.prepare(rows)
+        for row in rows:
+            self.queue.put_nowait(row)
+        self.counters["accepted"] += len(rows)
+        return True
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait, from the recent drain rate"""
+        if not self.flush_seconds:
+            return 1
+        per_flush = sum(self.flush_seconds) / len(self.flush_seconds)
+        rows_per_sec = self.n_writers * self.batch_size / max(per_flush, 1e-3)
+        excess = self.queue.qsize() - self.high_water // 2
+        return int(min(30, max(1, excess / rows_per_sec)))
+
+    def start(self):
+        if not self.writers:
+            self.writers = [asyncio.create_task(self._run(i)) for i in range(self.n_writers)]
+            logger.info(f"Write-behind queue started ({self.n_writers} writers, capacity {self.capacity})")
+
+    async def stop(self):
+        """Refuse new rows and drain what is already queued"""
+        self.closing = True
+        if not self.writers:
+            return
+        logger.info(f"Draining write-behind queue ({self.queue.qsize()} rows)")
+        await self.queue.join()
+        for w in self.writers:
+            w.cancel()
+        await asyncio.gather(*self.writers, return_exceptions=True)
+        self.writers = []
+        logger.info("Write-behind queue drained")
+
+    async def _run(self, n):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch):
+        for attempt in range(self.max_retries + 1):
+            t0 = time.perf_counter()
+            try:
+                ids = await asyncio.to_thread(self.write_fn, batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.counters["dropped"] += len(batch)
+                    logger.error(f"Dropping {len(batch)} rows after {attempt + 1} failed writes: {e}")
+                    return
+                self.counters["retries"] += 1
+                delay = min(10, 0.2 * 2 ** attempt) * (0.5 + random.random())
+                logger.warning(f"Batch write failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            self.flush_seconds.append(time.perf_counter() - t0)
+            self.counters["flushes"] += 1
+            self.counters["written"] += len(batch)
+            if self.on_written:
+                self.on_written(ids, batch)
+            return
+
+    def stats(self):
+        lat = sorted(self.flush_seconds)
+        return {
+            **self.counters,
+            "depth": self.queue.qsize(),
+            "high_water": self.high_water,
+            "capacity": self.capacity,
+            "closing": self.closing,
+            "flush_seconds_avg": round(sum(lat) / len(lat), 4) if lat else None,
+            "flush_seconds_p99": round(lat[int(0.99 * (len(lat) - 1))], 4) if lat else None,
+        }